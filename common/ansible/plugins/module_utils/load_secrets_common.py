@@ -17,10 +17,19 @@
 Module that implements some common functions
 """
 
+import base64
 import configparser
 from collections.abc import MutableMapping
 
 
+class VaultLoadError(Exception):
+    """Raised instead of failing the module while running inside a worker thread"""
+
+    def __init__(self, msg, details=None):
+        super().__init__(msg)
+        self.details = details or {}
+
+
 def find_dupes(array):
     """
     Returns duplicate items in a list
@@ -122,3 +131,90 @@ def stringify_dict(input_dict):
         output_dict[str(key)] = str(value)
 
     return output_dict
+
+
+def bulk_command(marker, commands):
+    """
+    Chains several shell commands into a single one so that they can be run
+    with one 'oc exec'. The output of each command is preceded by a marker line
+    and followed by a status line with its exit code, so that
+    split_bulk_output() can tell them apart again
+
+    Parameters:
+        marker(str): A string that does not show up in the output of the commands
+        commands(list): The shell commands to run
+
+    Returns:
+
+        str: The combined shell command
+    """
+    return "; ".join(
+        f"printf '\\n%s %d\\n' '{marker}' {i}; {cmd}; "
+        f"printf '\\n%s %d %d\\n' '{marker}' {i} $?"
+        for i, cmd in enumerate(commands)
+    )
+
+
+def split_bulk_output(marker, output):
+    """
+    Splits the output of a command built with bulk_command()
+
+    Parameters:
+        marker(str): The marker that was passed to bulk_command()
+        output(str): The stdout of the combined command
+
+    Returns:
+
+        obj: A dict mapping the index of every command to a (rc, output) tuple.
+             rc is None when the command did not get to report its exit code
+    """
+    outputs = {}
+    for part in output.split(f"\n{marker} ")[1:]:
+        header, _, rest = part.partition("\n")
+        index, _, rc = header.partition(" ")
+        if not rc:
+            outputs[int(index)] = (None, rest)
+        elif int(index) in outputs:
+            outputs[int(index)] = (int(rc), outputs[int(index)][1])
+    return outputs
+
+
+def vault_not_found(rc, output):
+    """
+    Tells whether a vault read failed only because the path it read does not
+    exist. Any other failure, like a sealed vault or a denied token, is a real
+    error
+
+    Parameters:
+        rc(int): The exit code of the command, None when it is unknown
+        output(str): The output of the command, including its stderr
+
+    Returns:
+
+        bool: True when the vault reported that there is no value at the path
+    """
+    return rc is not None and rc != 0 and "No value found" in output
+
+
+def file_chunks(file, b64=False, chunk_size=48 * 1024):
+    """
+    Reads an open binary file in chunks, so that large files can be streamed
+    without holding them in memory
+
+    Parameters:
+        file(file): The file object to read from
+        b64(bool): Base64 encode the content on the fly
+        chunk_size(int): Number of bytes read at once. It is rounded down to a
+                         multiple of 3 so that the encoded chunks can simply be
+                         concatenated
+
+    Returns:
+
+        generator: The (encoded) content, chunk by chunk
+    """
+    chunk_size -= chunk_size % 3
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield base64.b64encode(chunk) if b64 else chunk
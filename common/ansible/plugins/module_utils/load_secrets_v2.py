@@ -20,13 +20,21 @@ Module that implements V2 of the values-secret.yaml spec
 import base64
 import getpass
 import os
+import shlex
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from ansible.module_utils.load_secrets_common import (
+    VaultLoadError,
+    bulk_command,
     find_dupes,
     get_ini_value,
     get_version,
+    split_bulk_output,
+    vault_not_found,
 )
+from ansible.module_utils.vault_api import VaultApiError
 
 default_vp_vault_policies = {
     "validatedPatternDefaultPolicy": (
@@ -38,14 +46,42 @@ default_vp_vault_policies = {
     )
 }
 
+# Separates the per-policy outputs of the bulk read in _get_existing_vault_policies()
+POLICY_MARKER = "@@vault-policy"
+
 
 class LoadSecretsV2:
 
-    def __init__(self, module, syaml, namespace, pod):
+    def __init__(
+        self,
+        module,
+        syaml,
+        namespace,
+        pod,
+        skip_unchanged_policies=False,
+        api=None,
+        workers=1,
+    ):
         self.module = module
         self.namespace = namespace
         self.pod = pod
         self.syaml = syaml
+        self.skip_unchanged_policies = skip_unchanged_policies
+        # VaultApiClient of the api transport, None when commands go through oc exec
+        self.api = api
+        self.workers = max(1, workers)
+        # (secret name, field name) -> value resolved before the workers start
+        self._field_values = {}
+        self._local = threading.local()
+
+    def _fail(self, msg):
+        """
+        Fails the module, unless we are running in a worker thread. There the
+        error is raised instead so that it can be collected with the others
+        """
+        if getattr(self._local, "in_worker", False):
+            raise VaultLoadError(msg)
+        self.module.fail_json(msg)
 
     def _run_command(self, command, attempts=1, sleep=3, checkrc=True):
         """
@@ -60,18 +96,41 @@ class LoadSecretsV2:
         Returns:
             ret(subprocess.CompletedProcess): The return value from run()
         """
+        # run_command() must not fail the module from within a worker thread
+        in_worker = getattr(self._local, "in_worker", False)
         for attempt in range(attempts):
             ret = self.module.run_command(
                 command,
-                check_rc=checkrc,
+                check_rc=checkrc and not in_worker,
                 use_unsafe_shell=True,
                 environ_update=os.environ.copy(),
             )
-            if ret[0] == 0:
-                return ret
-            if attempt >= attempts - 1:
-                return ret
+            if ret[0] == 0 or attempt >= attempts - 1:
+                break
             time.sleep(sleep)
+        if in_worker and checkrc and ret[0] != 0:
+            self._fail(f"Command failed: {command}: {ret[2]}")
+        return ret
+
+    def _run_api_call(self, func, *args, attempts=1, sleep=3):
+        """
+        Calls a VaultApiClient method, retrying it on errors
+
+        Parameters:
+            func(callable): The bound VaultApiClient method
+            attempts(int): Number of times to retry in case of Error (defaults to 1)
+            sleep(int): Number of seconds to wait in between retry attempts (defaults to 3s)
+
+        Returns:
+            ret: Whatever the method returned
+        """
+        for attempt in range(attempts):
+            try:
+                return func(*args)
+            except VaultApiError as e:
+                if attempt >= attempts - 1:
+                    self._fail(f"Vault API call failed: {e}")
+                time.sleep(sleep)
 
     def _get_backingstore(self):
         """
@@ -272,8 +331,60 @@ class LoadSecretsV2:
             return (False, f"You cannot have duplicate secret names: {dupes}")
         return (True, "")
 
+    def _get_existing_vault_policies(self, names):
+        """
+        Reads the given password policies from the vault with a single oc exec
+
+        Returns:
+            policies(dict): name -> HCL stored in the vault, None when it does not exist
+        """
+        if self.api is not None:
+            return {
+                name: self._run_api_call(self.api.read_password_policy, name)
+                for name in names
+            }
+        cmd = bulk_command(
+            POLICY_MARKER,
+            [
+                f"vault read -field=policy sys/policies/password/{name} 2>&1"
+                for name in names
+            ],
+        )
+        (ret, out, err) = self._run_command(
+            f"oc exec -n {self.namespace} {self.pod} -i -- sh -c {shlex.quote(cmd)}",
+            attempts=1,
+            checkrc=False,
+        )
+        if ret != 0:
+            self.module.fail_json(f"Could not read the vault password policies: {err}")
+        outputs = split_bulk_output(POLICY_MARKER, out)
+        policies = {}
+        for i, name in enumerate(names):
+            (rc, output) = outputs.get(i, (None, ""))
+            if vault_not_found(rc, output):
+                policies[name] = None
+            elif rc == 0:
+                policies[name] = output
+            else:
+                self.module.fail_json(
+                    f"Could not read vault password policy {name}: {output}"
+                )
+        return policies
+
     def inject_vault_policies(self):
-        for name, policy in self._get_vault_policies().items():
+        policies = self._get_vault_policies()
+        existing = {}
+        if self.skip_unchanged_policies and policies:
+            existing = self._get_existing_vault_policies(list(policies))
+        for name, policy in policies.items():
+            current = existing.get(name)
+            if current is not None and current.strip() == policy.strip():
+                continue
+            if self.api is not None:
+                self._run_api_call(
+                    self.api.write_password_policy, name, policy, attempts=3
+                )
+                continue
             cmd = (
                 f"echo '{policy}' | oc exec -n {self.namespace} {self.pod} -i -- sh -c "
                 f"'cat - > /tmp/{name}.hcl';"
@@ -347,7 +458,65 @@ class LoadSecretsV2:
 
         self.module.fail_json("File with wrong onMissingValue")
 
+    def _is_generated(self, f):
+        generate = self._get_field_on_missing_value(f) == "generate"
+        return generate and self._get_field_kind(f) in ["value", ""]
+
+    def _field_value(self, secret_name, f):
+        """
+        Returns the value of a field that is not generated, base64 encoded when
+        asked to, or the path of its file for path fields. This is where the user
+        gets prompted, unless _resolve_field_values() did it already
+        """
+        key = (secret_name, f["name"])
+        if key in self._field_values:
+            return self._field_values[key]
+        kind = self._get_field_kind(f)
+        if kind == "path":
+            return self._get_file_path(secret_name, f)
+        if kind == "ini_file":
+            secret = get_ini_value(
+                os.path.expanduser(f.get("ini_file")),
+                f.get("ini_section", "default"),
+                f.get("ini_key"),
+            )
+        else:
+            secret = self._get_secret_value(secret_name, f)
+        if self._get_field_base64(f):
+            secret = base64.b64encode(secret.encode()).decode("utf-8")
+        return secret
+
+    def _resolve_field_values(self):
+        """
+        Resolves the value of every field that is not generated up front, so that
+        prompts never happen inside a worker thread
+        """
+        for s in self._get_secrets():
+            for f in s.get("fields", []):
+                if not self._is_generated(f):
+                    value = self._field_value(s["name"], f)
+                    self._field_values[(s["name"], f["name"])] = value
+
+    def _read_path_field(self, path, b64):
+        path = os.path.expanduser(path)
+        try:
+            with open(path, "rb") as file:
+                content = file.read()
+        except OSError as e:
+            self._fail(f"Could not read file {path}: {e.strerror}")
+        if b64:
+            return base64.b64encode(content).decode("utf-8")
+        try:
+            return content.decode("utf-8")
+        except UnicodeDecodeError:
+            self._fail(f"File {path} is not valid UTF-8, it needs to be base64 encoded")
+
     def _vault_secret_attr_exists(self, mount, prefix, secret_name, attribute):
+        if self.api is not None:
+            fields = self._run_api_call(
+                self.api.kv_read, mount, f"{prefix}/{secret_name}"
+            )
+            return fields is not None and attribute in fields
         cmd = (
             f"oc exec -n {self.namespace} {self.pod} -i -- sh -c "
             f'"vault kv get -mount={mount} -field={attribute} {prefix}/{secret_name}"'
@@ -366,6 +535,33 @@ class LoadSecretsV2:
         # If we're generating the password then we just push the secret in the vault directly
         verb = "put" if first else "patch"
         b64 = self._get_field_base64(f)
+        if self.api is not None:
+            generate = self._is_generated(f)
+            if not generate:
+                secret = self._field_value(secret_name, f)
+                if kind == "path":
+                    secret = self._read_path_field(secret, b64)
+            for prefix in prefixes:
+                if generate:
+                    if not override and self._vault_secret_attr_exists(
+                        mount, prefix, secret_name, f["name"]
+                    ):
+                        continue
+                    secret = self._run_api_call(
+                        self.api.generate_password, f.get("vaultPolicy"), attempts=3
+                    )
+                    if b64:
+                        secret = base64.b64encode(secret.encode()).decode("utf-8")
+                write = self.api.kv_write if first else self.api.kv_patch
+                self._run_api_call(
+                    write,
+                    mount,
+                    f"{prefix}/{secret_name}",
+                    {f["name"]: secret},
+                    attempts=3,
+                )
+            return
+
         if kind in ["value", ""]:
             if on_missing_value == "generate":
                 if kind == "path":
@@ -392,9 +588,7 @@ class LoadSecretsV2:
 
             # If we're not generating the secret inside the vault directly we either read it from the file ("error")
             # or we are prompting the user for it
-            secret = self._get_secret_value(secret_name, f)
-            if b64:
-                secret = base64.b64encode(secret.encode()).decode("utf-8")
+            secret = self._field_value(secret_name, f)
             for prefix in prefixes:
                 cmd = (
                     f"oc exec -n {self.namespace} {self.pod} -i -- sh -c "
@@ -405,7 +599,7 @@ class LoadSecretsV2:
         elif kind == "path":  # path. we upload files
             # If we're generating the password then we just push the secret in the vault directly
             verb = "put" if first else "patch"
-            path = self._get_file_path(secret_name, f)
+            path = self._field_value(secret_name, f)
             for prefix in prefixes:
                 if b64:
                     b64_cmd = "| base64 --wrap=0 "
@@ -421,12 +615,7 @@ class LoadSecretsV2:
                 self._run_command(cmd, attempts=3)
         elif kind == "ini_file":  # ini_file. we parse an ini_file
             verb = "put" if first else "patch"
-            ini_file = os.path.expanduser(f.get("ini_file"))
-            ini_section = f.get("ini_section", "default")
-            ini_key = f.get("ini_key")
-            secret = get_ini_value(ini_file, ini_section, ini_key)
-            if b64:
-                secret = base64.b64encode(secret.encode()).decode("utf-8")
+            secret = self._field_value(secret_name, f)
             for prefix in prefixes:
                 cmd = (
                     f"oc exec -n {self.namespace} {self.pod} -i -- sh -c "
@@ -437,21 +626,71 @@ class LoadSecretsV2:
     # This assumes that self.sanitize_values() has already been called
     # so we do a lot less validation as it has already happened
     def inject_secrets(self):
-        # This must come first as some passwords might depend on vault policies to exist.
-        # It is a noop when no policies are defined
-        self.inject_vault_policies()
-        secrets = self._get_secrets()
+        if self.api is not None and not self.api.ping():
+            self.module.warn(
+                f"Vault API at {self.api.scheme}://{self.api.host} is not reachable, "
+                "falling back to oc exec"
+            )
+            self.api = None
 
-        total_secrets = 0  # Counter for all the secrets uploaded
-        for s in secrets:
-            counter = 0  # This counter is to use kv put on first secret and kv patch on latter
-            sname = s.get("name")
-            fields = s.get("fields", [])
-            mount = s.get("vaultMount", "secret")
-            vault_prefixes = s.get("vaultPrefixes", ["hub"])
-            for i in fields:
-                self._inject_field(sname, i, mount, vault_prefixes, counter == 0)
-                counter += 1
-                total_secrets += 1
+        try:
+            # This must come first as some passwords might depend on vault policies to exist.
+            # It is a noop when no policies are defined
+            self.inject_vault_policies()
+            secrets = self._get_secrets()
+            if self.workers > 1:
+                self._inject_secrets_concurrently(secrets)
+            else:
+                for s in secrets:
+                    self._inject_secret(s, s.get("vaultPrefixes", ["hub"]))
+        finally:
+            if self.api is not None:
+                self.api.close()
+
+        # Counter for all the secrets uploaded
+        return sum(len(s.get("fields", [])) for s in secrets)
+
+    def _inject_secret(self, s, vault_prefixes):
+        sname = s.get("name")
+        mount = s.get("vaultMount", "secret")
+        # The first field uses kv put and the latter ones kv patch
+        for counter, i in enumerate(s.get("fields", [])):
+            self._inject_field(sname, i, mount, vault_prefixes, counter == 0)
+
+    def _run_unit(self, s, prefix):
+        self._local.in_worker = True
+        try:
+            self._inject_secret(s, [prefix])
+        except VaultLoadError as e:
+            return str(e)
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+        return None
 
-        return total_secrets
+    def _inject_secrets_concurrently(self, secrets):
+        """
+        Injects every (secret, vault prefix) pair on a pool of self.workers
+        threads. Each pair is a separate secret path, and the fields within a
+        pair are still written in order by a single worker. Failures are
+        collected and reported together once all the pairs are done
+        """
+        self._resolve_field_values()
+        units = [
+            (f"{prefix}/{s['name']}", s, prefix)
+            for s in secrets
+            for prefix in s.get("vaultPrefixes", ["hub"])
+        ]
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                (name, pool.submit(self._run_unit, s, prefix))
+                for name, s, prefix in units
+            ]
+            for name, future in futures:
+                error = future.result()
+                if error is not None:
+                    errors.append({"unit": name, "msg": error})
+        if errors:
+            self.module.fail_json(
+                msg=f"{len(errors)} vault load unit(s) failed", errors=errors
+            )
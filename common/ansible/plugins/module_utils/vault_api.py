@@ -0,0 +1,210 @@
+# Copyright 2022 Red Hat, Inc.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Module that implements a minimal client for the HashiCorp Vault HTTP API
+
+Only the calls needed to load secrets are implemented: KV version 2 reads and
+writes and password policies. Connections are kept alive and pooled so that
+loading hundreds of fields does not pay a TLS handshake for each of them.
+"""
+
+import http.client
+import json
+import queue
+import ssl
+from urllib.parse import quote, urlsplit
+
+
+class VaultApiError(Exception):
+    """Raised when vault cannot be reached or answers with an error"""
+
+    def __init__(self, msg, status=None):
+        super().__init__(msg)
+        self.status = status
+
+
+class VaultApiClient:
+
+    def __init__(self, addr, token, validate_certs=True, timeout=30, pool_size=4):
+        """
+        Parameters:
+            addr(str): The vault address, e.g. https://vault.example.com:8200
+            token(str): The token sent with every request
+            validate_certs(bool): Verify the TLS certificate of the vault
+            timeout(int): Socket timeout in seconds
+            pool_size(int): Maximum number of idle connections kept around
+        """
+        url = urlsplit(addr)
+        if url.scheme not in ("http", "https") or not url.hostname:
+            raise VaultApiError(f"Invalid vault address: {addr}")
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.ssl_context = None
+        if self.scheme == "https":
+            self.ssl_context = ssl.create_default_context()
+            if not validate_certs:
+                self.ssl_context.check_hostname = False
+                self.ssl_context.verify_mode = ssl.CERT_NONE
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=self.ssl_context
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        """Closes all the pooled connections"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def request(self, method, path, body=None, content_type="application/json"):
+        """
+        Sends a request to the vault API
+
+        Parameters:
+            method(str): HTTP method
+            path(str): API path below /v1/
+            body(dict): Optional payload, sent as JSON
+
+        Returns:
+            ret(tuple): (status, decoded JSON body or None)
+        """
+        headers = {"X-Vault-Token": self.token}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = content_type
+        url = f"{self.base_path}/v1/{path}"
+        while True:
+            conn, reused = self._acquire()
+            sent = False
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                # An idle keep-alive connection may have been closed by the
+                # server in the meantime, so that one is retried on a fresh one.
+                # Anything else (a timeout, a reset after the request went out)
+                # may have reached vault and is not resent
+                if reused and self._never_sent(e, sent):
+                    continue
+                raise VaultApiError(
+                    f"Could not reach vault at {self.scheme}://{self.host}: {e}"
+                ) from e
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            break
+        try:
+            decoded = json.loads(data) if data else None
+        except ValueError:
+            decoded = None
+        return response.status, decoded
+
+    @staticmethod
+    def _never_sent(error, sent):
+        """
+        True when the error proves that a pooled connection was closed by the
+        server before it took the request: it hung up without answering, or
+        the connection broke while the request was being written
+        """
+        if isinstance(error, http.client.RemoteDisconnected):
+            return True
+        return not sent and isinstance(error, (BrokenPipeError, ConnectionResetError))
+
+    def _call(self, method, path, body=None, ok=(200, 204), **kwargs):
+        status, data = self.request(method, path, body, **kwargs)
+        if status not in ok:
+            errors = data.get("errors") if isinstance(data, dict) else None
+            raise VaultApiError(
+                f"{method} /v1/{path} failed with {status}: {errors}", status=status
+            )
+        return status, data
+
+    def ping(self):
+        """Returns True when the vault API answers and is unsealed"""
+        try:
+            status, _ = self.request("GET", "sys/health?standbyok=true")
+        except VaultApiError:
+            return False
+        return status in (200, 429, 472, 473)
+
+    @staticmethod
+    def _kv_path(mount, kind, path):
+        return f"{quote(mount)}/{kind}/{quote(path)}"
+
+    def kv_read(self, mount, path):
+        """Returns the fields of a KV v2 secret, or None when it does not exist"""
+        status, data = self._call(
+            "GET", self._kv_path(mount, "data", path), ok=(200, 404)
+        )
+        if status == 404:
+            return None
+        return (data.get("data") or {}).get("data") or {}
+
+    def kv_write(self, mount, path, fields):
+        """Replaces a KV v2 secret with the given fields, like 'vault kv put'"""
+        self._call("POST", self._kv_path(mount, "data", path), {"data": fields})
+
+    def kv_patch(self, mount, path, fields):
+        """Merges the given fields into an existing KV v2 secret, like 'vault kv patch'"""
+        self._call(
+            "PATCH",
+            self._kv_path(mount, "data", path),
+            {"data": fields},
+            content_type="application/merge-patch+json",
+        )
+
+    def generate_password(self, policy):
+        _, data = self._call("GET", f"sys/policies/password/{quote(policy)}/generate")
+        return data["data"]["password"]
+
+    def read_password_policy(self, name):
+        """Returns the HCL of a password policy, or None when it does not exist"""
+        status, data = self._call(
+            "GET", f"sys/policies/password/{quote(name)}", ok=(200, 404)
+        )
+        if status == 404:
+            return None
+        return data["data"]["policy"]
+
+    def write_password_policy(self, name, policy):
+        self._call("PUT", f"sys/policies/password/{quote(name)}", {"policy": policy})
@@ -0,0 +1,315 @@
+# Copyright 2022 Red Hat, Inc.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Module that implements a long-lived shell session inside the vault pod
+
+Instead of paying an 'oc exec' round trip for every vault command, a single
+'oc exec -i -- sh' is kept open and commands are streamed to its stdin. The
+end of each command's output is found via a per-session marker which also
+carries the exit code of the command.
+
+Content for a command's stdin can be passed as an iterable of chunks, which is
+encoded and written as it is consumed, so large files never need to be held in
+memory as a whole.
+"""
+
+import base64
+import os
+import select
+import subprocess
+import threading
+import time
+import uuid
+
+# base64.encodebytes() emits one line per 57 input bytes, so encoding chunks of
+# a multiple of it gives the same lines as encoding the whole content at once
+ENCODE_CHUNK = 57 * 1024
+
+
+class VaultExecSessionError(Exception):
+    """Raised when the session shell dies or stops answering"""
+
+    pass
+
+
+class VaultExecSession:
+
+    def __init__(self, argv, timeout=120):
+        """
+        Parameters:
+            argv(list): The command that starts the remote shell
+            timeout(int): Number of seconds to wait for a single command to finish
+        """
+        self.argv = argv
+        self.timeout = timeout
+        self.marker = f"__vault_session_{uuid.uuid4().hex}__"
+        self._proc = None
+        self._stdout = bytearray()
+        self._stderr = bytearray()
+        self._stderr_eof = False
+        self._stderr_cond = threading.Condition()
+        self._stderr_thread = None
+
+    @classmethod
+    def for_pod(cls, namespace, pod, **kwargs):
+        """Returns a session running a shell inside the given pod"""
+        return cls(["oc", "exec", "-n", namespace, pod, "-i", "--", "sh"], **kwargs)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def open(self):
+        """Starts the remote shell if it is not running already"""
+        if self.alive:
+            return
+        self._stdout = bytearray()
+        self._stderr = bytearray()
+        self._stderr_eof = False
+        try:
+            self._proc = subprocess.Popen(
+                self.argv,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=os.environ.copy(),
+            )
+        except OSError as e:
+            raise VaultExecSessionError(
+                f"Could not start {' '.join(self.argv)}: {e}"
+            ) from e
+        # stderr is drained in the background so that a chatty command can
+        # never fill the pipe and block the shell while we wait on stdout
+        self._stderr_thread = threading.Thread(
+            target=self._drain_stderr, args=(self._proc.stderr,), daemon=True
+        )
+        self._stderr_thread.start()
+
+    def close(self):
+        """Asks the remote shell to exit and reaps it"""
+        proc = self._proc
+        if proc is None:
+            return
+        self._proc = None
+        try:
+            proc.stdin.write(b"exit\n")
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        if self._stderr_thread is not None:
+            self._stderr_thread.join(timeout=1)
+
+    def _drain_stderr(self, stream):
+        while True:
+            chunk = os.read(stream.fileno(), 65536)
+            with self._stderr_cond:
+                if not chunk:
+                    self._stderr_eof = True
+                    self._stderr_cond.notify_all()
+                    return
+                self._stderr.extend(chunk)
+                self._stderr_cond.notify_all()
+
+    def _script(self, command, data):
+        """
+        Wraps a command in a subshell so that it can neither read from the
+        session's stdin nor exit the session, and appends the end markers.
+        When data is passed it is fed to the command's stdin via a base64
+        encoded heredoc, so binary content is safe.
+
+        Returns:
+            ret(generator): The script, in pieces that are ready to be written
+        """
+        if data is None:
+            yield f"( {command} ) </dev/null\n".encode()
+        else:
+            yield f"base64 -d <<'{self.marker}' | ( {command} )\n".encode()
+            yield from self._encode(data)
+            yield f"{self.marker}\n".encode()
+        yield (
+            f"__vault_rc=$?; "
+            f"printf '\\n%s\\n' '{self.marker}' >&2; "
+            f"printf '\\n%s %d\\n' '{self.marker}' \"$__vault_rc\"\n"
+        ).encode()
+
+    @staticmethod
+    def _encode(data):
+        """Base64 encodes bytes or an iterable of bytes chunks into heredoc lines"""
+        if isinstance(data, bytes):
+            data = (data,)
+        pending = b""
+        for chunk in data:
+            pending += chunk
+            cut = len(pending) - len(pending) % ENCODE_CHUNK
+            if cut:
+                yield base64.encodebytes(pending[:cut])
+                pending = pending[cut:]
+        if pending:
+            yield base64.encodebytes(pending)
+
+    def _read_stdout(self, deadline):
+        end = f"\n{self.marker} ".encode()
+        fd = self._proc.stdout.fileno()
+        while True:
+            idx = self._stdout.find(end)
+            if idx >= 0:
+                eol = self._stdout.find(b"\n", idx + len(end))
+                if eol >= 0:
+                    start = idx + len(end)
+                    out = bytes(self._stdout[:idx])
+                    rc = int(self._stdout[start:eol])
+                    del self._stdout[: eol + 1]
+                    return rc, out
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise VaultExecSessionError(
+                    f"Timed out after {self.timeout}s waiting for the vault session"
+                )
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise VaultExecSessionError(
+                    f"Vault session exited unexpectedly: {self._stderr.decode(errors='replace')}"
+                )
+            self._stdout.extend(chunk)
+
+    def _read_stderr(self, deadline):
+        end = f"\n{self.marker}\n".encode()
+        with self._stderr_cond:
+            while True:
+                idx = self._stderr.find(end)
+                if idx >= 0:
+                    err = bytes(self._stderr[:idx])
+                    del self._stderr[: idx + len(end)]
+                    return err
+                remaining = deadline - time.monotonic()
+                if self._stderr_eof or remaining <= 0:
+                    raise VaultExecSessionError(
+                        "Vault session stderr closed before the command finished"
+                    )
+                self._stderr_cond.wait(remaining)
+
+    def run(self, command, data=None):
+        """
+        Runs a command inside the remote shell
+
+        Parameters:
+            command(str): The shell command to run. It must fit on a single line
+            data(bytes): Optional content to feed to the command's stdin, either
+                as bytes or as an iterable of bytes chunks
+
+        Returns:
+            ret(tuple): (rc, stdout, stderr) just like module.run_command()
+        """
+        self.open()
+        try:
+            for piece in self._script(command, data):
+                self._proc.stdin.write(piece)
+            self._proc.stdin.flush()
+        except OSError as e:
+            self.close()
+            raise VaultExecSessionError(f"Could not write to vault session: {e}") from e
+        deadline = time.monotonic() + self.timeout
+        try:
+            rc, out = self._read_stdout(deadline)
+            err = self._read_stderr(deadline)
+        except VaultExecSessionError:
+            # The stream is in an unknown state, so the session cannot be reused
+            self.close()
+            raise
+        return rc, out.decode(errors="replace"), err.decode(errors="replace")
+
+
+def stream_command(argv, chunks, timeout=None):
+    """
+    Runs a command once, writing the chunks to its stdin as they are produced
+
+    Parameters:
+        argv(list): The command to run
+        chunks(iterable): The bytes chunks to feed to the command's stdin
+        timeout(int): Number of seconds to wait for the command to exit after
+            its stdin was closed
+
+    Returns:
+        ret(tuple): (rc, stdout, stderr) just like module.run_command()
+    """
+    try:
+        proc = subprocess.Popen(
+            argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=os.environ.copy(),
+        )
+    except OSError as e:
+        return 127, "", f"Could not start {' '.join(argv)}: {e}"
+    # stdout and stderr are read in the background so that the command can
+    # never block on a full pipe while we are still writing its stdin
+    outputs = {}
+
+    def read(name, stream):
+        outputs[name] = stream.read()
+
+    readers = [
+        threading.Thread(target=read, args=(name, stream), daemon=True)
+        for name, stream in (("out", proc.stdout), ("err", proc.stderr))
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        for chunk in chunks:
+            proc.stdin.write(chunk)
+    except BrokenPipeError:
+        # the command exited early, its exit code and stderr tell why
+        pass
+    except BaseException:
+        # producing the content failed, so the command must not see a
+        # truncated stdin as if it was complete
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+    try:
+        rc = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        rc = proc.wait()
+    for reader in readers:
+        reader.join()
+    return (
+        rc,
+        outputs.get("out", b"").decode(errors="replace"),
+        outputs.get("err", b"").decode(errors="replace"),
+    )
@@ -23,11 +23,30 @@ version: 2.0
 
 """
 
+import base64
+import hashlib
+import json
 import os
+import shlex
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.load_secrets_common import (
+    VaultLoadError,
+    bulk_command,
+    file_chunks,
+    split_bulk_output,
+    vault_not_found,
+)
+from ansible.module_utils.vault_api import VaultApiClient, VaultApiError
+from ansible.module_utils.vault_exec_session import (
+    VaultExecSession,
+    VaultExecSessionError,
+    stream_command,
+)
 
 ANSIBLE_METADATA = {
     "metadata_version": "1.1",
@@ -68,6 +87,89 @@ options:
     required: false
     type: str
     default: vault-0
+  transport:
+    description:
+      - How the vault commands reach the vault pod. C(exec) runs a separate oc exec
+        for every command. C(session) keeps a single oc exec shell open for the whole
+        run and streams all the commands through it. C(api) talks to the vault HTTP
+        API at I(vault_addr) directly and falls back to C(exec) when it cannot be reached
+    required: false
+    type: str
+    default: exec
+    choices: ['exec', 'session', 'api']
+  vault_addr:
+    description:
+      - Address of the vault API used by the C(api) transport, e.g. a route or a
+        port-forward to the vault service. Defaults to the VAULT_ADDR environment variable
+    required: false
+    type: str
+  vault_token:
+    description:
+      - Token used by the C(api) transport. Defaults to the VAULT_TOKEN environment variable
+    required: false
+    type: str
+    no_log: true
+  validate_certs:
+    description:
+      - Whether the TLS certificate of I(vault_addr) is verified
+    required: false
+    type: bool
+    default: true
+  batch:
+    description:
+      - Write all the fields of a secret with a single C(vault kv put) per vault prefix
+        instead of one C(vault kv put/patch) per field. Generated fields that are not
+        overridden keep the value they already have in the vault
+    required: false
+    type: bool
+    default: false
+  workers:
+    description:
+      - Number of secret/vault prefix pairs that are loaded in parallel. Writes to the
+        same secret path always happen in order. Failures are collected and reported
+        together once all the pairs are done
+    required: false
+    type: int
+    default: 1
+  prefetch:
+    description:
+      - Read every secret path that has generated fields once before loading, with a
+        single command for all of them, instead of running one C(vault kv get) per
+        generated field and vault prefix
+    required: false
+    type: bool
+    default: false
+  sync:
+    description:
+      - Compare the content of every field and password policy with what is stored in
+        the vault and only write the ones that are missing or differ. Fields that exist
+        in the vault but not in I(parsed_secrets) are left alone. The module then only
+        reports C(changed) when something was written, and returns a C(sync) summary of
+        the created, changed and unchanged paths. Generated fields with override get a
+        new password on every run, so they are written but left out of that decision,
+        and the paths that hold one are listed as C(rotated) instead
+    required: false
+    type: bool
+    default: false
+  skip_unchanged_policies:
+    description:
+      - Read the password policies stored in the vault first, with a single command for
+        all of them, and only write the ones that are missing or differ. Always enabled
+        with I(sync)
+    required: false
+    type: bool
+    default: false
+  stream_files:
+    description:
+      - Stream the content of path fields straight into the C(vault kv) command
+        with a single C(oc exec) per vault prefix, base64 encoding it on the fly
+        when needed, instead of copying it to a temporary file inside the vault pod
+        first. Files are read in small chunks, so large ones are never held in
+        memory. Applies to the exec transport, when I(batch) and I(sync) are not
+        set. The session transport always streams path fields
+    required: false
+    type: bool
+    default: false
 """
 
 RETURN = """
@@ -81,6 +183,12 @@ EXAMPLES = """
 """
 
 
+# Separates the per-path outputs of the bulk reads done by prefetch_secrets()
+# and prefetch_policies()
+PREFETCH_MARKER = "@@vault-prefetch"
+PREFETCH_CHUNK = 100
+
+
 class VaultSecretLoader:
 
     def __init__(
@@ -90,14 +198,74 @@ class VaultSecretLoader:
         vault_policies,
         namespace,
         pod,
+        transport="exec",
+        batch=False,
+        api=None,
+        workers=1,
+        prefetch=False,
+        sync=False,
+        skip_unchanged_policies=False,
+        stream_files=False,
     ):
         self.module = module
         self.parsed_secrets = parsed_secrets
         self.vault_policies = vault_policies
         self.namespace = namespace
         self.pod = pod
+        self.batch = batch
+        self.use_session = transport == "session"
+        self.api = api if transport == "api" else None
+        self.workers = max(1, workers)
+        self.timings = []
+        self.prefetch = prefetch
+        # (mount, path) -> fields stored in vault before this run started, None
+        # when the secret did not exist
+        self.secret_cache = {}
+        self.sync = sync
+        self.sync_summary = {
+            "created": [],
+            "changed": [],
+            "unchanged": [],
+            "rotated": [],
+        }
+        self.skip_unchanged_policies = skip_unchanged_policies or sync
+        # policy name -> HCL stored in vault before this run, None when missing
+        self.policy_cache = {}
+        self.stream_files = stream_files
+        # Every worker thread gets its own exec session
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if not self.use_session:
+            return None
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = VaultExecSession.for_pod(self.namespace, self.pod)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _close_sessions(self):
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+        self._local = threading.local()
+
+    def _fail(self, msg, **kwargs):
+        """
+        Fails the module, unless we are running in a worker thread. There the
+        error is raised instead so that it can be collected with the others
+        """
+        if getattr(self._local, "in_worker", False):
+            raise VaultLoadError(msg, kwargs)
+        self.module.fail_json(msg=msg, **kwargs)
 
-    def _run_command(self, command, attempts=1, sleep=3, checkrc=True):
+    def _run_command(self, command, attempts=1, sleep=3, checkrc=True, data=None):
         """
         Runs a command on the host ansible is running on. A failing command
         will raise an exception in this function directly (due to check=True)
@@ -106,24 +274,235 @@ class VaultSecretLoader:
           command(str): The command to be run.
           attempts(int): Number of times to retry in case of Error (defaults to 1)
           sleep(int): Number of seconds to wait in between retry attempts (defaults to 3s)
+          data(bytes): Optional content passed to the command's stdin
 
         Returns:
           ret(subprocess.CompletedProcess): The return value from run()
         """
+        # run_command() must not fail the module from within a worker thread
+        in_worker = getattr(self._local, "in_worker", False)
         for attempt in range(attempts):
             ret = self.module.run_command(
                 command,
-                check_rc=checkrc,
+                check_rc=checkrc and not in_worker,
                 use_unsafe_shell=True,
                 environ_update=os.environ.copy(),
+                data=data,
+                binary_data=True,
             )
-            if ret[0] == 0:
-                return ret
-            if attempt >= attempts - 1:
-                return ret
+            if ret[0] == 0 or attempt >= attempts - 1:
+                break
+            time.sleep(sleep)
+        if in_worker and checkrc and ret[0] != 0:
+            self._fail(
+                f"Command failed: {command}", rc=ret[0], stdout=ret[1], stderr=ret[2]
+            )
+        return ret
+
+    def _run_session_command(
+        self, command, data=None, attempts=1, sleep=3, checkrc=True
+    ):
+        """
+        Runs a command inside the vault pod through the long-lived exec session.
+        A session that died is reopened on the next attempt.
+
+        Parameters:
+          command(str): The command to be run inside the vault pod.
+          data(bytes): Optional content passed to the command's stdin
+          attempts(int): Number of times to retry in case of Error (defaults to 1)
+          sleep(int): Number of seconds to wait in between retry attempts (defaults to 3s)
+          checkrc(bool): Fail the module when the command still fails after all attempts
+
+        Returns:
+          ret(tuple): (rc, stdout, stderr) of the last attempt
+        """
+        ret = (1, "", "")
+        for attempt in range(attempts):
+            try:
+                ret = self.session.run(command, data=data)
+            except VaultExecSessionError as e:
+                ret = (1, "", str(e))
+            if ret[0] == 0 or attempt >= attempts - 1:
+                break
             time.sleep(sleep)
+        if ret[0] != 0 and checkrc:
+            self._fail(
+                f"Vault command failed: {command}",
+                rc=ret[0],
+                stdout=ret[1],
+                stderr=ret[2],
+            )
+        return ret
+
+    def _run_api_call(self, func, *args, attempts=1, sleep=3):
+        """
+        Calls a VaultApiClient method, retrying it on errors
+
+        Parameters:
+          func(callable): The bound VaultApiClient method
+          attempts(int): Number of times to retry in case of Error (defaults to 1)
+          sleep(int): Number of seconds to wait in between retry attempts (defaults to 3s)
+
+        Returns:
+          ret: Whatever the method returned
+        """
+        for attempt in range(attempts):
+            try:
+                return func(*args)
+            except VaultApiError as e:
+                if attempt >= attempts - 1:
+                    self._fail(f"Vault API call failed: {e}")
+                time.sleep(sleep)
+
+    def _pod_command(self, command, data=None, attempts=1, checkrc=True):
+        """
+        Runs a command inside the vault pod with whichever transport was selected
+        """
+        if self.session is not None:
+            return self._run_session_command(
+                command, data=data, attempts=attempts, checkrc=checkrc
+            )
+        cmd = (
+            f"oc exec -n {self.namespace} {self.pod} -i -- sh -c {shlex.quote(command)}"
+        )
+        return self._run_command(cmd, attempts=attempts, checkrc=checkrc, data=data)
+
+    def _pod_stream(self, command, path, b64, attempts=1, sleep=3):
+        """
+        Runs a command inside the vault pod with the content of a local file on
+        its stdin. The file is read, and base64 encoded if asked to, chunk by
+        chunk while it is being sent
+
+        Parameters:
+          command(str): The command to be run inside the vault pod.
+          path(str): The file whose content is passed to the command's stdin
+          b64(bool): Base64 encode the content of the file
+          attempts(int): Number of times to retry in case of Error (defaults to 1)
+          sleep(int): Number of seconds to wait in between retry attempts (defaults to 3s)
+
+        Returns:
+          ret(tuple): (rc, stdout, stderr) of the last attempt
+        """
+        argv = ["oc", "exec", "-n", self.namespace, self.pod, "-i", "--"]
+        argv += ["sh", "-c", command]
+        ret = (1, "", "")
+        with self._open_path_file(path) as f:
+            for attempt in range(attempts):
+                f.seek(0)
+                chunks = file_chunks(f, b64)
+                try:
+                    if self.session is not None:
+                        ret = self.session.run(command, data=chunks)
+                    else:
+                        ret = stream_command(argv, chunks)
+                except (OSError, VaultExecSessionError) as e:
+                    ret = (1, "", str(e))
+                if ret[0] == 0 or attempt >= attempts - 1:
+                    break
+                time.sleep(sleep)
+        if ret[0] != 0:
+            self._fail(
+                f"Vault command failed: {command}",
+                rc=ret[0],
+                stdout=ret[1],
+                stderr=ret[2],
+            )
+        return ret
+
+    def _vault_secret_fields(self, mount, prefix, secret_name):
+        """
+        Returns the fields currently stored in a secret, or {} when the secret
+        does not exist yet
+        """
+        key = (mount, f"{prefix}/{secret_name}")
+        if key in self.secret_cache:
+            return self.secret_cache[key] or {}
+        return self._read_vault_secret(mount, f"{prefix}/{secret_name}") or {}
+
+    def _read_vault_secret(self, mount, path):
+        """
+        Reads the fields of a secret. None is only returned when the vault
+        reports that the secret does not exist, any other error fails the module
+        """
+        if self.api is not None:
+            return self._run_api_call(self.api.kv_read, mount, path)
+        (ret, out, err) = self._pod_command(
+            f"vault kv get -mount={mount} -format=json {path}",
+            checkrc=False,
+        )
+        if vault_not_found(ret, err):
+            return None
+        if ret == 0:
+            try:
+                return json.loads(out)["data"]["data"] or {}
+            except (ValueError, KeyError, TypeError):
+                pass
+        self._fail(
+            f"Could not read vault secret {mount}/{path}",
+            rc=ret,
+            stdout=out,
+            stderr=err,
+        )
+
+    def _generate_password(self, policy, b64):
+        if self.api is not None:
+            password = self._run_api_call(
+                self.api.generate_password, policy, attempts=3
+            )
+        else:
+            (_, out, _) = self._pod_command(
+                f"vault read -field=password sys/policies/password/{policy}/generate",
+                attempts=3,
+            )
+            password = out.rstrip("\n")
+        if b64:
+            password = base64.b64encode(password.encode()).decode("utf-8")
+        return password
+
+    def _open_path_file(self, path):
+        """
+        Opens the file of a path field, failing the module when it cannot be read
+        """
+        try:
+            return open(path, "rb")
+        except OSError as e:
+            self._fail(f"Could not read file {path}: {e.strerror}")
+
+    def _read_path_field(self, path, b64):
+        with self._open_path_file(path) as f:
+            content = f.read()
+        if b64:
+            return base64.b64encode(content).decode("utf-8")
+        try:
+            return content.decode("utf-8")
+        except UnicodeDecodeError:
+            self._fail(f"File {path} is not valid UTF-8, it needs to be base64 encoded")
+
+    def _vault_kv_write(self, mount, path, fields, patch=False):
+        """
+        Writes fields into a secret, replacing it ('kv put') or merging into it ('kv patch')
+        """
+        if self.api is not None:
+            func = self.api.kv_patch if patch else self.api.kv_write
+            self._run_api_call(func, mount, path, fields, attempts=3)
+            return
+        verb = "patch" if patch else "put"
+        self._pod_command(
+            f"vault kv {verb} -mount={mount} {path} -",
+            data=json.dumps(fields).encode(),
+            attempts=3,
+        )
 
     def _vault_secret_attr_exists(self, mount, prefix, secret_name, attribute):
+        if self.prefetch or self.api is not None:
+            return attribute in self._vault_secret_fields(mount, prefix, secret_name)
+        if self.session is not None:
+            (ret, _, _) = self._run_session_command(
+                f"vault kv get -mount={mount} -field={attribute} {prefix}/{secret_name} >/dev/null",
+                checkrc=False,
+            )
+            return ret == 0
+
         cmd = (
             f"oc exec -n {self.namespace} {self.pod} -i -- sh -c "
             f'"vault kv get -mount={mount} -field={attribute} {prefix}/{secret_name}"'
@@ -135,17 +514,238 @@ class VaultSecretLoader:
 
         return False
 
+    def _keep_existing_field(self, mount, prefix, secret_name, fieldname, first):
+        """
+        With prefetch the existence check looks at the state from before the run,
+        when an earlier 'kv put' of this run may already have dropped the field.
+        So it gets written back with its previous value
+        """
+        if not self.prefetch or first:
+            return
+        value = self._vault_secret_fields(mount, prefix, secret_name)[fieldname]
+        self._vault_kv_write(
+            mount, f"{prefix}/{secret_name}", {fieldname: value}, patch=True
+        )
+
+    def _prefetch_paths(self):
+        paths = set()
+        for secret_name, secret in self.parsed_secrets.items():
+            # sync compares every path, otherwise only generated fields need a lookup
+            if not self.sync and not any(
+                f in secret["generate"] and f not in secret["override"]
+                for f in secret.get("fields")
+            ):
+                continue
+            mount = secret.get("vault_mount", "secret")
+            for prefix in secret.get("vault_prefixes", ["hub"]):
+                paths.add((mount, f"{prefix}/{secret_name}"))
+        return sorted(paths)
+
+    def prefetch_secrets(self):
+        """
+        Reads all the secrets whose generated fields might have to be skipped,
+        so that the existence checks are answered from memory afterwards
+        """
+        paths = self._prefetch_paths()
+        if self.api is not None:
+            for mount, path in paths:
+                self.secret_cache[(mount, path)] = self._read_vault_secret(mount, path)
+            return
+
+        for chunk_start in range(0, len(paths), PREFETCH_CHUNK):
+            chunk_end = chunk_start + PREFETCH_CHUNK
+            chunk = paths[chunk_start:chunk_end]
+            cmd = bulk_command(
+                PREFETCH_MARKER,
+                [
+                    f"vault kv get -mount={mount} -format=json {path} 2>&1"
+                    for mount, path in chunk
+                ],
+            )
+            # A failing exec or a sealed vault must not pass for missing
+            # secrets, or their generated fields would be regenerated
+            (ret, out, err) = self._pod_command(cmd, checkrc=False)
+            if ret != 0:
+                self._fail(
+                    "Could not prefetch the vault secrets",
+                    rc=ret,
+                    stdout=out,
+                    stderr=err,
+                )
+            outputs = split_bulk_output(PREFETCH_MARKER, out)
+            for i, (mount, path) in enumerate(chunk):
+                (rc, output) = outputs.get(i, (None, ""))
+                if vault_not_found(rc, output):
+                    self.secret_cache[(mount, path)] = None
+                    continue
+                fields = None
+                if rc == 0:
+                    try:
+                        fields = json.loads(output)["data"]["data"] or {}
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                if fields is None:
+                    self._fail(
+                        f"Could not prefetch vault secret {mount}/{path}",
+                        rc=rc,
+                        stdout=output,
+                    )
+                self.secret_cache[(mount, path)] = fields
+
+    def prefetch_policies(self):
+        """
+        Reads all the password policies we are about to write, so that the
+        unchanged ones can be skipped
+        """
+        names = list(self.vault_policies)
+        if self.api is not None:
+            for name in names:
+                self.policy_cache[name] = self._run_api_call(
+                    self.api.read_password_policy, name
+                )
+            return
+
+        cmd = bulk_command(
+            PREFETCH_MARKER,
+            [
+                f"vault read -field=policy sys/policies/password/{name} 2>&1"
+                for name in names
+            ],
+        )
+        (ret, out, err) = self._pod_command(cmd, checkrc=False)
+        if ret != 0:
+            self._fail(
+                "Could not prefetch the vault password policies",
+                rc=ret,
+                stdout=out,
+                stderr=err,
+            )
+        outputs = split_bulk_output(PREFETCH_MARKER, out)
+        for i, name in enumerate(names):
+            (rc, output) = outputs.get(i, (None, ""))
+            if vault_not_found(rc, output):
+                self.policy_cache[name] = None
+            elif rc == 0:
+                self.policy_cache[name] = output
+            else:
+                self._fail(
+                    f"Could not prefetch vault password policy {name}",
+                    rc=rc,
+                    stdout=output,
+                )
+
     def load_vault(self):
         injected_secret_count = 0
 
-        self.inject_vault_policies()
+        if self.api is not None and not self.api.ping():
+            self.module.warn(
+                f"Vault API at {self.api.scheme}://{self.api.host} is not reachable, "
+                "falling back to oc exec"
+            )
+            self.api = None
 
-        for secret_name, secret in self.parsed_secrets.items():
-            self.inject_secret(secret_name, secret)
-            injected_secret_count += 1
+        try:
+            if self.prefetch or self.sync:
+                self.prefetch_secrets()
+
+            if self.skip_unchanged_policies:
+                self.prefetch_policies()
+
+            if self.workers > 1:
+                return self.load_vault_concurrently()
+
+            # The same units as on the worker pool, run one after the other
+            policy_units, secret_units = self._units()
+            for name, func, args in policy_units + secret_units:
+                start = time.monotonic()
+                func(*args)
+                self.timings.append(
+                    {"unit": name, "seconds": round(time.monotonic() - start, 3)}
+                )
+            injected_secret_count = len(self.parsed_secrets)
+        finally:
+            self._close_sessions()
+            if self.api is not None:
+                self.api.close()
 
         return injected_secret_count
 
+    def _run_unit(self, func, *args):
+        self._local.in_worker = True
+        start = time.monotonic()
+        error = None
+        try:
+            func(*args)
+        except VaultLoadError as e:
+            error = {"msg": str(e), **e.details}
+        except Exception as e:
+            error = {"msg": f"{type(e).__name__}: {e}"}
+        return time.monotonic() - start, error
+
+    def _run_units(self, units):
+        """
+        Runs (name, func, args) units on the worker pool and waits for all of them
+
+        Returns:
+          errors(list): One dict per unit that failed
+        """
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                (name, pool.submit(self._run_unit, func, *args))
+                for name, func, args in units
+            ]
+            for name, future in futures:
+                elapsed, error = future.result()
+                self.timings.append({"unit": name, "seconds": round(elapsed, 3)})
+                if error is not None:
+                    errors.append({"unit": name, **error})
+        # The sessions belonged to the pool's threads, which are gone now
+        self._close_sessions()
+        return errors
+
+    def _units(self):
+        """
+        Splits the load into (name, func, args) units: one per password policy
+        and one per (secret, vault prefix) pair, i.e. per secret path
+
+        Returns:
+          units(tuple): The policy units and the secret units
+        """
+        policy_units = [
+            (f"policy/{name}", self.inject_vault_policy, (name, policy))
+            for name, policy in self.vault_policies.items()
+        ]
+        secret_units = [
+            (
+                f"{prefix}/{secret_name}",
+                self.inject_secret,
+                (secret_name, secret, [prefix]),
+            )
+            for secret_name, secret in self.parsed_secrets.items()
+            for prefix in secret.get("vault_prefixes", ["hub"])
+        ]
+        return policy_units, secret_units
+
+    def load_vault_concurrently(self):
+        """
+        Loads the policies and then every (secret, vault prefix) pair on a pool
+        of self.workers threads. Each pair is a separate secret path, and the
+        fields within a pair are still written in order by a single worker
+        """
+        policy_units, secret_units = self._units()
+        errors = self._run_units(policy_units)
+        # Generated secrets need the policies, so only go on when they all made it
+        if not errors:
+            errors = self._run_units(secret_units)
+        if errors:
+            self.module.fail_json(
+                msg=f"{len(errors)} vault load unit(s) failed",
+                errors=errors,
+                timings=self.timings,
+            )
+        return len(self.parsed_secrets)
+
     def inject_field(
         self,
         secret_name,
@@ -176,6 +776,26 @@ class VaultSecretLoader:
         verb = "put" if first else "patch"
         policy = svault_policies.get(fieldname, False)
 
+        if self.api is not None:
+            value = self._read_path_field(path, b64) if path else fieldvalue
+            for prefix in prefixes:
+                if generate:
+                    if not override and self._vault_secret_attr_exists(
+                        mount, prefix, secret_name, fieldname
+                    ):
+                        self._keep_existing_field(
+                            mount, prefix, secret_name, fieldname, first
+                        )
+                        continue
+                    value = self._generate_password(policy, b64)
+                self._vault_kv_write(
+                    mount,
+                    f"{prefix}/{secret_name}",
+                    {fieldname: value},
+                    patch=not first,
+                )
+            return
+
         # "generate" secrets are created with policies and may be overridden or not
         if generate:
             gen_cmd = (
@@ -189,14 +809,30 @@ class VaultSecretLoader:
                 if not override and self._vault_secret_attr_exists(
                     mount, prefix, secret_name, fieldname
                 ):
+                    self._keep_existing_field(
+                        mount, prefix, secret_name, fieldname, first
+                    )
                     continue
-                cmd = (
-                    f"oc exec -n {self.namespace} {self.pod} -i -- sh -c "
-                    f'"{gen_cmd} | vault kv {verb} -mount={mount} {prefix}/{secret_name} {fieldname}=-"'
-                )
+                kv_cmd = f"{gen_cmd} | vault kv {verb} -mount={mount} {prefix}/{secret_name} {fieldname}=-"
+                if self.session is not None:
+                    self._run_session_command(kv_cmd, attempts=3)
+                    continue
+                cmd = f'oc exec -n {self.namespace} {self.pod} -i -- sh -c "{kv_cmd}"'
                 self._run_command(cmd, attempts=3)
             return
 
+        # Through the exec session the file is always streamed, so nothing gets
+        # written to /tmp inside the vault pod
+        if path and (self.stream_files or self.session is not None):
+            for prefix in prefixes:
+                self._pod_stream(
+                    f"vault kv {verb} -mount={mount} {prefix}/{secret_name} {fieldname}=-",
+                    path,
+                    b64,
+                    attempts=3,
+                )
+            return
+
         if path:
             for prefix in prefixes:
                 if b64:
@@ -214,6 +850,13 @@ class VaultSecretLoader:
             return
 
         for prefix in prefixes:
+            if self.session is not None:
+                self._run_session_command(
+                    f"vault kv {verb} -mount={mount} {prefix}/{secret_name} "
+                    f"{shlex.quote(f'{fieldname}={fieldvalue}')}",
+                    attempts=3,
+                )
+                continue
             cmd = (
                 f"oc exec -n {self.namespace} {self.pod} -i -- sh -c "
                 f"\"vault kv {verb} -mount={mount} {prefix}/{secret_name} {fieldname}='{fieldvalue}'\""
@@ -221,9 +864,106 @@ class VaultSecretLoader:
             self._run_command(cmd, attempts=3)
         return
 
-    def inject_secret(self, secret_name, secret):
+    def _path_values(self, secret):
+        """
+        Reads the files of all the path fields of a secret, so that they are read
+        once no matter how many prefixes there are
+        """
+        fields = secret.get("fields")
+        return {
+            fname: self._read_path_field(path, fname in secret["base64"])
+            for fname, path in secret["paths"].items()
+            if fname in fields
+        }
+
+    def _secret_payload(self, secret_name, secret, mount, prefix, path_values):
+        """
+        Returns the complete field map a secret should have at the given prefix
+        """
+        current = None
+        payload = {}
+        for fname, fvalue in secret.get("fields").items():
+            if fname in secret["generate"]:
+                # Like in inject_field() a generated secret that is not
+                # overridden is left alone when it exists already
+                if fname not in secret["override"]:
+                    if current is None:
+                        current = self._vault_secret_fields(mount, prefix, secret_name)
+                    if fname in current:
+                        payload[fname] = current[fname]
+                        continue
+                payload[fname] = self._generate_password(
+                    secret["vault_policies"].get(fname), fname in secret["base64"]
+                )
+            elif fname in path_values:
+                payload[fname] = path_values[fname]
+            else:
+                payload[fname] = fvalue
+        return payload
+
+    @staticmethod
+    def _digest(value):
+        return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+    def inject_secret_batch(self, secret_name, secret, mount, vault_prefixes):
+        """
+        Writes every field of a secret with a single 'vault kv put' per prefix,
+        so readers never observe a secret with only some of its fields set
+        """
+        path_values = self._path_values(secret)
+        for prefix in vault_prefixes:
+            payload = self._secret_payload(
+                secret_name, secret, mount, prefix, path_values
+            )
+            self._vault_kv_write(mount, f"{prefix}/{secret_name}", payload)
+
+    def sync_secret(self, secret_name, secret, mount, vault_prefixes):
+        """
+        Compares the hashes of the wanted fields with the ones of the prefetched
+        secret and only writes the fields that are missing or differ. Overridden
+        generated fields always differ, they are rotated along without counting
+        as a change
+        """
+        rotating = [f for f in secret["generate"] if f in secret["override"]]
+        path_values = self._path_values(secret)
+        for prefix in vault_prefixes:
+            path = f"{prefix}/{secret_name}"
+            payload = self._secret_payload(
+                secret_name, secret, mount, prefix, path_values
+            )
+            if (mount, path) not in self.secret_cache:
+                self.secret_cache[(mount, path)] = self._read_vault_secret(mount, path)
+            current = self.secret_cache[(mount, path)]
+            # only a secret the vault reported as missing gets a full 'kv put'
+            if current is None:
+                self._vault_kv_write(mount, path, payload)
+                self.sync_summary["created"].append(path)
+                continue
+            digests = {k: self._digest(v) for k, v in current.items()}
+            changed = {
+                k: v
+                for k, v in payload.items()
+                if k not in rotating and digests.get(k) != self._digest(v)
+            }
+            rotated = {k: v for k, v in payload.items() if k in rotating}
+            if changed or rotated:
+                self._vault_kv_write(mount, path, {**changed, **rotated}, patch=True)
+            if rotated:
+                self.sync_summary["rotated"].append(path)
+            self.sync_summary["changed" if changed else "unchanged"].append(path)
+
+    def inject_secret(self, secret_name, secret, vault_prefixes=None):
         mount = secret.get("vault_mount", "secret")
-        vault_prefixes = secret.get("vault_prefixes", ["hub"])
+        if vault_prefixes is None:
+            vault_prefixes = secret.get("vault_prefixes", ["hub"])
+
+        if self.sync:
+            self.sync_secret(secret_name, secret, mount, vault_prefixes)
+            return
+
+        if self.batch:
+            self.inject_secret_batch(secret_name, secret, mount, vault_prefixes)
+            return
 
         counter = 0
         # In this structure, each field will have one value
@@ -244,15 +984,62 @@ class VaultSecretLoader:
             counter += 1
         return
 
+    def _vault_password_policy(self, name):
+        """
+        Returns the HCL of a password policy stored in the vault, None if it does not exist.
+        Any other read error fails the module, so that a policy is never taken for
+        missing because the vault could not be asked
+        """
+        if name in self.policy_cache:
+            return self.policy_cache[name]
+        if self.api is not None:
+            return self._run_api_call(self.api.read_password_policy, name)
+        (ret, out, err) = self._pod_command(
+            f"vault read -field=policy sys/policies/password/{name}", checkrc=False
+        )
+        if vault_not_found(ret, err):
+            return None
+        if ret != 0:
+            self._fail(
+                f"Could not read vault password policy {name}",
+                rc=ret,
+                stdout=out,
+                stderr=err,
+            )
+        return out
+
+    def inject_vault_policy(self, name, policy):
+        if self.skip_unchanged_policies:
+            current = self._vault_password_policy(name)
+            if current is not None and current.strip() == policy.strip():
+                if self.sync:
+                    self.sync_summary["unchanged"].append(f"policy/{name}")
+                return
+            if self.sync:
+                state = "created" if current is None else "changed"
+                self.sync_summary[state].append(f"policy/{name}")
+
+        if self.api is not None:
+            self._run_api_call(self.api.write_password_policy, name, policy, attempts=3)
+            return
+        if self.session is not None:
+            self._run_session_command(
+                f"vault write sys/policies/password/{name} policy=-",
+                data=policy.encode(),
+                attempts=3,
+            )
+            return
+        cmd = (
+            f"echo '{policy}' | oc exec -n {self.namespace} {self.pod} -i -- sh -c "
+            f"'cat - > /tmp/{name}.hcl';"
+            f"oc exec -n {self.namespace} {self.pod} -i -- sh -c 'vault write sys/policies/password/{name} "
+            f" policy=@/tmp/{name}.hcl'"
+        )
+        self._run_command(cmd, attempts=3)
+
     def inject_vault_policies(self):
         for name, policy in self.vault_policies.items():
-            cmd = (
-                f"echo '{policy}' | oc exec -n {self.namespace} {self.pod} -i -- sh -c "
-                f"'cat - > /tmp/{name}.hcl';"
-                f"oc exec -n {self.namespace} {self.pod} -i -- sh -c 'vault write sys/policies/password/{name} "
-                f" policy=@/tmp/{name}.hcl'"
-            )
-            self._run_command(cmd, attempts=3)
+            self.inject_vault_policy(name, policy)
 
 
 def run(module):
@@ -265,6 +1052,29 @@ def run(module):
     parsed_secrets = args.get("parsed_secrets", {})
     namespace = args.get("namespace", "vault")
     pod = args.get("pod", "vault-0")
+    transport = args.get("transport", "exec")
+    batch = args.get("batch", False)
+    workers = args.get("workers", 1)
+    prefetch = args.get("prefetch", False)
+    sync = args.get("sync", False)
+    skip_unchanged_policies = args.get("skip_unchanged_policies", False)
+    stream_files = args.get("stream_files", False)
+
+    api = None
+    if transport == "api":
+        vault_addr = args.get("vault_addr") or os.environ.get("VAULT_ADDR")
+        vault_token = args.get("vault_token") or os.environ.get("VAULT_TOKEN")
+        if not vault_addr or not vault_token:
+            module.fail_json("The api transport needs vault_addr and vault_token")
+        try:
+            api = VaultApiClient(
+                vault_addr,
+                vault_token,
+                args.get("validate_certs", True),
+                pool_size=max(4, workers),
+            )
+        except VaultApiError as e:
+            module.fail_json(str(e))
 
     if vault_policies == {}:
         results["failed"] = True
@@ -280,6 +1090,14 @@ def run(module):
         vault_policies,
         namespace,
         pod,
+        transport,
+        batch,
+        api,
+        workers,
+        prefetch,
+        sync,
+        skip_unchanged_policies,
+        stream_files,
     )
 
     nr_secrets = loader.load_vault()
@@ -287,6 +1105,18 @@ def run(module):
     results["failed"] = False
     results["changed"] = True
     results["msg"] = f"{nr_secrets} secrets injected"
+    if sync:
+        summary = {k: sorted(v) for k, v in loader.sync_summary.items()}
+        results["changed"] = bool(summary["created"] or summary["changed"])
+        results["sync"] = summary
+        results["msg"] = (
+            f"{nr_secrets} secrets synced: {len(summary['created'])} created, "
+            f"{len(summary['changed'])} changed, {len(summary['unchanged'])} unchanged"
+        )
+        if summary["rotated"]:
+            results["msg"] += f", {len(summary['rotated'])} rotated"
+    if loader.timings:
+        results["timings"] = loader.timings
     module.exit_json(**results)
 
 
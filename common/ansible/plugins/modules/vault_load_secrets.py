@@ -57,6 +57,7 @@ from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.load_secrets_common import get_version
 from ansible.module_utils.load_secrets_v1 import LoadSecretsV1
 from ansible.module_utils.load_secrets_v2 import LoadSecretsV2
+from ansible.module_utils.vault_api import VaultApiClient, VaultApiError
 
 ANSIBLE_METADATA = {
     "metadata_version": "1.1",
@@ -119,6 +120,52 @@ options:
     required: false
     type: str
     default: ""
+  skip_unchanged_policies:
+    description:
+      - Read the password policies stored in the vault first, with a single command for
+        all of them, and only write the ones that are missing or differ. This is only
+        supported on version 2.0 of the secret format
+    required: false
+    type: bool
+    default: False
+  transport:
+    description:
+      - How the secrets reach the vault. C(exec) runs the vault CLI in the vault pod
+        with oc exec. C(api) talks to the vault HTTP API at I(vault_addr) directly and
+        falls back to C(exec) when it cannot be reached. This is only supported on
+        version 2.0 of the secret format
+    required: false
+    type: str
+    default: exec
+    choices: ['exec', 'api']
+  vault_addr:
+    description:
+      - Address of the vault API used by the C(api) transport, e.g. a route or a
+        port-forward to the vault service. Defaults to the VAULT_ADDR environment variable
+    required: false
+    type: str
+  vault_token:
+    description:
+      - Token used by the C(api) transport. Defaults to the VAULT_TOKEN environment variable
+    required: false
+    type: str
+    no_log: true
+  validate_certs:
+    description:
+      - Whether the TLS certificate of I(vault_addr) is verified
+    required: false
+    type: bool
+    default: true
+  workers:
+    description:
+      - Number of secret/vault prefix pairs that are loaded in parallel. Writes to the
+        same secret path always happen in order. Values that are prompted for are asked
+        before the parallel load starts. Failures are collected and reported together
+        once all the pairs are done. This is only supported on version 2.0 of the
+        secret format
+    required: false
+    type: int
+    default: 1
 """
 
 RETURN = """
@@ -147,6 +194,9 @@ def run(module):
     pod = args.get("pod")
     check_missing_secrets = args.get("check_missing_secrets")
     values_secret_template = args.get("values_secret_template")
+    skip_unchanged_policies = args.get("skip_unchanged_policies", False)
+    transport = args.get("transport", "exec")
+    workers = args.get("workers", 1)
 
     if values_secrets != "" and not os.path.exists(values_secrets):
         results["failed"] = True
@@ -173,8 +223,30 @@ def run(module):
 
     version = get_version(syaml)
     if version == "2.0":
-        secret_obj = LoadSecretsV2(module, syaml, namespace, pod)
+        api = None
+        if transport == "api":
+            vault_addr = args.get("vault_addr") or os.environ.get("VAULT_ADDR")
+            vault_token = args.get("vault_token") or os.environ.get("VAULT_TOKEN")
+            if not vault_addr or not vault_token:
+                module.fail_json("The api transport needs vault_addr and vault_token")
+            try:
+                api = VaultApiClient(
+                    vault_addr,
+                    vault_token,
+                    args.get("validate_certs", True),
+                    pool_size=max(4, workers),
+                )
+            except VaultApiError as e:
+                module.fail_json(str(e))
+        secret_obj = LoadSecretsV2(
+            module, syaml, namespace, pod, skip_unchanged_policies, api, workers
+        )
     elif version == "1.0":
+        if transport == "api":
+            module.warn(
+                "The api transport is only supported on version 2.0 of the secret "
+                "format, falling back to oc exec"
+            )
         secret_obj = LoadSecretsV1(
             module,
             syaml,
@@ -17,11 +17,21 @@
 Simple module to test vault_load_parsed_secrets
 """
 
+import base64
+import copy
+import http.client
+import io
 import json
 import os
+import re
+import socket
 import sys
+import tempfile
+import threading
+import time
 import unittest
-from unittest.mock import call, patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, call, patch
 
 import test_util_datastructures
 from ansible.module_utils import basic
@@ -32,6 +42,14 @@ from ansible.module_utils.common.text.converters import to_bytes
 sys.path.insert(1, "./ansible/plugins/module_utils")
 sys.path.insert(1, "./ansible/plugins/modules")
 
+import load_secrets_common  # noqa: E402
+import vault_api  # noqa: E402
+import vault_exec_session  # noqa: E402
+
+sys.modules["ansible.module_utils.load_secrets_common"] = load_secrets_common
+sys.modules["ansible.module_utils.vault_api"] = vault_api
+sys.modules["ansible.module_utils.vault_exec_session"] = vault_exec_session
+
 import vault_load_parsed_secrets  # noqa: E402
 
 sys.modules["ansible.modules.vault_load_parsed_secrets"] = vault_load_parsed_secrets
@@ -69,6 +87,93 @@ def fail_json(*args, **kwargs):
     raise AnsibleFailJson(kwargs)
 
 
+class MockVaultHandler(BaseHTTPRequestHandler):
+    """Implements the handful of vault API calls used by the api transport"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        path = self.path.split("?")[0].removeprefix("/v1/")
+        self.server.requests.append((method, path))
+        if path == "sys/health":
+            return self._reply(200, {"sealed": False})
+        if self.headers.get("X-Vault-Token") != self.server.token:
+            return self._reply(403, {"errors": ["permission denied"]})
+        if path.startswith("sys/policies/password/"):
+            name = path.removeprefix("sys/policies/password/")
+            if name.endswith("/generate"):
+                return self._reply(200, {"data": {"password": "g3n3rated"}})
+            if method == "PUT":
+                self.server.policies[name] = body["policy"]
+                return self._reply(204)
+            if name not in self.server.policies:
+                return self._reply(404, {"errors": []})
+            return self._reply(200, {"data": {"policy": self.server.policies[name]}})
+        (mount, _, secret) = path.partition("/data/")
+        key = (mount, secret)
+        if method == "GET":
+            if key not in self.server.kv:
+                return self._reply(404, {"errors": []})
+            return self._reply(200, {"data": {"data": self.server.kv[key]}})
+        if method == "POST":
+            self.server.kv[key] = dict(body["data"])
+        elif method == "PATCH":
+            if key not in self.server.kv:
+                return self._reply(404, {"errors": []})
+            self.server.kv[key].update(body["data"])
+        return self._reply(200, {"data": {"version": 1}})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+
+class MockVaultServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MockVaultHandler)
+        self.token = "s.testtoken"
+        self.kv = {}
+        self.policies = {}
+        self.requests = []
+        self.connections = 0
+        self.addr = f"http://127.0.0.1:{self.server_address[1]}"
+        threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
 class TestMyModule(unittest.TestCase):
 
     def setUp(self):
@@ -316,6 +421,1309 @@ class TestMyModule(unittest.TestCase):
         print(mock_run_command.mock_calls)
         mock_run_command.assert_has_calls(calls)
 
+    def test_session_value_injection_works(self):
+        set_module_args(
+            {
+                "parsed_secrets": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "parsed_secrets"
+                ],
+                "vault_policies": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "vault_policies"
+                ],
+                "transport": "session",
+            }
+        )
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader, "_run_command"
+        ) as mock_run_command, patch.object(
+            vault_exec_session.VaultExecSession, "run"
+        ) as mock_session_run:
+            mock_session_run.return_value = 0, "", ""
+
+            with self.assertRaises(AnsibleExitJson) as result:
+                vault_load_parsed_secrets.main()
+            self.assertTrue(result.exception.args[0]["changed"])
+            self.assertEqual(result.exception.args[0]["msg"], "1 secrets injected")
+            mock_run_command.assert_not_called()
+            assert mock_session_run.call_count == 2
+
+        policy = test_util_datastructures.PARSED_SECRET_VALUE_TEST["vault_policies"][
+            "validatedPatternDefaultPolicy"
+        ]
+        calls = [
+            call(
+                "vault write sys/policies/password/validatedPatternDefaultPolicy policy=-",
+                data=policy.encode(),
+            ),
+            call(
+                "vault kv put -mount=secret hub/config-demo secret=value123", data=None
+            ),
+        ]
+        mock_session_run.assert_has_calls(calls)
+
+    def test_session_file_b64_injection_works(self):
+        parsed = copy.deepcopy(
+            test_util_datastructures.PARSED_SECRET_FILE_B64_INJECTION_TEST
+        )
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"line1\nline2\n")
+            f.flush()
+            parsed["parsed_secrets"]["config-demo-file"]["paths"]["test"] = f.name
+            set_module_args(
+                {
+                    "parsed_secrets": parsed["parsed_secrets"],
+                    "vault_policies": parsed["vault_policies"],
+                    "transport": "session",
+                }
+            )
+            uploads = []
+
+            def run(command, data=None):
+                # the file content is handed over as a stream of chunks
+                if data is not None and not isinstance(data, bytes):
+                    uploads.append((command, b"".join(data)))
+                return 0, "", ""
+
+            with patch.object(
+                vault_exec_session.VaultExecSession, "run", side_effect=run
+            ) as mock_session_run:
+                with self.assertRaises(AnsibleExitJson) as result:
+                    vault_load_parsed_secrets.main()
+                self.assertTrue(result.exception.args[0]["changed"])
+                assert mock_session_run.call_count == 5
+
+        self.assertEqual(
+            uploads,
+            [
+                (
+                    "vault kv put -mount=secret secret/region-two/config-demo-file test=-",
+                    b"bGluZTEKbGluZTIK",
+                ),
+                (
+                    "vault kv put -mount=secret secret/snowflake.blueprints.rhecoeng.com/config-demo-file test=-",
+                    b"bGluZTEKbGluZTIK",
+                ),
+            ],
+        )
+
+    def test_session_generate_skips_existing_fields(self):
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        parsed["parsed_secrets"]["config-demo"]["override"] = []
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "session",
+            }
+        )
+
+        def fake_run(command, data=None):
+            # the field already exists on region-one only
+            if command.startswith("vault kv get") and "region-one/" in command:
+                return 0, "", ""
+            if command.startswith("vault kv get"):
+                return 2, "", "No value found"
+            return 0, "", ""
+
+        with patch.object(
+            vault_exec_session.VaultExecSession, "run", side_effect=fake_run
+        ) as mock_session_run:
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_parsed_secrets.main()
+
+        commands = [c.args[0] for c in mock_session_run.mock_calls]
+        self.assertIn(
+            "vault read -field=password sys/policies/password/basicPolicy/generate | base64 --wrap=0 "
+            "| vault kv put -mount=secret snowflake.blueprints.rhecoeng.com/config-demo secret=-",
+            commands,
+        )
+        self.assertFalse(
+            any(c.startswith("vault read") and "region-one/" in c for c in commands)
+        )
+
+    def test_missing_path_file_fails_module(self):
+        server = self._start_vault()
+        parsed = copy.deepcopy(
+            test_util_datastructures.PARSED_SECRET_FILE_INJECTION_TEST
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            missing = os.path.join(tmpdir, "missing")
+            parsed["parsed_secrets"]["config-demo-file"]["paths"]["test"] = missing
+            args = {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+            }
+            for extra in (
+                {"stream_files": True},
+                {"transport": "session"},
+                {"transport": "api", "vault_addr": server.addr},
+                {"batch": True},
+            ):
+                set_module_args(dict(args, vault_token=server.token, **extra))
+                with patch.object(
+                    vault_load_parsed_secrets.VaultSecretLoader,
+                    "_run_command",
+                    return_value=(0, "", ""),
+                ), patch.object(
+                    vault_exec_session.VaultExecSession,
+                    "run",
+                    return_value=(0, "", ""),
+                ):
+                    with self.assertRaises(AnsibleFailJson) as result:
+                        vault_load_parsed_secrets.main()
+                self.assertEqual(
+                    result.exception.args[0]["msg"],
+                    f"Could not read file {missing}: No such file or directory",
+                )
+
+    def test_session_failure_fails_module(self):
+        set_module_args(
+            {
+                "parsed_secrets": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "parsed_secrets"
+                ],
+                "vault_policies": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "vault_policies"
+                ],
+                "transport": "session",
+            }
+        )
+        with patch.object(
+            vault_exec_session.VaultExecSession, "run"
+        ) as mock_session_run, patch.object(vault_load_parsed_secrets.time, "sleep"):
+            mock_session_run.side_effect = vault_exec_session.VaultExecSessionError(
+                "Vault session exited unexpectedly"
+            )
+            with self.assertRaises(AnsibleFailJson) as result:
+                vault_load_parsed_secrets.main()
+            # policy injection is retried three times before giving up
+            assert mock_session_run.call_count == 3
+        self.assertIn(
+            "Vault session exited unexpectedly", result.exception.args[0]["stderr"]
+        )
+
+    def test_batch_value_injection_works(self):
+        set_module_args(
+            {
+                "parsed_secrets": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "parsed_secrets"
+                ],
+                "vault_policies": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "vault_policies"
+                ],
+                "batch": True,
+            }
+        )
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader, "_run_command"
+        ) as mock_run_command:
+            mock_run_command.return_value = 0, "", ""
+
+            with self.assertRaises(AnsibleExitJson) as result:
+                vault_load_parsed_secrets.main()
+            self.assertTrue(result.exception.args[0]["changed"])
+            self.assertEqual(result.exception.args[0]["msg"], "1 secrets injected")
+            assert mock_run_command.call_count == 2
+
+        mock_run_command.assert_called_with(
+            "oc exec -n vault vault-0 -i -- sh -c 'vault kv put -mount=secret hub/config-demo -'",
+            attempts=3,
+            checkrc=True,
+            data=b'{"secret": "value123"}',
+        )
+
+    def test_batch_writes_each_prefix_once(self):
+        parsed = copy.deepcopy(
+            test_util_datastructures.PARSED_SECRET_FILE_B64_INJECTION_TEST
+        )
+        secret = parsed["parsed_secrets"]["config-demo-file"]
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"line1\nline2\n")
+            f.flush()
+            secret["paths"]["test"] = f.name
+            secret["fields"]["other"] = "plain"
+            set_module_args(
+                {
+                    "parsed_secrets": parsed["parsed_secrets"],
+                    "vault_policies": parsed["vault_policies"],
+                    "transport": "session",
+                    "batch": True,
+                }
+            )
+            with patch.object(
+                vault_exec_session.VaultExecSession, "run"
+            ) as mock_session_run:
+                mock_session_run.return_value = 0, "", ""
+
+                with self.assertRaises(AnsibleExitJson):
+                    vault_load_parsed_secrets.main()
+                # one policy, two secrets with two prefixes each
+                assert mock_session_run.call_count == 5
+
+        payload = json.dumps({"test": "bGluZTEKbGluZTIK", "other": "plain"}).encode()
+        calls = [
+            call(
+                "vault kv put -mount=secret secret/region-two/config-demo-file -",
+                data=payload,
+            ),
+            call(
+                "vault kv put -mount=secret secret/snowflake.blueprints.rhecoeng.com/config-demo-file -",
+                data=payload,
+            ),
+        ]
+        mock_session_run.assert_has_calls(calls)
+
+    def test_batch_generate_keeps_existing_values(self):
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        secret = parsed["parsed_secrets"]["config-demo"]
+        secret["override"] = []
+        secret["fields"]["user"] = "admin"
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "session",
+                "batch": True,
+            }
+        )
+
+        def fake_run(command, data=None):
+            if command.startswith("vault kv get") and "region-one/" in command:
+                return 0, json.dumps({"data": {"data": {"secret": "b2xk"}}}), ""
+            if command.startswith("vault kv get"):
+                return 2, "", "No value found"
+            if command.startswith("vault read"):
+                return 0, "s3cr3t", ""
+            return 0, "", ""
+
+        with patch.object(
+            vault_exec_session.VaultExecSession, "run", side_effect=fake_run
+        ) as mock_session_run:
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_parsed_secrets.main()
+
+        writes = {
+            c.args[0]: json.loads(c.kwargs["data"])
+            for c in mock_session_run.mock_calls
+            if c.args[0].startswith("vault kv put")
+        }
+        self.assertEqual(
+            writes,
+            {
+                "vault kv put -mount=secret region-one/config-demo -": {
+                    "secret": "b2xk",
+                    "user": "admin",
+                },
+                "vault kv put -mount=secret snowflake.blueprints.rhecoeng.com/config-demo -": {
+                    "secret": "czNjcjN0",
+                    "user": "admin",
+                },
+            },
+        )
+
+    def _start_vault(self):
+        server = MockVaultServer()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_api_file_injection_works(self):
+        server = self._start_vault()
+        parsed = copy.deepcopy(
+            test_util_datastructures.PARSED_SECRET_FILE_B64_INJECTION_TEST
+        )
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"line1\nline2\n")
+            f.flush()
+            parsed["parsed_secrets"]["config-demo-file"]["paths"]["test"] = f.name
+            set_module_args(
+                {
+                    "parsed_secrets": parsed["parsed_secrets"],
+                    "vault_policies": parsed["vault_policies"],
+                    "transport": "api",
+                    "vault_addr": server.addr,
+                    "vault_token": server.token,
+                }
+            )
+            with patch.object(
+                vault_load_parsed_secrets.VaultSecretLoader, "_run_command"
+            ) as mock_run_command:
+                with self.assertRaises(AnsibleExitJson) as result:
+                    vault_load_parsed_secrets.main()
+                mock_run_command.assert_not_called()
+
+        self.assertEqual(result.exception.args[0]["msg"], "2 secrets injected")
+        self.assertEqual(server.policies, parsed["vault_policies"])
+        self.assertEqual(
+            server.kv,
+            {
+                ("secret", "secret/region-one/config-demo"): {"secret": "value123"},
+                ("secret", "secret/snowflake.blueprints.rhecoeng.com/config-demo"): {
+                    "secret": "value123"
+                },
+                ("secret", "secret/region-two/config-demo-file"): {
+                    "test": "bGluZTEKbGluZTIK"
+                },
+                (
+                    "secret",
+                    "secret/snowflake.blueprints.rhecoeng.com/config-demo-file",
+                ): {"test": "bGluZTEKbGluZTIK"},
+            },
+        )
+        # all the requests went over a single keep-alive connection
+        self.assertEqual(server.connections, 1)
+
+    def test_api_generate_keeps_existing_fields(self):
+        server = self._start_vault()
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        secret = parsed["parsed_secrets"]["config-demo"]
+        secret["override"] = []
+        secret["fields"]["user"] = "admin"
+        server.kv[("secret", "region-one/config-demo")] = {"secret": "b2xk"}
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "api",
+                "vault_addr": server.addr,
+                "vault_token": server.token,
+                "batch": True,
+            }
+        )
+        with self.assertRaises(AnsibleExitJson):
+            vault_load_parsed_secrets.main()
+
+        self.assertEqual(
+            server.kv,
+            {
+                ("secret", "region-one/config-demo"): {
+                    "secret": "b2xk",
+                    "user": "admin",
+                },
+                ("secret", "snowflake.blueprints.rhecoeng.com/config-demo"): {
+                    "secret": "ZzNuM3JhdGVk",
+                    "user": "admin",
+                },
+            },
+        )
+
+    def test_api_errors_fail_module(self):
+        server = self._start_vault()
+        set_module_args(
+            {
+                "parsed_secrets": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "parsed_secrets"
+                ],
+                "vault_policies": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "vault_policies"
+                ],
+                "transport": "api",
+                "vault_addr": server.addr,
+                "vault_token": "wrong",
+            }
+        )
+        with patch.object(vault_load_parsed_secrets.time, "sleep"):
+            with self.assertRaises(AnsibleFailJson) as result:
+                vault_load_parsed_secrets.main()
+        self.assertIn("permission denied", result.exception.args[0]["msg"])
+
+    def test_api_unreachable_falls_back_to_exec(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        set_module_args(
+            {
+                "parsed_secrets": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "parsed_secrets"
+                ],
+                "vault_policies": test_util_datastructures.PARSED_SECRET_VALUE_TEST[
+                    "vault_policies"
+                ],
+                "transport": "api",
+                "vault_addr": f"http://127.0.0.1:{port}",
+                "vault_token": "s.testtoken",
+            }
+        )
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader, "_run_command"
+        ) as mock_run_command, patch.object(basic.AnsibleModule, "warn") as mock_warn:
+            mock_run_command.return_value = 0, "", ""
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_parsed_secrets.main()
+            assert mock_run_command.call_count == 2
+
+        self.assertIn("falling back to oc exec", mock_warn.call_args.args[0])
+        mock_run_command.assert_called_with(
+            "oc exec -n vault vault-0 -i -- sh -c \"vault kv put -mount=secret hub/config-demo secret='value123'\"",
+            attempts=3,
+        )
+
+    def test_concurrent_injection_works(self):
+        set_module_args(
+            {
+                "parsed_secrets": test_util_datastructures.PARSED_SECRET_FILE_INJECTION_TEST[
+                    "parsed_secrets"
+                ],
+                "vault_policies": test_util_datastructures.PARSED_SECRET_FILE_INJECTION_TEST[
+                    "vault_policies"
+                ],
+                "workers": 4,
+            }
+        )
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader, "_run_command"
+        ) as mock_run_command:
+            mock_run_command.return_value = 0, "", ""
+
+            with self.assertRaises(AnsibleExitJson) as result:
+                vault_load_parsed_secrets.main()
+            assert mock_run_command.call_count == 5
+
+        self.assertEqual(result.exception.args[0]["msg"], "2 secrets injected")
+        self.assertEqual(
+            sorted(t["unit"] for t in result.exception.args[0]["timings"]),
+            [
+                "policy/validatedPatternDefaultPolicy",
+                "secret/region-one/config-demo",
+                "secret/region-two/config-demo-file",
+                "secret/snowflake.blueprints.rhecoeng.com/config-demo",
+                "secret/snowflake.blueprints.rhecoeng.com/config-demo-file",
+            ],
+        )
+        # the policy must be in place before any secret gets written
+        self.assertIn("sys/policies/password", mock_run_command.mock_calls[0].args[0])
+
+    def test_sequential_load_reports_the_same_timings(self):
+        parsed = test_util_datastructures.PARSED_SECRET_FILE_INJECTION_TEST
+        units = {}
+        for workers in (1, 4):
+            set_module_args(
+                {
+                    "parsed_secrets": parsed["parsed_secrets"],
+                    "vault_policies": parsed["vault_policies"],
+                    "workers": workers,
+                }
+            )
+            with patch.object(
+                vault_load_parsed_secrets.VaultSecretLoader, "_run_command"
+            ) as mock_run_command:
+                mock_run_command.return_value = 0, "", ""
+                with self.assertRaises(AnsibleExitJson) as result:
+                    vault_load_parsed_secrets.main()
+            timings = result.exception.args[0]["timings"]
+            self.assertTrue(all(t["seconds"] >= 0 for t in timings))
+            units[workers] = sorted(t["unit"] for t in timings)
+
+        self.assertEqual(len(units[1]), 5)
+        self.assertEqual(units[1], units[4])
+
+    def test_concurrent_writes_keep_field_order_per_path(self):
+        parsed = copy.deepcopy(test_util_datastructures.PARSED_SECRET_VALUE_TEST)
+        secret = parsed["parsed_secrets"]["config-demo"]
+        secret["fields"] = {f"field{i}": f"value{i}" for i in range(4)}
+        secret["vault_prefixes"] = ["hub", "region-one", "region-two"]
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "workers": 3,
+            }
+        )
+        commands = []
+
+        def slow_run(command, **kwargs):
+            # interleave the workers as much as possible
+            time.sleep(0.01)
+            commands.append(command)
+            return 0, "", ""
+
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader,
+            "_run_command",
+            side_effect=slow_run,
+        ):
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_parsed_secrets.main()
+
+        for prefix in secret["vault_prefixes"]:
+            writes = [c for c in commands if f" {prefix}/config-demo " in c]
+            self.assertEqual(
+                [w.split("vault kv ")[1].split(" ")[0] for w in writes],
+                ["put", "patch", "patch", "patch"],
+            )
+            self.assertEqual(
+                [w.split("config-demo ")[1].split("=")[0] for w in writes],
+                ["field0", "field1", "field2", "field3"],
+            )
+
+    def test_concurrent_errors_are_aggregated(self):
+        set_module_args(
+            {
+                "parsed_secrets": test_util_datastructures.PARSED_SECRET_FILE_INJECTION_TEST[
+                    "parsed_secrets"
+                ],
+                "vault_policies": test_util_datastructures.PARSED_SECRET_FILE_INJECTION_TEST[
+                    "vault_policies"
+                ],
+                "workers": 4,
+            }
+        )
+
+        def run_command(command, **kwargs):
+            if "snowflake" in command:
+                return 2, "", "permission denied"
+            return 0, "", ""
+
+        with patch.object(
+            basic.AnsibleModule, "run_command", side_effect=run_command
+        ) as mock_run_command, patch.object(vault_load_parsed_secrets.time, "sleep"):
+            with self.assertRaises(AnsibleFailJson) as result:
+                vault_load_parsed_secrets.main()
+            # every snowflake write is retried, every other unit still ran once
+            assert mock_run_command.call_count == 3 + 2 * 3
+            for c in mock_run_command.mock_calls:
+                self.assertFalse(c.kwargs["check_rc"])
+
+        failure = result.exception.args[0]
+        self.assertEqual(failure["msg"], "2 vault load unit(s) failed")
+        self.assertEqual(
+            sorted(e["unit"] for e in failure["errors"]),
+            [
+                "secret/snowflake.blueprints.rhecoeng.com/config-demo",
+                "secret/snowflake.blueprints.rhecoeng.com/config-demo-file",
+            ],
+        )
+        self.assertEqual(failure["errors"][0]["stderr"], "permission denied")
+        self.assertEqual(len(failure["timings"]), 5)
+
+    def test_concurrent_api_injection_works(self):
+        server = self._start_vault()
+        parsed = copy.deepcopy(test_util_datastructures.PARSED_SECRET_VALUE_TEST)
+        secret = parsed["parsed_secrets"]["config-demo"]
+        secret["fields"] = {f"field{i}": f"value{i}" for i in range(3)}
+        secret["vault_prefixes"] = [f"region-{i}" for i in range(8)]
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "api",
+                "vault_addr": server.addr,
+                "vault_token": server.token,
+                "workers": 4,
+            }
+        )
+        with self.assertRaises(AnsibleExitJson):
+            vault_load_parsed_secrets.main()
+
+        self.assertEqual(len(server.kv), 8)
+        for fields in server.kv.values():
+            self.assertEqual(fields, secret["fields"])
+        # the connections are pooled across the workers
+        self.assertLessEqual(server.connections, 5)
+
+    def _prefetch_output(self, secrets, policies=None):
+        """
+        Fakes the output of the bulk 'vault kv get' and 'vault read' run by
+        prefetch_secrets and prefetch_policies
+        """
+        policies = policies or {}
+
+        def run(command, **kwargs):
+            marker = vault_load_parsed_secrets.PREFETCH_MARKER
+            if marker not in command:
+                return 0, "", ""
+            out = ""
+            for index, kind, name in re.findall(
+                r"(\d+); vault (kv get -mount=\S+ -format=json |read -field=policy sys/policies/password/)(\S+)",
+                command,
+            ):
+                out += f"\n{marker} {index}\n"
+                rc = 2
+                if kind.startswith("kv") and name in secrets:
+                    out += (
+                        json.dumps({"data": {"data": secrets[name]}}, indent=2) + "\n"
+                    )
+                    rc = 0
+                elif kind.startswith("kv"):
+                    out += f"No value found at secret/data/{name}\n"
+                elif name in policies:
+                    out += policies[name]
+                    rc = 0
+                else:
+                    out += f"No value found at sys/policies/password/{name}\n"
+                out += f"\n{marker} {index} {rc}\n"
+            return 0, out, ""
+
+        return run
+
+    def test_prefetch_replaces_per_field_checks(self):
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        secret = parsed["parsed_secrets"]["config-demo"]
+        secret["override"] = []
+        secret["fields"] = {"user": "admin", "secret": None, "other": None}
+        secret["generate"] = ["secret", "other"]
+        secret["vault_policies"] = {"secret": "basicPolicy", "other": "basicPolicy"}
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "prefetch": True,
+            }
+        )
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader,
+            "_run_command",
+            side_effect=self._prefetch_output(
+                {"region-one/config-demo": {"user": "admin", "secret": "b2xk"}}
+            ),
+        ) as mock_run_command:
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_parsed_secrets.main()
+
+        commands = [c.args[0] for c in mock_run_command.mock_calls]
+        # one bulk read for both prefixes and no per-field existence checks
+        reads = [c for c in commands if "vault kv get" in c]
+        self.assertEqual(len(reads), 1)
+        self.assertEqual(reads[0].count("vault kv get"), 2)
+        self.assertFalse(any("-field=" in c and "vault kv get" in c for c in commands))
+        # the existing password on region-one is written back after the 'kv put' of user
+        mock_run_command.assert_any_call(
+            "oc exec -n vault vault-0 -i -- sh -c 'vault kv patch -mount=secret region-one/config-demo -'",
+            attempts=3,
+            checkrc=True,
+            data=b'{"secret": "b2xk"}',
+        )
+        generated = [c for c in commands if "/generate" in c]
+        self.assertEqual(len(generated), 3)
+        self.assertEqual(
+            len([c for c in generated if "region-one/" in c and "other=-" in c]), 1
+        )
+        self.assertEqual(len([c for c in generated if "snowflake" in c]), 2)
+
+    def test_prefetch_fails_instead_of_rotating(self):
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        parsed["parsed_secrets"]["config-demo"]["override"] = []
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "prefetch": True,
+            }
+        )
+        marker = vault_load_parsed_secrets.PREFETCH_MARKER
+        outputs = [
+            # the exec itself failed, e.g. an expired token
+            (1, "", "error: You must be logged in to the server (Unauthorized)"),
+            # the vault is sealed
+            (
+                0,
+                f"\n{marker} 0\nError reading region-one/config-demo: Vault is sealed"
+                f"\n{marker} 0 2\n",
+                "",
+            ),
+            # the exec got cut off before the command reported its exit code
+            (0, f"\n{marker} 0\n", ""),
+        ]
+        for output in outputs:
+            with patch.object(
+                vault_load_parsed_secrets.VaultSecretLoader,
+                "_run_command",
+                return_value=output,
+            ) as mock_run_command:
+                with self.assertRaises(AnsibleFailJson) as result:
+                    vault_load_parsed_secrets.main()
+
+            self.assertIn("Could not prefetch", result.exception.args[0]["msg"])
+            # nothing got generated or written
+            mock_run_command.assert_called_once()
+
+    def test_prefetch_batch_reads_each_path_once(self):
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        secret = parsed["parsed_secrets"]["config-demo"]
+        secret["override"] = []
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "session",
+                "batch": True,
+                "prefetch": True,
+            }
+        )
+        fake = self._prefetch_output({"region-one/config-demo": {"secret": "b2xk"}})
+
+        def run(command, data=None):
+            if command.startswith("vault read"):
+                return 0, "s3cr3t", ""
+            return fake(command)
+
+        with patch.object(
+            vault_exec_session.VaultExecSession, "run", side_effect=run
+        ) as mock_session_run:
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_parsed_secrets.main()
+
+        commands = [c.args[0] for c in mock_session_run.mock_calls]
+        reads = [c for c in commands if "vault kv get" in c]
+        self.assertEqual(len(reads), 1)
+        self.assertEqual(reads[0].count("vault kv get"), 2)
+        mock_session_run.assert_any_call(
+            "vault kv put -mount=secret region-one/config-demo -",
+            data=b'{"secret": "b2xk"}',
+        )
+        mock_session_run.assert_any_call(
+            "vault kv put -mount=secret snowflake.blueprints.rhecoeng.com/config-demo -",
+            data=b'{"secret": "czNjcjN0"}',
+        )
+
+    def test_prefetch_api_reads_each_path_once(self):
+        server = self._start_vault()
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        parsed["parsed_secrets"]["config-demo"]["override"] = []
+        server.kv[("secret", "region-one/config-demo")] = {"secret": "b2xk"}
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "api",
+                "vault_addr": server.addr,
+                "vault_token": server.token,
+                "prefetch": True,
+                "workers": 2,
+            }
+        )
+        with self.assertRaises(AnsibleExitJson):
+            vault_load_parsed_secrets.main()
+
+        reads = [r for r in server.requests if r[0] == "GET" and "/data/" in r[1]]
+        self.assertEqual(
+            sorted(reads),
+            [
+                ("GET", "secret/data/region-one/config-demo"),
+                ("GET", "secret/data/snowflake.blueprints.rhecoeng.com/config-demo"),
+            ],
+        )
+        self.assertEqual(
+            server.kv[("secret", "region-one/config-demo")], {"secret": "b2xk"}
+        )
+        self.assertEqual(
+            server.kv[("secret", "snowflake.blueprints.rhecoeng.com/config-demo")],
+            {"secret": "ZzNuM3JhdGVk"},
+        )
+
+    def test_sync_only_writes_differences(self):
+        server = self._start_vault()
+        parsed = copy.deepcopy(
+            test_util_datastructures.PARSED_SECRET_FILE_INJECTION_TEST
+        )
+        parsed["parsed_secrets"]["config-demo"]["fields"]["other"] = "same"
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"content")
+            f.flush()
+            parsed["parsed_secrets"]["config-demo-file"]["paths"]["test"] = f.name
+            args = {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "api",
+                "vault_addr": server.addr,
+                "vault_token": server.token,
+                "sync": True,
+            }
+
+            set_module_args(args)
+            with self.assertRaises(AnsibleExitJson) as result:
+                vault_load_parsed_secrets.main()
+            first = result.exception.args[0]
+            self.assertTrue(first["changed"])
+            self.assertEqual(first["sync"]["changed"], [])
+            self.assertEqual(first["sync"]["unchanged"], [])
+            self.assertEqual(len(first["sync"]["created"]), 5)
+            self.assertEqual(
+                first["msg"], "2 secrets synced: 5 created, 0 changed, 0 unchanged"
+            )
+
+            # nothing changed, so nothing gets written
+            server.requests.clear()
+            set_module_args(args)
+            with self.assertRaises(AnsibleExitJson) as result:
+                vault_load_parsed_secrets.main()
+            second = result.exception.args[0]
+            self.assertFalse(second["changed"])
+            self.assertEqual(len(second["sync"]["unchanged"]), 5)
+            self.assertEqual([r for r in server.requests if r[0] != "GET"], [])
+
+            # a single differing field is patched, fields unknown to us stay
+            region_one = ("secret", "secret/region-one/config-demo")
+            server.kv[region_one]["secret"] = "stale"
+            server.kv[region_one]["manual"] = "kept"
+            server.requests.clear()
+            set_module_args(args)
+            with self.assertRaises(AnsibleExitJson) as result:
+                vault_load_parsed_secrets.main()
+            third = result.exception.args[0]
+
+        self.assertTrue(third["changed"])
+        self.assertEqual(third["sync"]["changed"], ["secret/region-one/config-demo"])
+        self.assertEqual(
+            [r for r in server.requests if r[0] != "GET"],
+            [("PATCH", "secret/data/secret/region-one/config-demo")],
+        )
+        self.assertEqual(
+            server.kv[region_one],
+            {"secret": "value123", "other": "same", "manual": "kept"},
+        )
+
+    def test_sync_rotates_overridden_fields_without_a_change(self):
+        server = self._start_vault()
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        parsed["parsed_secrets"]["config-demo"]["fields"]["other"] = "same"
+        args = {
+            "parsed_secrets": parsed["parsed_secrets"],
+            "vault_policies": parsed["vault_policies"],
+            "transport": "api",
+            "vault_addr": server.addr,
+            "vault_token": server.token,
+            "sync": True,
+        }
+        paths = [
+            "region-one/config-demo",
+            "snowflake.blueprints.rhecoeng.com/config-demo",
+        ]
+        set_module_args(args)
+        with self.assertRaises(AnsibleExitJson):
+            vault_load_parsed_secrets.main()
+
+        # the overridden password is written again, yet nothing counts as changed
+        server.requests.clear()
+        set_module_args(args)
+        with self.assertRaises(AnsibleExitJson) as result:
+            vault_load_parsed_secrets.main()
+        second = result.exception.args[0]
+        self.assertFalse(second["changed"])
+        self.assertEqual(second["sync"]["changed"], [])
+        self.assertEqual(second["sync"]["rotated"], paths)
+        self.assertEqual(
+            [r for r in server.requests if r[0] == "PATCH"],
+            [("PATCH", f"secret/data/{path}") for path in paths],
+        )
+        self.assertEqual(
+            second["msg"],
+            "1 secrets synced: 0 created, 0 changed, 4 unchanged, 2 rotated",
+        )
+
+        # a differing field still makes the path changed
+        server.kv[("secret", paths[0])]["other"] = "stale"
+        set_module_args(args)
+        with self.assertRaises(AnsibleExitJson) as result:
+            vault_load_parsed_secrets.main()
+        third = result.exception.args[0]
+        self.assertTrue(third["changed"])
+        self.assertEqual(third["sync"]["changed"], paths[:1])
+        self.assertEqual(third["sync"]["rotated"], paths)
+        self.assertEqual(server.kv[("secret", paths[0])]["other"], "same")
+
+    def test_policy_read_errors_are_not_taken_for_missing(self):
+        loader = vault_load_parsed_secrets.VaultSecretLoader(
+            Mock(fail_json=fail_json), {}, {}, "vault", "vault-0"
+        )
+        replies = {
+            "missing": (2, "", "No value found at sys/policies/password/missing"),
+            "denied": (2, "", "permission denied"),
+            "present": (0, "length=20", ""),
+        }
+
+        def pod_command(command, **kwargs):
+            return replies[command.rsplit("/", 1)[1]]
+
+        with patch.object(loader, "_pod_command", side_effect=pod_command):
+            self.assertIsNone(loader._vault_password_policy("missing"))
+            self.assertEqual(loader._vault_password_policy("present"), "length=20")
+            with self.assertRaises(AnsibleFailJson) as result:
+                loader._vault_password_policy("denied")
+        failure = result.exception.args[0]
+        self.assertEqual(failure["msg"], "Could not read vault password policy denied")
+        self.assertEqual(failure["stderr"], "permission denied")
+
+    def test_sync_exec_reports_unchanged(self):
+        parsed = test_util_datastructures.PARSED_SECRET_VALUE_TEST
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "sync": True,
+            }
+        )
+        run = self._prefetch_output(
+            {"hub/config-demo": {"secret": "value123"}}, parsed["vault_policies"]
+        )
+
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader, "_run_command", side_effect=run
+        ) as mock_run_command:
+            with self.assertRaises(AnsibleExitJson) as result:
+                vault_load_parsed_secrets.main()
+
+        self.assertFalse(result.exception.args[0]["changed"])
+        self.assertEqual(
+            result.exception.args[0]["sync"],
+            {
+                "created": [],
+                "changed": [],
+                "unchanged": [
+                    "hub/config-demo",
+                    "policy/validatedPatternDefaultPolicy",
+                ],
+                "rotated": [],
+            },
+        )
+        # only the bulk secret read and the bulk policy read
+        assert mock_run_command.call_count == 2
+
+    def test_sync_read_errors_fail_instead_of_creating(self):
+        parsed = test_util_datastructures.PARSED_SECRET_VALUE_TEST
+        marker = vault_load_parsed_secrets.PREFETCH_MARKER
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "sync": True,
+            }
+        )
+        sealed = (
+            f"\n{marker} 0\nError reading secret/data/hub/config-demo: "
+            f"Vault is sealed\n{marker} 0 2\n"
+        )
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader,
+            "_run_command",
+            return_value=(0, sealed, ""),
+        ) as mock_run_command:
+            with self.assertRaises(AnsibleFailJson):
+                vault_load_parsed_secrets.main()
+        # no 'kv put' that would drop the fields we do not know about
+        mock_run_command.assert_called_once()
+
+        server = self._start_vault()
+        hub_path = ("secret", "secret/hub/config-demo")
+        server.kv[hub_path] = {"manual": "kept"}
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "api",
+                "vault_addr": server.addr,
+                "vault_token": "wrong",
+                "sync": True,
+            }
+        )
+        with self.assertRaises(AnsibleFailJson) as result:
+            vault_load_parsed_secrets.main()
+        self.assertIn("permission denied", result.exception.args[0]["msg"])
+        self.assertEqual([r for r in server.requests if r[0] != "GET"], [])
+        self.assertEqual(server.kv[hub_path], {"manual": "kept"})
+
+    def test_skip_unchanged_policies_exec(self):
+        parsed = test_util_datastructures.GENERATE_POLICY_B64_TEST
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "skip_unchanged_policies": True,
+            }
+        )
+        # basicPolicy is already there, validatedPatternDefaultPolicy is not
+        run = self._prefetch_output(
+            {}, {"basicPolicy": parsed["vault_policies"]["basicPolicy"]}
+        )
+
+        with patch.object(
+            vault_load_parsed_secrets.VaultSecretLoader, "_run_command", side_effect=run
+        ) as mock_run_command:
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_parsed_secrets.main()
+
+        commands = [c.args[0] for c in mock_run_command.mock_calls]
+        reads = [c for c in commands if "vault read -field=policy" in c]
+        self.assertEqual(len(reads), 1)
+        writes = [c for c in commands if "vault write sys/policies/password" in c]
+        self.assertEqual(len(writes), 1)
+        self.assertIn("password/validatedPatternDefaultPolicy ", writes[0])
+
+    def test_skip_unchanged_policies_read_errors_fail(self):
+        parsed = test_util_datastructures.GENERATE_POLICY_B64_TEST
+        marker = vault_load_parsed_secrets.PREFETCH_MARKER
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "skip_unchanged_policies": True,
+            }
+        )
+        outputs = [
+            (1, "", "error: You must be logged in to the server (Unauthorized)"),
+            (0, f"\n{marker} 0\npermission denied\n{marker} 0 2\n", ""),
+        ]
+        for output in outputs:
+            with patch.object(
+                vault_load_parsed_secrets.VaultSecretLoader,
+                "_run_command",
+                return_value=output,
+            ) as mock_run_command:
+                with self.assertRaises(AnsibleFailJson) as result:
+                    vault_load_parsed_secrets.main()
+
+            self.assertIn("password polic", result.exception.args[0]["msg"])
+            mock_run_command.assert_called_once()
+
+    def test_skip_unchanged_policies_api(self):
+        server = self._start_vault()
+        parsed = copy.deepcopy(test_util_datastructures.GENERATE_POLICY_B64_TEST)
+        server.policies.update(parsed["vault_policies"])
+        server.policies["basicPolicy"] = "length=5\n"
+        set_module_args(
+            {
+                "parsed_secrets": parsed["parsed_secrets"],
+                "vault_policies": parsed["vault_policies"],
+                "transport": "api",
+                "vault_addr": server.addr,
+                "vault_token": server.token,
+                "skip_unchanged_policies": True,
+            }
+        )
+        with self.assertRaises(AnsibleExitJson):
+            vault_load_parsed_secrets.main()
+
+        self.assertEqual(
+            [r for r in server.requests if r[0] == "PUT"],
+            [("PUT", "sys/policies/password/basicPolicy")],
+        )
+        self.assertEqual(server.policies, parsed["vault_policies"])
+
+    def test_stream_files_exec(self):
+        parsed = copy.deepcopy(
+            test_util_datastructures.PARSED_SECRET_FILE_B64_INJECTION_TEST
+        )
+        streamed = []
+
+        def fake_stream(argv, chunks):
+            streamed.append((argv, b"".join(chunks)))
+            return 0, "", ""
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b"line1\nline2\n")
+            f.flush()
+            parsed["parsed_secrets"]["config-demo-file"]["paths"]["test"] = f.name
+            set_module_args(
+                {
+                    "parsed_secrets": parsed["parsed_secrets"],
+                    "vault_policies": parsed["vault_policies"],
+                    "stream_files": True,
+                }
+            )
+            with patch.object(
+                vault_load_parsed_secrets, "stream_command", side_effect=fake_stream
+            ), patch.object(
+                vault_load_parsed_secrets.VaultSecretLoader, "_run_command"
+            ) as mock_run_command:
+                mock_run_command.return_value = 0, "", ""
+                with self.assertRaises(AnsibleExitJson):
+                    vault_load_parsed_secrets.main()
+
+        oc_exec = ["oc", "exec", "-n", "vault", "vault-0", "-i", "--", "sh", "-c"]
+        self.assertEqual(
+            streamed,
+            [
+                (
+                    oc_exec
+                    + [
+                        "vault kv put -mount=secret secret/region-two/config-demo-file test=-"
+                    ],
+                    b"bGluZTEKbGluZTIK",
+                ),
+                (
+                    oc_exec
+                    + [
+                        "vault kv put -mount=secret secret/snowflake.blueprints.rhecoeng.com/config-demo-file test=-"
+                    ],
+                    b"bGluZTEKbGluZTIK",
+                ),
+            ],
+        )
+        # nothing is staged in a temporary file inside the pod
+        self.assertFalse(
+            any("/tmp/vcontent" in c.args[0] for c in mock_run_command.mock_calls)
+        )
+
+    def test_stream_files_failure_fails_module(self):
+        parsed = copy.deepcopy(
+            test_util_datastructures.PARSED_SECRET_FILE_INJECTION_TEST
+        )
+        with tempfile.NamedTemporaryFile() as f:
+            parsed["parsed_secrets"]["config-demo-file"]["paths"]["test"] = f.name
+            set_module_args(
+                {
+                    "parsed_secrets": parsed["parsed_secrets"],
+                    "vault_policies": parsed["vault_policies"],
+                    "stream_files": True,
+                }
+            )
+            with patch.object(
+                vault_load_parsed_secrets, "stream_command"
+            ) as mock_stream, patch.object(
+                vault_load_parsed_secrets.VaultSecretLoader, "_run_command"
+            ) as mock_run_command, patch.object(
+                vault_load_parsed_secrets.time, "sleep"
+            ):
+                mock_stream.return_value = 1, "", "permission denied"
+                mock_run_command.return_value = 0, "", ""
+                with self.assertRaises(AnsibleFailJson) as result:
+                    vault_load_parsed_secrets.main()
+
+        # retried like every other vault write before giving up
+        self.assertEqual(mock_stream.call_count, 3)
+        self.assertEqual(result.exception.args[0]["stderr"], "permission denied")
+
+
+class TestVaultExecSession(unittest.TestCase):
+
+    def setUp(self):
+        self.session = vault_exec_session.VaultExecSession(["sh"], timeout=10)
+        self.addCleanup(self.session.close)
+
+    def test_commands_share_one_shell(self):
+        self.assertEqual(
+            self.session.run("FOO=bar; echo $$"), self.session.run("echo $$")
+        )
+
+    def test_return_code_and_streams(self):
+        self.assertEqual(
+            self.session.run("echo out; echo err >&2; exit 3"), (3, "out\n", "err\n")
+        )
+        # exiting the command must not tear the session down
+        self.assertEqual(self.session.run("printf nonl"), (0, "nonl", ""))
+
+    def test_data_is_passed_to_stdin(self):
+        content = b"\x00binary\nand text without trailing newline"
+        self.assertEqual(
+            self.session.run("cat", data=content), (0, content.decode(), "")
+        )
+        self.assertEqual(
+            self.session.run("wc -c", data=b"x" * 200000)[1].strip(), "200000"
+        )
+        # without data the command sees an empty stdin instead of the session script
+        self.assertEqual(self.session.run("cat"), (0, "", ""))
+
+    def test_data_can_be_streamed_in_chunks(self):
+        content = os.urandom(300000)
+        chunks = load_secrets_common.file_chunks(io.BytesIO(content), chunk_size=1000)
+        self.assertEqual(
+            self.session.run("wc -c", data=chunks)[1].strip(), str(len(content))
+        )
+        chunks = load_secrets_common.file_chunks(
+            io.BytesIO(content), b64=True, chunk_size=1000
+        )
+        self.assertEqual(
+            self.session.run("cat", data=chunks)[1],
+            base64.b64encode(content).decode(),
+        )
+
+    def test_stream_command(self):
+        chunks = (b"x" * 70000 for _ in range(10))
+        (rc, out, err) = vault_exec_session.stream_command(
+            ["sh", "-c", "wc -c; echo err >&2"], chunks
+        )
+        self.assertEqual((rc, out.strip(), err), (0, "700000", "err\n"))
+        # a command that exits without reading its stdin is not an error on our side
+        chunks = (b"x" * 70000 for _ in range(10))
+        self.assertEqual(
+            vault_exec_session.stream_command(["sh", "-c", "exit 3"], chunks),
+            (3, "", ""),
+        )
+
+    def test_dead_shell_raises(self):
+        with self.assertRaises(vault_exec_session.VaultExecSessionError):
+            self.session.run("kill $$")
+        # the next command transparently starts a new shell
+        self.assertEqual(self.session.run("echo again"), (0, "again\n", ""))
+
+
+class FakeConnection:
+    """HTTP connection that fails while sending or receiving, or answers 200"""
+
+    def __init__(self, send_error=None, receive_error=None):
+        self.send_error = send_error
+        self.receive_error = receive_error
+        self.requests = 0
+
+    def request(self, method, url, body=None, headers=None):
+        self.requests += 1
+        if self.send_error is not None:
+            raise self.send_error
+
+    def getresponse(self):
+        if self.receive_error is not None:
+            raise self.receive_error
+        response = io.BytesIO(b'{"data": {}}')
+        response.status = 200
+        response.will_close = False
+        return response
+
+    def close(self):
+        pass
+
+
+class TestVaultApiClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = vault_api.VaultApiClient("http://127.0.0.1:8200", "s.token")
+        self.fresh = []
+
+        def connect():
+            self.fresh.append(FakeConnection())
+            return self.fresh[-1]
+
+        self.client._connect = connect
+
+    def request_on_pooled(self, **errors):
+        # the pool holds the failing connection only
+        self.client.close()
+        pooled = FakeConnection(**errors)
+        self.client._release(pooled)
+        try:
+            return self.client.request("POST", "secret/data/hub/x", {"data": {}})
+        finally:
+            self.assertEqual(pooled.requests, 1)
+
+    def test_closed_idle_connection_is_retried(self):
+        for errors in (
+            {"receive_error": http.client.RemoteDisconnected("closed")},
+            {"send_error": BrokenPipeError()},
+            {"send_error": ConnectionResetError()},
+        ):
+            with self.subTest(errors=errors):
+                self.fresh.clear()
+                self.assertEqual(self.request_on_pooled(**errors), (200, {"data": {}}))
+                self.assertEqual(len(self.fresh), 1)
+
+    def test_request_that_may_have_reached_vault_is_not_resent(self):
+        for errors in (
+            {"receive_error": socket.timeout("timed out")},
+            {"send_error": socket.timeout("timed out")},
+            {"receive_error": ConnectionResetError()},
+            {"receive_error": http.client.BadStatusLine("garbage")},
+        ):
+            with self.subTest(errors=errors):
+                self.fresh.clear()
+                with self.assertRaises(vault_api.VaultApiError):
+                    self.request_on_pooled(**errors)
+                self.assertEqual(self.fresh, [])
+
+    def test_fresh_connection_is_not_retried(self):
+        self.client._connect = lambda: FakeConnection(
+            receive_error=http.client.RemoteDisconnected("closed")
+        )
+        with self.assertRaises(vault_api.VaultApiError):
+            self.client.request("GET", "secret/data/hub/x")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -31,8 +31,10 @@ from ansible.module_utils.common.text.converters import to_bytes
 sys.path.insert(1, "./ansible/plugins/module_utils")
 sys.path.insert(1, "./ansible/plugins/modules")
 import load_secrets_common  # noqa: E402
+import vault_api  # noqa: E402
 
 sys.modules["ansible.module_utils.load_secrets_common"] = load_secrets_common
+sys.modules["ansible.module_utils.vault_api"] = vault_api
 import load_secrets_v1  # noqa: E402
 import load_secrets_v2  # noqa: E402
 
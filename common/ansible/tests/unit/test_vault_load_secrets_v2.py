@@ -17,10 +17,13 @@
 Simple module to test vault_load_secrets
 """
 
+import base64
 import configparser
 import json
 import os
+import socket
 import sys
+import threading
 import unittest
 from unittest import mock
 from unittest.mock import call, patch
@@ -33,14 +36,17 @@ from ansible.module_utils.common.text.converters import to_bytes
 sys.path.insert(1, "./ansible/plugins/module_utils")
 sys.path.insert(1, "./ansible/plugins/modules")
 import load_secrets_common  # noqa: E402
+import vault_api  # noqa: E402
 
 sys.modules["ansible.module_utils.load_secrets_common"] = load_secrets_common
+sys.modules["ansible.module_utils.vault_api"] = vault_api
 import load_secrets_v1  # noqa: E402
 import load_secrets_v2  # noqa: E402
 
 sys.modules["ansible.module_utils.load_secrets_v1"] = load_secrets_v1
 sys.modules["ansible.module_utils.load_secrets_v2"] = load_secrets_v2
 import vault_load_secrets  # noqa: E402
+from test_vault_load_parsed_secrets import MockVaultServer  # noqa: E402
 
 
 def set_module_args(args):
@@ -756,6 +762,251 @@ class TestMyModule(unittest.TestCase):
         ]
         mock_run_command.assert_has_calls(calls)
 
+    def test_skip_unchanged_policies(self, getpass):
+        set_module_args(
+            {
+                "values_secrets_plaintext": """
+version: "2.0"
+vaultPolicies:
+  basicPolicy: |
+    length=10
+  otherPolicy: |
+    length=12
+secrets:
+  - name: config-demo
+    vaultPrefixes:
+    - hub
+    fields:
+    - name: secret
+      value: value123
+""",
+                "skip_unchanged_policies": True,
+            }
+        )
+
+        def run_command(command, **kwargs):
+            if load_secrets_v2.POLICY_MARKER not in command:
+                return 0, "", ""
+            # validatedPatternDefaultPolicy and basicPolicy are up to date
+            default = load_secrets_v2.default_vp_vault_policies[
+                "validatedPatternDefaultPolicy"
+            ]
+            marker = load_secrets_v2.POLICY_MARKER
+            out = (
+                f"\n{marker} 0\n{default}\n{marker} 0 0\n"
+                f"\n{marker} 1\nlength=10\n{marker} 1 0\n"
+                f"\n{marker} 2\nNo value found at sys/policies/password/x\n"
+                f"\n{marker} 2 2\n"
+            )
+            return 0, out, ""
+
+        with patch.object(
+            load_secrets_v2.LoadSecretsV2, "_run_command", side_effect=run_command
+        ) as mock_run_command:
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_secrets.main()
+
+        commands = [c.args[0] for c in mock_run_command.mock_calls]
+        # one read for all the policies, then only otherPolicy is written
+        self.assertEqual(
+            len([c for c in commands if "vault read -field=policy" in c]), 1
+        )
+        writes = [c for c in commands if "vault write sys/policies/password" in c]
+        self.assertEqual(len(writes), 1)
+        self.assertIn("password/otherPolicy ", writes[0])
+
+    def test_policy_read_errors_fail(self, getpass):
+        set_module_args(
+            {
+                "values_secrets_plaintext": """
+version: "2.0"
+vaultPolicies:
+  basicPolicy: |
+    length=10
+secrets:
+  - name: config-demo
+    vaultPrefixes:
+    - hub
+    fields:
+    - name: secret
+      value: value123
+""",
+                "skip_unchanged_policies": True,
+            }
+        )
+        marker = load_secrets_v2.POLICY_MARKER
+        outputs = [
+            (1, "", "error: You must be logged in to the server (Unauthorized)"),
+            (0, f"\n{marker} 0\nError reading: Vault is sealed\n{marker} 0 2\n", ""),
+        ]
+        for output in outputs:
+            with patch.object(
+                load_secrets_v2.LoadSecretsV2, "_run_command", return_value=output
+            ) as mock_run_command:
+                with self.assertRaises(AnsibleFailJson):
+                    vault_load_secrets.main()
+            # no policy or secret got written
+            mock_run_command.assert_called_once()
+
+    def test_api_transport(self, getpass):
+        server = MockVaultServer()
+        self.addCleanup(server.stop)
+        # the generated password already exists at hub, not at region-one
+        server.kv[("secret", "hub/config-demo")] = {"password": "old"}
+        path = os.path.join(self.testdir_v2, "test-file-contents")
+        set_module_args(
+            {
+                "values_secrets_plaintext": f"""
+version: "2.0"
+vaultPolicies:
+  basicPolicy: |
+    length=10
+secrets:
+  - name: config-demo
+    vaultPrefixes:
+    - hub
+    - region-one
+    fields:
+    - name: password
+      onMissingValue: generate
+      vaultPolicy: basicPolicy
+    - name: secret
+      value: value123
+    - name: file
+      path: {path}
+      base64: true
+""",
+                "transport": "api",
+                "vault_addr": server.addr,
+                "vault_token": server.token,
+            }
+        )
+        with patch.object(
+            load_secrets_v2.LoadSecretsV2, "_run_command"
+        ) as mock_run_command:
+            with self.assertRaises(AnsibleExitJson) as result:
+                vault_load_secrets.main()
+            mock_run_command.assert_not_called()
+
+        self.assertEqual(result.exception.args[0]["msg"], "3 secrets injected")
+        self.assertEqual(
+            server.policies,
+            {
+                **load_secrets_v2.default_vp_vault_policies,
+                "basicPolicy": "length=10\n",
+            },
+        )
+        with open(path, "rb") as f:
+            content = base64.b64encode(f.read()).decode()
+        self.assertEqual(
+            server.kv[("secret", "hub/config-demo")],
+            {"password": "old", "secret": "value123", "file": content},
+        )
+        self.assertEqual(
+            server.kv[("secret", "region-one/config-demo")],
+            {"password": "g3n3rated", "secret": "value123", "file": content},
+        )
+
+    def test_api_unreachable_falls_back_to_exec(self, getpass):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        set_module_args(
+            {
+                "values_secrets_plaintext": """
+version: "2.0"
+secrets:
+  - name: config-demo
+    fields:
+    - name: secret
+      value: value123
+""",
+                "transport": "api",
+                "vault_addr": f"http://127.0.0.1:{port}",
+                "vault_token": "s.testtoken",
+            }
+        )
+        with patch.object(
+            load_secrets_v2.LoadSecretsV2, "_run_command"
+        ) as mock_run_command, patch.object(basic.AnsibleModule, "warn") as mock_warn:
+            mock_run_command.return_value = 0, "", ""
+            with self.assertRaises(AnsibleExitJson):
+                vault_load_secrets.main()
+
+        self.assertIn("falling back to oc exec", mock_warn.call_args.args[0])
+        mock_run_command.assert_called_with(
+            "oc exec -n vault vault-0 -i -- sh -c \"vault kv put -mount=secret hub/config-demo secret='value123'\"",
+            attempts=3,
+        )
+
+    def test_concurrent_injection(self, getpass):
+        prompted_from = []
+
+        def ask(prompt):
+            prompted_from.append(threading.current_thread())
+            return "typed"
+
+        getpass.side_effect = ask
+        set_module_args(
+            {
+                "values_secrets_plaintext": """
+version: "2.0"
+secrets:
+  - name: config-demo
+    vaultPrefixes:
+    - hub
+    - region-one
+    - region-two
+    fields:
+    - name: secret
+      value: value123
+    - name: prompted
+      onMissingValue: prompt
+      value: null
+  - name: other
+    fields:
+    - name: one
+      value: x
+""",
+                "workers": 4,
+            }
+        )
+        commands = []
+
+        def run_command(command, **kwargs):
+            commands.append(command)
+            if "region-two/config-demo" in command:
+                return 1, "", "permission denied"
+            return 0, "", ""
+
+        with patch.object(
+            basic.AnsibleModule, "run_command", side_effect=run_command
+        ), patch.object(load_secrets_v2.time, "sleep"):
+            with self.assertRaises(AnsibleFailJson) as result:
+                vault_load_secrets.main()
+
+        # the failing pair is reported, the others were still written
+        self.assertEqual(result.exception.args[0]["msg"], "1 vault load unit(s) failed")
+        errors = result.exception.args[0]["errors"]
+        self.assertEqual([e["unit"] for e in errors], ["region-two/config-demo"])
+        self.assertIn("permission denied", errors[0]["msg"])
+        # the value was asked once, before the workers started
+        self.assertEqual(prompted_from, [threading.main_thread()])
+
+        kv = [c for c in commands if "vault kv" in c]
+        for prefix in ("hub", "region-one"):
+            writes = [c for c in kv if f" {prefix}/config-demo " in c]
+            self.assertEqual(len(writes), 2)
+            self.assertIn("vault kv put", writes[0])
+            self.assertIn("secret='value123'", writes[0])
+            self.assertIn("vault kv patch", writes[1])
+            self.assertIn("prompted='typed'", writes[1])
+        self.assertEqual(
+            len([c for c in kv if "kv put -mount=secret hub/other one='x'" in c]), 1
+        )
+        # the first write of region-two was retried, the second never attempted
+        self.assertEqual(len([c for c in kv if "region-two" in c]), 3)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -25,30 +25,121 @@ The data is collected at regular intervals and displayed in formatted tables
 with deltas from previous measurements and min-max ranges.
 
 Usage:
-    python monitor-amdsmi-gpu.py INTERVAL DURATION
+    python monitor-amdsmi-gpu.py [--devices DEVICES] INTERVAL DURATION
+    python monitor-amdsmi-gpu.py analyze [--compare] CAPTURE [CAPTURE ...]
+    python monitor-amdsmi-gpu.py energy --requests LOG CAPTURE [CAPTURE ...]
 
 Arguments:
-    INTERVAL            Time between measurements in seconds (eg: 5)
-    DURATION            Duration in seconds to monitor GPU activity (eg: 60)
+    INTERVAL            Time between measurements in seconds, fractions are
+                        allowed down to 10ms (eg: 5, 0.25)
+    DURATION            Duration in seconds to monitor GPU activity (eg: 60),
+                        0 runs until interrupted with SIGINT (Ctrl-C)
+
+Options:
+    --devices DEVICES   GPUs to sample: "all" or a comma-separated list of
+                        indices into the processor handles (default: 0)
+    --stream FORMAT     Write every sample as it is collected, as "ndjson" or
+                        "csv"
+    --output FILE       Destination of the stream (default: stdout)
+    --history SAMPLES   Samples per device kept for the current and delta
+                        columns of the report, the summary statistics cover
+                        the whole run either way (default: 3600)
+    --exporter PORT     Serve the latest samples as Prometheus metrics on
+                        http://ADDRESS:PORT/metrics while collecting
+    --exporter-address ADDRESS
+                        Address the exporter binds to (default: 0.0.0.0)
+    --capture FILE      Append every sample to a binary capture file
+    --replay FILE       Replay a capture recorded with --capture or --stream
+                        instead of querying amdsmi, one recorded tick per
+                        interval
+    --synthetic GPUS    Generate bursty synthetic load for GPUS devices
+                        instead of querying amdsmi
+    --seed SEED         Seed of the synthetic load generator (default: 0)
+    --requests LOG      With --capture, attribute the energy of the run to
+                        the requests of a timing log once collection ends
+    --workers N         Threads issuing the amdsmi calls of a tick
+                        concurrently, 0 queries the devices serially
+                        (default: 3 per device, at most 32)
+    --call-timeout SECONDS
+                        Time an amdsmi call may take before its device is
+                        left out of the tick (default: 1.0)
+    --adaptive IDLE_INTERVAL
+                        Sample every IDLE_INTERVAL seconds while every GPU is
+                        idle and switch to INTERVAL as soon as one crosses the
+                        activity thresholds, recording the interval of every
+                        sample
+    --live              Redraw a live view every tick with the rolling 10s,
+                        1m and 5m mean/max of power and activity and the rate
+                        of the utilization counters of every device
+    --report-data FILE  Write a machine-readable twin of every table of the
+                        report, JSON for *.json files and CSV otherwise
+    --profile           Measure the overhead of the monitor itself (amdsmi
+                        call latency, CPU and wall time per tick, output and
+                        report time), print it at exit and export it
+
+The analyze command reruns the activity analysis and the summary tables over
+saved captures (binary, NDJSON or CSV) without touching amdsmi, in bounded
+memory whatever the capture size. With --compare it also prints the
+per-metric deltas between two captures, eg: before and after a runtime
+change.
+
+The energy command integrates socket power over captures (ideally sampled at
+a high rate, eg: 0.01s) and attributes it to the windows of a request timing
+log, a CSV or NDJSON file with start/end timestamps (epoch seconds or ISO
+8601) and optional id and token counts, eg: from the chatqna backend or a
+load generator. It reports energy, activity and tokens per joule per request.
+Power is not integrated across captures or across gaps of more than 5
+sampling intervals (eg: a restarted monitor), that time is reported as
+unmeasured instead.
 """
 
 import argparse
+import asyncio
+import contextlib
+import csv
+import datetime
+import io
 import json
+import math
+import mmap
+import os
+import queue
+import random
+import resource
+import socket
+import struct
 import sys
+import threading
 import time
-from typing import Any, Dict, List, Optional, Tuple, TypedDict, Union
-
-from amdsmi import (
-    AmdSmiException,
-    AmdSmiUtilizationCounterType,
-    amdsmi_get_gpu_activity,
-    amdsmi_get_gpu_asic_info,
-    amdsmi_get_power_info,
-    amdsmi_get_processor_handles,
-    amdsmi_get_utilization_count,
-    amdsmi_init,
-    amdsmi_shut_down,
-)
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TypedDict, Union
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, statistics fall back to array builtins
+    numpy = None  # type: ignore[assignment]
+
+try:
+    from amdsmi import (
+        AmdSmiException,
+        AmdSmiUtilizationCounterType,
+        amdsmi_get_gpu_activity,
+        amdsmi_get_gpu_asic_info,
+        amdsmi_get_power_info,
+        amdsmi_get_processor_handles,
+        amdsmi_get_utilization_count,
+        amdsmi_init,
+        amdsmi_shut_down,
+    )
+except ImportError:  # The replay and synthetic backends work without amdsmi
+    AmdSmiUtilizationCounterType = None
+
+    class AmdSmiException(Exception):  # type: ignore[no-redef]
+        pass
 
 
 # Type definitions for better type checking
@@ -61,10 +152,26 @@ class PowerMeasure(TypedDict):
     current_socket_power: float
 
 
+# Utilization counters keyed by AmdSmiUtilizationCounterType name, normalized
+# once at collection time (NaN when the library did not report a counter)
+UtilizationCounters = TypedDict(
+    "UtilizationCounters",
+    {
+        "COARSE_GRAIN_GFX_ACTIVITY": float,
+        "COARSE_GRAIN_MEM_ACTIVITY": float,
+        "FINE_GRAIN_GFX_ACTIVITY": float,
+        "FINE_GRAIN_MEM_ACTIVITY": float,
+    },
+)
+
+
 class GpuData(TypedDict):
     power_measure: PowerMeasure
     gpu_activity: GpuActivity
-    utilization: List[Dict[str, Any]]
+    utilization: UtilizationCounters
+    timestamp: float  # Wall clock (epoch seconds) when the sample was taken
+    collection_latency: float  # Seconds spent in the amdsmi calls
+    sample_interval: float  # Scheduler interval of the tick, NaN for the first
 
 
 # Constants for GPU activity analysis
@@ -73,11 +180,48 @@ class ActivityThresholds:
     MEM_USE = 5  # 5% memory utilization threshold
     POWER_INCREASE = 10  # 10W increase from baseline threshold
     MIN_INACTIVE_POINTS = 1  # Consecutive inactive points to end activity period
+    MAX_TRACKED_INTERVALS = 1000  # Closed intervals kept by a detector
+
+
+class StatisticsSettings:
+    SKETCH_RELATIVE_ACCURACY = 0.01  # 1% relative error on percentiles
+    REPORT_PERCENTILES = [50, 95, 99]
+
+
+class SamplingSettings:
+    MIN_INTERVAL = 0.01  # 10ms, the finest interval the scheduler accepts
+    DEFAULT_HISTORY = 3600  # Samples per device kept in the sample store
+    CALL_TIMEOUT = 1.0  # Seconds an amdsmi call may take before it is abandoned
+    ADAPTIVE_HOLD = 10  # Inactive samples at the active rate before slowing down
+    MAX_WORKERS = 32  # Upper bound of the collection thread pool
+    MAX_GAP_INTERVALS = 5  # Ticks further apart than this many intervals are a gap
+
+
+# Utilization counters collected for every sample, in display order
+UTILIZATION_COUNTERS = list(UtilizationCounters.__annotations__)
+
+# Flat field name of every utilization counter
+UTILIZATION_FIELDS = {counter: counter.lower() for counter in UTILIZATION_COUNTERS}
+
+# Flat record layout used by the streaming output
+SAMPLE_FIELDS = [
+    "timestamp",
+    "device",
+    "current_socket_power",
+    "gfx_activity",
+    "umc_activity",
+    *UTILIZATION_FIELDS.values(),
+    "collection_latency",
+    "sample_interval",
+]
 
 
 class DisplaySettings:
     MIN_BAR_LENGTH = 64  # Minimum length for title bars
+    MAX_INTERVALS_SHOWN = 10  # Most recent activity intervals in the report
     MAX_DELTA_POINTS = 12  # Maximum points to show deltas for
+    LIVE_WINDOWS = [10, 60, 300]  # Rolling windows of the live view, in seconds
+    LIVE_REFRESH = 0.25  # Minimum seconds between two redraws of the live view
 
 
 # Exit codes
@@ -93,6 +237,9 @@ def format_number(value: Union[int, float], is_percentage: bool = False) -> str:
     """Format a number with appropriate units (K, M) or percentage."""
     if not isinstance(value, (int, float)):
         return str(value)
+    # NaN is the placeholder of a counter the device did not report
+    if math.isnan(value):
+        return "N/A"
 
     if is_percentage:
         return f"{round(value)}%"
@@ -130,16 +277,10 @@ def calculate_delta(
     return f"{format_number(final, is_percentage)}"
 
 
-def calculate_min_max_range(
-    values: List[Union[int, float]],
-) -> Tuple[str, Union[int, float, str]]:
-    numeric_values = [v for v in values if isinstance(v, (int, float))]
-    if not numeric_values:
-        return "N/A", "N/A"
-
-    min_val = min(numeric_values)
-    max_val = max(numeric_values)
-    return f"{min_val} - {max_val}", max_val - min_val
+def format_cell(cell: Any) -> str:
+    if type(cell) is str:
+        return cell
+    return json.dumps(cell) if isinstance(cell, dict) else str(cell)
 
 
 def format_table(
@@ -149,16 +290,18 @@ def format_table(
     Creates a formatted ASCII table with aligned columns.
     Handles dynamic column widths based on content, with optional minimum widths.
     Returns a multi-line string with headers, separator, and data rows.
+
+    Cells are converted once, column widths come from a single pass over the
+    converted columns and every row is rendered through one preformatted
+    template into a single join, so tables of thousands of rows stay cheap.
     """
-    # Convert all data to strings and calculate column widths
+    str_data = [[format_cell(cell) for cell in row] for row in data]
     col_widths = [len(str(h)) for h in headers]
-    str_data = []
-    for row in data:
-        str_row = [
-            json.dumps(cell) if isinstance(cell, dict) else str(cell) for cell in row
+    if str_data:
+        col_widths = [
+            max(width, max(map(len, column)))
+            for width, column in zip(col_widths, zip(*str_data))
         ]
-        str_data.append(str_row)
-        col_widths = [max(width, len(cell)) for width, cell in zip(col_widths, str_row)]
 
     # Apply minimum widths if provided
     if min_widths:
@@ -166,18 +309,17 @@ def format_table(
             max(width, min_width) for width, min_width in zip(col_widths, min_widths)
         ]
 
-    # Create format string and separator
-    format_str = " | ".join(f"{{:<{width}}}" for width in col_widths)
-    separator = "-+-".join("-" * width for width in col_widths)
+    # Create the row template and separator
+    template = " " + " | ".join(f"{{:<{width}}}" for width in col_widths)
+    separator = " " + "-+-".join("-" * width for width in col_widths)
 
-    # Build table
-    table = [
-        " " + format_str.format(*headers),
-        " " + separator,
-        *[" " + format_str.format(*row) for row in str_data],
-    ]
-
-    return "\n".join(table)
+    return "\n".join(
+        [
+            template.format(*headers),
+            separator,
+            *[template.format(*row) for row in str_data],
+        ]
+    )
 
 
 def print_title(title_text: str) -> None:
@@ -193,28 +335,500 @@ def print_table(
     data: List[List[Any]],
     min_widths: Optional[List[int]] = None,
 ) -> None:
+    record_table(title_text, headers, data)
     print_title(title_text)
     print(format_table(headers, data, min_widths))
 
 
-def collect_gpu_data(device: Any) -> GpuData:
+class TableRecorder:
+    """
+    Machine-readable twin of a report: every table printed while recording
+    is kept with the section (eg: the device) it belongs to, and written as
+    JSON or as long-format CSV (one row per cell) once the report is done.
+    """
+
+    def __init__(self) -> None:
+        self.section: Optional[str] = None
+        self.tables: List[Dict[str, Any]] = []
+
+    def add(self, title: str, headers: List[str], rows: List[List[Any]]) -> None:
+        self.tables.append(
+            {
+                "section": self.section,
+                "title": title,
+                "headers": list(headers),
+                "rows": [list(row) for row in rows],
+            }
+        )
+
+    def write(self, path: str) -> None:
+        """Writes JSON when path ends with .json and CSV otherwise."""
+        with open(path, "w", newline="", encoding="utf-8") as stream:
+            if path.endswith(".json"):
+                json.dump({"tables": self.tables}, stream, indent=1, default=str)
+                return
+            writer = csv.writer(stream)
+            writer.writerow(["section", "table", "row", "column", "value"])
+            for table in self.tables:
+                for number, row in enumerate(table["rows"]):
+                    for column, value in zip(table["headers"], row):
+                        writer.writerow(
+                            [table["section"], table["title"], number, column, value]
+                        )
+
+
+# Recorder of the report being printed, if any (see recording_tables)
+TABLE_RECORDER: Optional[TableRecorder] = None
+
+
+def record_table(title: str, headers: List[str], rows: List[List[Any]]) -> None:
+    if TABLE_RECORDER is not None:
+        TABLE_RECORDER.add(title, headers, rows)
+
+
+def set_table_section(section: Optional[str]) -> None:
+    if TABLE_RECORDER is not None:
+        TABLE_RECORDER.section = section
+
+
+@contextlib.contextmanager
+def recording_tables(path: Optional[str]) -> Iterator[None]:
+    """Records the tables printed in the block and writes them to path, if any."""
+    global TABLE_RECORDER
+    if path is None:
+        yield
+        return
+    TABLE_RECORDER = TableRecorder()
+    try:
+        yield
+        TABLE_RECORDER.write(path)
+    finally:
+        TABLE_RECORDER = None
+
+
+@contextlib.contextmanager
+def buffered_output(stream: Any) -> Iterator[None]:
+    """
+    Collects everything printed in the block and writes it to stream with a
+    single write, instead of one write per print call.
+    """
+    buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            yield
+    finally:
+        stream.write(buffer.getvalue())
+        stream.flush()
+
+
+class FixedRateScheduler:
+    """
+    Deadline based scheduler that fires at start + n * interval on the
+    monotonic clock, so the time spent collecting a sample does not push
+    the following samples back. When a tick overruns one or more deadlines
+    those deadlines are skipped (and counted as missed) instead of firing
+    a burst of catch-up samples.
+    """
+
+    def __init__(self, interval: float, duration: float) -> None:
+        self.interval = interval
+        self.duration = duration
+        self.start = time.monotonic()
+        self.origin = self.start  # Deadlines are origin + tick * interval
+        self.tick = 0
+        self.fired = 0
+        self.missed = 0
+        self.max_lateness = 0.0
+
+    async def wait_next_async(self) -> bool:
+        """
+        Sleeps until the next deadline, yielding to the event loop. Returns
+        False once the next deadline would fall past the configured duration,
+        a duration of 0 never ends.
+        """
+        delay = self.next_delay()
+        if delay is None:
+            return False
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.fired += 1
+        return True
+
+    def next_delay(self) -> Optional[float]:
+        """
+        Advances to the next deadline, skipping the missed ones, and returns
+        the seconds left until it or None once the duration is over.
+        """
+        self.tick += 1
+        deadline = self.origin + self.tick * self.interval
+        now = time.monotonic()
+        if now > deadline:
+            skipped = int((now - deadline) // self.interval)
+            if skipped:
+                self.missed += skipped
+                self.tick += skipped
+                deadline = self.origin + self.tick * self.interval
+            self.max_lateness = max(self.max_lateness, now - deadline)
+
+        if self.duration and deadline - self.start > self.duration:
+            return None
+        return deadline - now
+
+    def set_interval(self, interval: float) -> None:
+        """Changes the interval, the next deadline is one interval after the last."""
+        if interval == self.interval:
+            return
+        self.origin += self.tick * self.interval
+        self.tick = 0
+        self.interval = interval
+
+
+def normalize_utilization(utilization: List[Dict[str, Any]]) -> UtilizationCounters:
+    """
+    Converts the list returned by amdsmi_get_utilization_count into a record
+    keyed by counter type, so readers index a counter directly instead of
+    searching the list. Entries may name their counter with "counter_type"
+    or carry the AmdSmiUtilizationCounterType value in "type"; entries
+    without a counter (eg: the timestamp entry) are ignored.
+    """
+    counters: Dict[str, float] = dict.fromkeys(UTILIZATION_COUNTERS, math.nan)
+    for entry in utilization:
+        counter_type = entry.get("counter_type", entry.get("type"))
+        if counter_type is None:
+            continue
+        if not isinstance(counter_type, str):
+            counter_type = (
+                getattr(counter_type, "name", None)
+                or AmdSmiUtilizationCounterType(counter_type).name
+            )
+        if counter_type in counters:
+            counters[counter_type] = float(entry["value"])
+    return counters  # type: ignore[return-value]
+
+
+class CaptureExhausted(Exception):
+    """Raised by a replay backend once every recorded tick has been replayed."""
+
+
+class GpuBackend(ABC):
+    """
+    Source of GPU metrics. The methods mirror the amdsmi calls the monitor
+    needs and return the same structures, so the collection, analysis and
+    display code does not care whether samples come from real hardware, a
+    recorded capture or a synthetic load generator. begin_tick() is called
+    once before every tick, before any device is queried. The amdsmi calls
+    are abstract, so a backend lacking one cannot be instantiated.
+    """
+
+    name = "backend"
+
+    def init(self) -> None:
+        pass
+
+    def shut_down(self) -> None:
+        pass
+
+    def begin_tick(self) -> None:
+        pass
+
+    def timestamp(self) -> float:
+        """Wall clock time (epoch seconds) of the sample being collected."""
+        return time.time()
+
+    @abstractmethod
+    def get_processor_handles(self) -> List[Any]:
+        """Handles of the devices, passed back to the other calls."""
+
+    @abstractmethod
+    def get_power_info(self, device: Any) -> Dict[str, Any]:
+        """Power reading, as amdsmi_get_power_info()."""
+
+    @abstractmethod
+    def get_gpu_activity(self, device: Any) -> Dict[str, Any]:
+        """Activity percentages, as amdsmi_get_gpu_activity()."""
+
+    @abstractmethod
+    def get_utilization_count(
+        self, device: Any, counters: List[str]
+    ) -> List[Dict[str, Any]]:
+        """Utilization counters, as amdsmi_get_utilization_count()."""
+
+    @abstractmethod
+    def get_gpu_asic_info(self, device: Any) -> Dict[str, Any]:
+        """ASIC description, as amdsmi_get_gpu_asic_info()."""
+
+
+class AmdSmiBackend(GpuBackend):
+    """Live backend querying the GPUs through the amdsmi library."""
+
+    name = "amdsmi"
+
+    def init(self) -> None:
+        if AmdSmiUtilizationCounterType is None:
+            raise AmdSmiException("the amdsmi python library is not installed")
+        amdsmi_init()
+
+    def shut_down(self) -> None:
+        if AmdSmiUtilizationCounterType is not None:
+            amdsmi_shut_down()
+
+    def get_processor_handles(self) -> List[Any]:
+        return amdsmi_get_processor_handles()
+
+    def get_power_info(self, device: Any) -> Dict[str, Any]:
+        return amdsmi_get_power_info(device)
+
+    def get_gpu_activity(self, device: Any) -> Dict[str, Any]:
+        return amdsmi_get_gpu_activity(device)
+
+    def get_utilization_count(
+        self, device: Any, counters: List[str]
+    ) -> List[Dict[str, Any]]:
+        return amdsmi_get_utilization_count(
+            device,
+            [getattr(AmdSmiUtilizationCounterType, counter) for counter in counters],
+        )
+
+    def get_gpu_asic_info(self, device: Any) -> Dict[str, Any]:
+        return amdsmi_get_gpu_asic_info(device)
+
+
+class RecordBackend(GpuBackend):
+    """
+    Base of the backends that serve flat sample records (see SAMPLE_FIELDS)
+    instead of hardware readings. begin_tick() loads the records of the next
+    tick into self.current, keyed by device handle, and the amdsmi style
+    getters answer from them.
+    """
+
+    def __init__(self) -> None:
+        self.current: Dict[Any, Dict[str, Any]] = {}
+
+    def record(self, device: Any) -> Dict[str, Any]:
+        try:
+            return self.current[device]
+        except KeyError:
+            raise AmdSmiException(f"no {self.name} sample for device {device}")
+
+    def timestamp(self) -> float:
+        records = list(self.current.values())
+        return records[0]["timestamp"] if records else time.time()
+
+    def get_power_info(self, device: Any) -> Dict[str, Any]:
+        return {"current_socket_power": self.record(device)["current_socket_power"]}
+
+    def get_gpu_activity(self, device: Any) -> Dict[str, Any]:
+        record = self.record(device)
+        return {
+            "gfx_activity": record["gfx_activity"],
+            "umc_activity": record["umc_activity"],
+        }
+
+    def get_utilization_count(
+        self, device: Any, counters: List[str]
+    ) -> List[Dict[str, Any]]:
+        record = self.record(device)
+        return [
+            {"counter_type": counter, "value": record[UTILIZATION_FIELDS[counter]]}
+            for counter in counters
+        ]
+
+    def get_gpu_asic_info(self, device: Any) -> Dict[str, Any]:
+        return placeholder_asic_info(f"{self.name} device {device}")
+
+
+def placeholder_asic_info(market_name: str) -> Dict[str, Any]:
+    """ASIC info for samples that do not come from (or record) real hardware."""
+    return {
+        "market_name": market_name,
+        "vendor_id": "N/A",
+        "vendor_name": "N/A",
+        "device_id": "N/A",
+        "revision_id": "N/A",
+        "vbios_version": "N/A",
+    }
+
+
+def read_stream_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads the flat records of a capture written with --stream, NDJSON or CSV
+    (detected from the first character), one record at a time.
+    """
+    with open(path, newline="", encoding="utf-8") as stream:
+        first = stream.read(1)
+        stream.seek(0)
+        if first == "{":
+            for line in stream:
+                if line.strip():
+                    yield {
+                        field: math.nan if value is None else value
+                        for field, value in json.loads(line).items()
+                    }
+        else:
+            for row in csv.DictReader(stream):
+                record: Dict[str, Any] = {
+                    field: float(row[field]) if row.get(field) else math.nan
+                    for field in SAMPLE_FIELDS
+                }
+                record["device"] = int(record["device"])
+                yield record
+
+
+def group_ticks(
+    records: Iterator[Dict[str, Any]],
+) -> Iterator[Dict[int, Dict[str, Any]]]:
+    """
+    Groups consecutive records into ticks keyed by device: a tick ends when a
+    device shows up a second time.
+    """
+    tick: Dict[int, Dict[str, Any]] = {}
+    for record in records:
+        if record["device"] in tick:
+            yield tick
+            tick = {}
+        tick[record["device"]] = record
+    if tick:
+        yield tick
+
+
+class ReplayBackend(RecordBackend):
+    """
+    Replays a binary capture (--capture) or a sample stream (--stream), one
+    recorded tick per scheduler tick, streaming the file so memory does not
+    depend on its size. Sample timestamps are the recorded ones. The devices
+    are the ones found in the first tick of the capture, with the ASIC info
+    stored in the header of binary captures.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self.reader: Optional[CaptureReader] = None
+        self.ticks: Optional[Iterator[Dict[int, Dict[str, Any]]]] = None
+        self.pending: Optional[Dict[int, Dict[str, Any]]] = None
+
+    def init(self) -> None:
+        try:
+            if is_binary_capture(self.path):
+                self.reader = CaptureReader(self.path)
+                records = self.reader.records()
+            else:
+                records = read_stream_records(self.path)
+            self.ticks = group_ticks(records)
+            self.pending = next(self.ticks, None)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            raise AmdSmiException(f"cannot read capture {self.path}: {e}")
+
+    def shut_down(self) -> None:
+        if self.ticks is not None:
+            self.ticks.close()  # type: ignore[attr-defined]
+        if self.reader is not None:
+            self.reader.close()
+
+    def get_gpu_asic_info(self, device: Any) -> Dict[str, Any]:
+        info = self.reader.asic_info(device) if self.reader is not None else None
+        return info if info is not None else super().get_gpu_asic_info(device)
+
+    def get_processor_handles(self) -> List[Any]:
+        return sorted(self.pending) if self.pending else []
+
+    def begin_tick(self) -> None:
+        if self.pending is None:
+            raise CaptureExhausted(self.path)
+        self.current = self.pending
+        self.pending = next(self.ticks, None)  # type: ignore[arg-type]
+
+
+class SyntheticBackend(RecordBackend):
+    """
+    Load generator producing inference-like samples: every device alternates
+    between idle and busy phases of random length, with power following the
+    graphics activity and the utilization counters accumulating with it.
+    Seeded, so runs are reproducible for benchmarks.
+    """
+
+    name = "synthetic"
+    IDLE_POWER = 140.0  # Watts
+    PEAK_POWER = 750.0  # Watts
+    PHASE_TICKS = (5, 50)  # Range of the length of an idle or busy phase
+
+    def __init__(self, device_count: int, seed: int = 0) -> None:
+        super().__init__()
+        self.random = random.Random(seed)
+        self.states = [
+            {"busy": False, "remaining": 0, "level": 0.0, "counters": 0.0}
+            for _ in range(device_count)
+        ]
+
+    def get_processor_handles(self) -> List[Any]:
+        return list(range(len(self.states)))
+
+    def begin_tick(self) -> None:
+        rng = self.random
+        timestamp = time.time()
+        for device, state in enumerate(self.states):
+            if state["remaining"] <= 0:
+                state["busy"] = not state["busy"]
+                state["remaining"] = rng.randint(*self.PHASE_TICKS)
+                state["level"] = rng.uniform(40, 100) if state["busy"] else 0.0
+            state["remaining"] -= 1
+
+            if state["busy"]:
+                gfx = min(max(rng.gauss(state["level"], 5), 0.0), 100.0)
+            else:
+                gfx = rng.uniform(0, 2)
+            umc = gfx * rng.uniform(0.3, 0.6)
+            power = self.IDLE_POWER + (self.PEAK_POWER - self.IDLE_POWER) * gfx / 100
+            state["counters"] += gfx * 100
+
+            record = {
+                "timestamp": timestamp,
+                "device": device,
+                "current_socket_power": round(power + rng.gauss(0, 5), 1),
+                "gfx_activity": round(gfx),
+                "umc_activity": round(umc),
+            }
+            for scale, field in zip((1.0, 0.5, 1.1, 0.55), UTILIZATION_FIELDS.values()):
+                record[field] = round(state["counters"] * scale)
+            self.current[device] = record
+
+    def get_gpu_asic_info(self, device: Any) -> Dict[str, Any]:
+        info = super().get_gpu_asic_info(device)
+        info["market_name"] = f"Synthetic GPU {device}"
+        return info
+
+
+def collect_gpu_data(backend: GpuBackend, device: Any) -> GpuData:
     """
     Collects comprehensive GPU metrics including power, activity, and utilization data.
     Returns a dictionary containing current socket power, GPU activity (gfx/memory),
-    and various utilization counters for both coarse and fine-grained metrics.
+    and various utilization counters for both coarse and fine-grained metrics,
+    stamped with the wall clock time and the latency of the collection.
     """
-    power_measure = amdsmi_get_power_info(device)
-    gpu_activity = amdsmi_get_gpu_activity(device)
-    utilization = amdsmi_get_utilization_count(
-        device,
-        [
-            AmdSmiUtilizationCounterType.COARSE_GRAIN_GFX_ACTIVITY,
-            AmdSmiUtilizationCounterType.COARSE_GRAIN_MEM_ACTIVITY,
-            AmdSmiUtilizationCounterType.FINE_GRAIN_GFX_ACTIVITY,
-            AmdSmiUtilizationCounterType.FINE_GRAIN_MEM_ACTIVITY,
-        ],
+    timestamp = backend.timestamp()
+    started = time.perf_counter()
+    power_measure = backend.get_power_info(device)
+    gpu_activity = backend.get_gpu_activity(device)
+    utilization = backend.get_utilization_count(device, UTILIZATION_COUNTERS)
+    return build_gpu_data(
+        power_measure,
+        gpu_activity,
+        utilization,
+        timestamp,
+        time.perf_counter() - started,
     )
 
+
+def build_gpu_data(
+    power_measure: Dict[str, Any],
+    gpu_activity: Dict[str, Any],
+    utilization: List[Dict[str, Any]],
+    timestamp: float,
+    latency: float,
+) -> GpuData:
+    """Builds a GpuData sample out of the results of the three amdsmi calls."""
     power_data: PowerMeasure = {
         "current_socket_power": float(power_measure["current_socket_power"]),
     }
@@ -226,93 +840,1313 @@ def collect_gpu_data(device: Any) -> GpuData:
     return {
         "power_measure": power_data,
         "gpu_activity": activity_data,
-        "utilization": utilization,
+        "utilization": normalize_utilization(utilization),
+        "timestamp": timestamp,
+        "collection_latency": latency,
+        "sample_interval": math.nan,
+    }
+
+
+def flatten_sample(device_index: int, data: GpuData) -> Dict[str, Any]:
+    """Flattens a GpuData sample into a single level record (see SAMPLE_FIELDS)."""
+    record: Dict[str, Any] = {
+        "timestamp": data["timestamp"],
+        "device": device_index,
+        "current_socket_power": data["power_measure"]["current_socket_power"],
+        "gfx_activity": data["gpu_activity"]["gfx_activity"],
+        "umc_activity": data["gpu_activity"]["umc_activity"],
     }
+    utilization = data["utilization"]
+    for counter, field in UTILIZATION_FIELDS.items():
+        record[field] = utilization[counter]  # type: ignore[literal-required]
+    record["collection_latency"] = data["collection_latency"]
+    record["sample_interval"] = data["sample_interval"]
+    return record
+
+
+def record_to_sample(record: Dict[str, Any]) -> GpuData:
+    """Rebuilds a GpuData sample from a flat record (the inverse of flatten_sample)."""
+    return {
+        "power_measure": {"current_socket_power": record["current_socket_power"]},
+        "gpu_activity": {
+            "gfx_activity": record["gfx_activity"],
+            "umc_activity": record["umc_activity"],
+        },
+        "utilization": {  # type: ignore[typeddict-item]
+            counter: record[field] for counter, field in UTILIZATION_FIELDS.items()
+        },
+        "timestamp": record["timestamp"],
+        "collection_latency": record["collection_latency"],
+        # Captures written before adaptive sampling have no interval
+        "sample_interval": record.get("sample_interval", math.nan),
+    }
+
+
+class SampleStreamWriter:
+    """
+    Writes samples as they are collected, one record per device and sample,
+    either as newline delimited JSON or as CSV with a header row. Output is
+    flushed after every tick so consumers (eg: tail -f) see samples promptly.
+    """
+
+    FORMATS = ["ndjson", "csv"]
+
+    def __init__(self, stream: Any, fmt: str) -> None:
+        self.stream = stream
+        self.fmt = fmt
+        self.csv_writer = None
+        if fmt == "csv":
+            self.csv_writer = csv.DictWriter(
+                stream, fieldnames=SAMPLE_FIELDS, extrasaction="ignore"
+            )
+            self.csv_writer.writeheader()
+
+    def write_tick(self, samples: Dict[int, GpuData]) -> None:
+        for index, data in samples.items():
+            record = flatten_sample(index, data)
+            if self.csv_writer is not None:
+                self.csv_writer.writerow(record)
+            else:
+                # NaN (no interval for the first sample, counters a device did
+                # not report) is not valid JSON, it is written as null
+                record = {
+                    field: (
+                        None
+                        if isinstance(value, float) and not math.isfinite(value)
+                        else value
+                    )
+                    for field, value in record.items()
+                }
+                self.stream.write(json.dumps(record, allow_nan=False) + "\n")
+        self.stream.flush()
+
+
+# Binary capture file layout:
+#   prefix:  magic, format version, reserved, length of the JSON header
+#   header:  UTF-8 JSON (schema, ASIC info per device, run metadata), padded
+#            with spaces so records start on an 8 byte boundary
+#   records: fixed-width little endian records, appended one tick at a time
+CAPTURE_MAGIC = b"AMDSMICP"
+CAPTURE_VERSION = 1
+CAPTURE_PREFIX = struct.Struct("<8sHHI")
+CAPTURE_RECORD = struct.Struct("<dIfffff4d")
+# (field, numpy format, offset) of every CAPTURE_RECORD member. Readers go by
+# the fields listed in the header, older captures lack sample_interval.
+CAPTURE_RECORD_FIELDS = [
+    ("timestamp", "<f8", 0),
+    ("device", "<u4", 8),
+    ("collection_latency", "<f4", 12),
+    ("current_socket_power", "<f4", 16),
+    ("gfx_activity", "<f4", 20),
+    ("umc_activity", "<f4", 24),
+    ("sample_interval", "<f4", 28),
+    *[
+        (field, "<f8", 32 + 8 * position)
+        for position, field in enumerate(UTILIZATION_FIELDS.values())
+    ],
+]
+
+
+def is_binary_capture(path: str) -> bool:
+    with open(path, "rb") as stream:
+        return stream.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC
+
+
+class CaptureWriter:
+    """
+    Writes samples to an append-only binary capture: a self-describing header
+    followed by one 64 byte record per device and sample, about a fifth of the
+    size of the NDJSON stream. Records are written and flushed one tick at a
+    time, so a capture cut short by a crash stays readable up to the last
+    complete record.
+    """
+
+    def __init__(
+        self, path: str, asic_info: Dict[int, Dict[str, Any]], metadata: Dict[str, Any]
+    ) -> None:
+        header = {
+            "version": CAPTURE_VERSION,
+            "record_struct": CAPTURE_RECORD.format,
+            "record_size": CAPTURE_RECORD.size,
+            "record_fields": CAPTURE_RECORD_FIELDS,
+            "devices": {str(index): info for index, info in asic_info.items()},
+            "hostname": socket.gethostname(),
+            "created": time.time(),
+            **metadata,
+        }
+        body = json.dumps(header, default=str).encode("utf-8")
+        body += b" " * (-(CAPTURE_PREFIX.size + len(body)) % 8)
+        self.stream = open(path, "wb")
+        self.stream.write(
+            CAPTURE_PREFIX.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0, len(body)) + body
+        )
+        self.stream.flush()
+
+    @staticmethod
+    def pack(device_index: int, data: GpuData) -> bytes:
+        utilization = data["utilization"]
+        return CAPTURE_RECORD.pack(
+            data["timestamp"],
+            device_index,
+            data["collection_latency"],
+            data["power_measure"]["current_socket_power"],
+            data["gpu_activity"]["gfx_activity"],
+            data["gpu_activity"]["umc_activity"],
+            data["sample_interval"],
+            *[utilization[counter] for counter in UTILIZATION_COUNTERS],  # type: ignore[literal-required]
+        )
+
+    def write_tick(self, samples: Dict[int, GpuData]) -> None:
+        self.stream.write(
+            b"".join(self.pack(index, data) for index, data in samples.items())
+        )
+        self.stream.flush()
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+class CaptureReader:
+    """
+    Memory-mapped reader of a binary capture. Records are decoded in chunks
+    straight from the mapping, so reading a capture of any size takes
+    bounded memory.
+    """
+
+    CHUNK_RECORDS = 65536
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            magic, version, _, header_length = CAPTURE_PREFIX.unpack(
+                self.file.read(CAPTURE_PREFIX.size)
+            )
+            if magic != CAPTURE_MAGIC:
+                raise ValueError(f"{path} is not a GPU capture file")
+            if version > CAPTURE_VERSION:
+                raise ValueError(f"{path} has unsupported format version {version}")
+            self.header = json.loads(self.file.read(header_length))
+        except (struct.error, ValueError):
+            self.file.close()
+            raise
+
+        self.record = struct.Struct(self.header["record_struct"])
+        self.fields = [name for name, _, _ in self.header["record_fields"]]
+        self.data_offset = CAPTURE_PREFIX.size + header_length
+        size = os.fstat(self.file.fileno()).st_size
+        # A trailing partial record (eg: after a crash) is ignored
+        self.count = max(size - self.data_offset, 0) // self.record.size
+        self.mmap: Optional[mmap.mmap] = None
+        if self.count:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def asic_info(self, device: int) -> Optional[Dict[str, Any]]:
+        return self.header.get("devices", {}).get(str(device))
+
+    def records(
+        self, start: int = 0, stop: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yields records start..stop as flat dicts (see SAMPLE_FIELDS)."""
+        stop = self.count if stop is None else min(stop, self.count)
+        fields = self.fields
+        for chunk_start in range(start, stop, self.CHUNK_RECORDS):
+            chunk_stop = min(chunk_start + self.CHUNK_RECORDS, stop)
+            first = self.data_offset + chunk_start * self.record.size
+            last = self.data_offset + chunk_stop * self.record.size
+            with memoryview(self.mmap)[first:last] as view:  # type: ignore[arg-type]
+                for values in self.record.iter_unpack(view):
+                    yield dict(zip(fields, values))
+
+    def close(self) -> None:
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.file.close()
+
+
+class SampleRing:
+    """
+    Fixed-capacity columnar store for the samples of one device.
+
+    Every metric in SAMPLE_FIELDS (bar the device index) lives in its own
+    preallocated array of doubles, written in place as a ring buffer, so
+    memory stays constant however long the run is and no per-sample objects
+    are retained. Statistics work on whole columns at once, through numpy
+    when it is installed and through the array builtins otherwise.
+    """
+
+    FIELDS = [field for field in SAMPLE_FIELDS if field != "device"]
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(capacity, 1)
+        self.columns = {
+            name: array("d", bytes(8 * self.capacity)) for name in self.FIELDS
+        }
+        self.next = 0  # Slot written by the next append
+        self.count = 0
+        self.total = 0  # Samples ever appended, sample i lives in slot i % capacity
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, data: GpuData) -> None:
+        slot = self.next
+        columns = self.columns
+        columns["timestamp"][slot] = data["timestamp"]
+        columns["current_socket_power"][slot] = data["power_measure"][
+            "current_socket_power"
+        ]
+        columns["gfx_activity"][slot] = data["gpu_activity"]["gfx_activity"]
+        columns["umc_activity"][slot] = data["gpu_activity"]["umc_activity"]
+        utilization = data["utilization"]
+        for counter, field in UTILIZATION_FIELDS.items():
+            columns[field][slot] = utilization[counter]  # type: ignore[literal-required]
+        columns["collection_latency"][slot] = data["collection_latency"]
+        columns["sample_interval"][slot] = data["sample_interval"]
+        self.next = (slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def latest(self, name: str, back: int = 0) -> float:
+        """Returns the value `back` samples before the most recent one."""
+        return self.columns[name][(self.next - 1 - back) % self.capacity]
+
+    def column(self, name: str) -> Any:
+        """Returns the stored values of a metric in chronological order."""
+        column = self.columns[name]
+        count, head = self.count, self.next
+        if count < self.capacity:
+            values = column[:count]
+        else:
+            values = column[head:] + column[:head]
+        if numpy is not None:
+            return numpy.frombuffer(values, dtype=numpy.float64)
+        return values
+
+    @staticmethod
+    def finite(values: Any) -> Any:
+        """Drops the NaN placeholders of counters a sample did not report."""
+        if numpy is not None:
+            return values[~numpy.isnan(values)]
+        return [v for v in values if v == v]
+
+    def min(self, name: str) -> float:
+        values = self.finite(self.column(name))
+        return float(min(values)) if len(values) else math.nan
+
+    def max(self, name: str) -> float:
+        values = self.finite(self.column(name))
+        return float(max(values)) if len(values) else math.nan
+
+    def mean(self, name: str) -> float:
+        values = self.finite(self.column(name))
+        return float(sum(values)) / len(values) if len(values) else math.nan
+
+    def percentile(self, name: str, q: float) -> float:
+        """Linearly interpolated percentile, q in [0, 100]."""
+        values = self.finite(self.column(name))
+        if not len(values):
+            return math.nan
+        if numpy is not None:
+            return float(numpy.percentile(values, q))
+        ordered = sorted(values)
+        rank = (len(ordered) - 1) * q / 100
+        low = math.floor(rank)
+        high = math.ceil(rank)
+        return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+    def count_above(self, name: str, threshold: float) -> int:
+        values = self.column(name)
+        if numpy is not None:
+            return int(numpy.count_nonzero(values > threshold))
+        return sum(1 for v in values if v > threshold)
+
+
+class QuantileSketch:
+    """
+    Quantile sketch with bounded relative error (DDSketch style).
+
+    Values are counted in logarithmically sized buckets, so any quantile is
+    within `relative_accuracy` of the exact value while memory only grows
+    with the log of the value range.
+    """
+
+    def __init__(
+        self, relative_accuracy: float = StatisticsSettings.SKETCH_RELATIVE_ACCURACY
+    ) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value > 0:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < 0:
+            key = math.ceil(math.log(-value) / self.log_gamma)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zero_count += 1
+
+    def bucket_value(self, key: int) -> float:
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """Returns the q-th percentile, q in [0, 100]."""
+        if not self.count:
+            return math.nan
+        rank = q / 100 * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self.bucket_value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self.bucket_value(key)
+        return self.bucket_value(max(self.positive))
+
+
+class RunningStats:
+    """
+    Single-pass statistics of one metric: count, min, max, mean and variance
+    (Welford's algorithm) plus a quantile sketch for percentiles. NaN values
+    (counters a sample did not report) are skipped.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sketch = QuantileSketch()
+
+    def update(self, value: float) -> None:
+        if value != value:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sketch.add(value)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def percentile(self, q: float) -> float:
+        """Sketch estimate of the q-th percentile, clamped to the observed range."""
+        if not self.count:
+            return math.nan
+        return min(max(self.sketch.quantile(q), self.min), self.max)
+
+
+class SampleSummary:
+    """
+    Whole-run summary of one device, updated once per sample: a RunningStats
+    per metric, the share of samples and of time with graphics activity and
+    the energy used, integrated from socket power over the sample timestamps
+    with the trapezoidal rule. Unlike the SampleRing it covers every sample
+    of the run in constant memory. Time based figures stay right when the
+    sampling interval varies (adaptive sampling), sample counts do not.
+    """
+
+    METRICS = [field for field in SampleRing.FIELDS if field != "timestamp"]
+
+    def __init__(self) -> None:
+        self.stats = {name: RunningStats() for name in self.METRICS}
+        self.active_samples = 0
+        self.active_time = 0.0  # Seconds from an active sample to the next
+        self.energy = 0.0  # Joules
+        self.first_timestamp = math.nan
+        self.last_timestamp = math.nan
+        self.last_power = math.nan
+        self.last_active = False
+
+    @property
+    def count(self) -> int:
+        return self.stats["current_socket_power"].count
+
+    @property
+    def elapsed(self) -> float:
+        if not self.count:
+            return 0.0
+        return self.last_timestamp - self.first_timestamp
+
+    @property
+    def active_share(self) -> float:
+        """Percentage of the time with graphics activity, of the samples if untimed."""
+        if self.elapsed > 0:
+            return self.active_time / self.elapsed * 100
+        return self.active_samples / self.count * 100 if self.count else math.nan
+
+    def update(self, data: GpuData) -> None:
+        self.update_record(flatten_sample(0, data))
+
+    def update_record(self, record: Dict[str, Any]) -> None:
+        for name, stats in self.stats.items():
+            stats.update(record.get(name, math.nan))
+        active = record["gfx_activity"] > 0
+        if active:
+            self.active_samples += 1
+
+        timestamp = record["timestamp"]
+        power = record["current_socket_power"]
+        if self.last_timestamp == self.last_timestamp:
+            step = timestamp - self.last_timestamp
+            self.energy += (self.last_power + power) / 2 * step
+            if self.last_active:
+                self.active_time += step
+        else:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+        self.last_power = power
+        self.last_active = active
 
 
-def analyze_gpu_activity(
-    data_points: List[GpuData], initial_data: GpuData
-) -> List[Tuple[int, int, float]]:
+class MonitorProfiler:
     """
-    Analyzes GPU activity patterns over time to identify active intervals.
-    Uses thresholds for core usage, memory usage, and power consumption to detect activity.
-    Returns list of tuples containing (start_index, end_index, max_utilization) for each active period.
+    Self-profiling of the monitor, to pick sampling rates that do not steal
+    cycles from the workloads on the node. Keeps the latency distribution of
+    every amdsmi call (RunningStats, whose sketch is a log-bucketed
+    histogram), the wall and process CPU time of every tick, split between
+    collection and output (stream, capture and exporter), and the time spent
+    rendering the final report. Calls are recorded from the collection
+    workers, so updates go through a lock.
     """
-    active_intervals = []
-    current_interval_start = None
-    inactive_count = 0
 
-    # Get baseline power
-    baseline_power = initial_data["power_measure"]["current_socket_power"]
+    CALLS = ["get_power_info", "get_gpu_activity", "get_utilization_count"]
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.calls = {name: RunningStats() for name in self.CALLS}
+        self.call_errors = {name: 0 for name in self.CALLS}
+        self.tick_wall = RunningStats()
+        self.tick_cpu = RunningStats()
+        self.collect_wall = RunningStats()
+        self.output_wall = RunningStats()
+        self.report_wall = 0.0
+        self.report_cpu = 0.0
+        self.start_wall = time.monotonic()
+        self.start_cpu = time.process_time()
+
+    def record_call(self, name: str, seconds: float, failed: bool = False) -> None:
+        with self.lock:
+            self.calls[name].update(seconds)
+            if failed:
+                self.call_errors[name] += 1
+
+    def record_tick(self, wall: float, cpu: float, collected: float) -> None:
+        """Records a tick that started at the given perf_counter and process_time."""
+        now = time.perf_counter()
+        with self.lock:
+            self.tick_wall.update(now - wall)
+            self.tick_cpu.update(time.process_time() - cpu)
+            self.collect_wall.update(collected - wall)
+            self.output_wall.update(now - collected)
+
+    @contextlib.contextmanager
+    def report(self) -> Iterator[None]:
+        """Measures the formatting and printing of the final report."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.report_wall += time.perf_counter() - wall
+            self.report_cpu += time.process_time() - cpu
+
+    @property
+    def cpu_seconds(self) -> float:
+        return time.process_time() - self.start_cpu
+
+    @property
+    def wall_seconds(self) -> float:
+        return time.monotonic() - self.start_wall
+
+
+class ProfilingBackend(GpuBackend):
+    """Backend wrapper timing every amdsmi call of the wrapped backend."""
+
+    def __init__(self, backend: GpuBackend, profiler: MonitorProfiler) -> None:
+        self.backend = backend
+        self.profiler = profiler
+        self.name = backend.name
+
+    def timed(self, name: str, function: Any, *args: Any) -> Any:
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = function(*args)
+            failed = False
+            return result
+        finally:
+            self.profiler.record_call(name, time.perf_counter() - started, failed)
+
+    def init(self) -> None:
+        self.backend.init()
+
+    def shut_down(self) -> None:
+        self.backend.shut_down()
+
+    def begin_tick(self) -> None:
+        self.backend.begin_tick()
+
+    def timestamp(self) -> float:
+        return self.backend.timestamp()
+
+    def get_processor_handles(self) -> List[Any]:
+        return self.backend.get_processor_handles()
+
+    def get_power_info(self, device: Any) -> Dict[str, Any]:
+        return self.timed("get_power_info", self.backend.get_power_info, device)
+
+    def get_gpu_activity(self, device: Any) -> Dict[str, Any]:
+        return self.timed("get_gpu_activity", self.backend.get_gpu_activity, device)
+
+    def get_utilization_count(
+        self, device: Any, counters: List[str]
+    ) -> List[Dict[str, Any]]:
+        return self.timed(
+            "get_utilization_count",
+            self.backend.get_utilization_count,
+            device,
+            counters,
+        )
 
-    for i, point in enumerate(data_points):
-        core_use = point["gpu_activity"]["gfx_activity"]
-        mem_use = point["gpu_activity"]["umc_activity"]
-        power = point["power_measure"]["current_socket_power"]
+    def get_gpu_asic_info(self, device: Any) -> Dict[str, Any]:
+        return self.backend.get_gpu_asic_info(device)
+
+
+# Prometheus metric families exported per device: (name, type, help, field)
+PROMETHEUS_METRICS = [
+    (
+        "amd_gpu_socket_power_watts",
+        "gauge",
+        "Current socket power in watts",
+        "current_socket_power",
+    ),
+    (
+        "amd_gpu_gfx_activity_percent",
+        "gauge",
+        "Graphics engine activity in percent",
+        "gfx_activity",
+    ),
+    (
+        "amd_gpu_umc_activity_percent",
+        "gauge",
+        "Memory controller activity in percent",
+        "umc_activity",
+    ),
+    *[
+        (
+            f"amd_gpu_{counter.lower()}_total",
+            "counter",
+            f"Accumulated {counter} utilization counter",
+            counter.lower(),
+        )
+        for counter in UTILIZATION_COUNTERS
+    ],
+    (
+        "amd_gpu_collection_latency_seconds",
+        "gauge",
+        "Time spent in amdsmi calls for the last sample",
+        "collection_latency",
+    ),
+    (
+        "amd_gpu_sample_interval_seconds",
+        "gauge",
+        "Sampling interval the last sample was taken at",
+        "sample_interval",
+    ),
+    (
+        "amd_gpu_last_sample_timestamp_seconds",
+        "gauge",
+        "Wall clock time of the last sample",
+        "timestamp",
+    ),
+]
+
+
+def render_prometheus_metrics(
+    latest: Dict[int, GpuData],
+    scheduler: "FixedRateScheduler",
+    profiler: Optional[MonitorProfiler] = None,
+) -> str:
+    """
+    Renders the latest sample of every device in the Prometheus text format,
+    followed by the overhead of the monitor when it is profiled.
+    """
+    records = [flatten_sample(index, data) for index, data in sorted(latest.items())]
+    lines = []
+    for name, metric_type, help_text, field in PROMETHEUS_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for record in records:
+            if field in record:
+                lines.append(f'{name}{{device="{record["device"]}"}} {record[field]}')
+    lines.append(
+        "# HELP amd_gpu_monitor_missed_deadlines_total Sampling deadlines missed"
+    )
+    lines.append("# TYPE amd_gpu_monitor_missed_deadlines_total counter")
+    lines.append(f"amd_gpu_monitor_missed_deadlines_total {scheduler.missed}")
+    if profiler is not None:
+        lines.extend(render_profiler_metrics(profiler))
+    return "\n".join(lines) + "\n"
+
+
+def render_summary_metric(
+    name: str, help_text: str, series: Dict[str, RunningStats], label: str
+) -> List[str]:
+    """Renders RunningStats as a Prometheus summary, one series per label value."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+    for value, stats in series.items():
+        selector = f'{label}="{value}"'
+        for q in StatisticsSettings.REPORT_PERCENTILES:
+            if stats.count:
+                lines.append(
+                    f'{name}{{{selector},quantile="{q / 100}"}} {stats.percentile(q)}'
+                )
+        lines.append(f"{name}_sum{{{selector}}} {stats.mean * stats.count}")
+        lines.append(f"{name}_count{{{selector}}} {stats.count}")
+    return lines
+
+
+def render_profiler_metrics(profiler: MonitorProfiler) -> List[str]:
+    with profiler.lock:
+        lines = render_summary_metric(
+            "amd_gpu_monitor_amdsmi_call_seconds",
+            "Latency of the amdsmi calls of the monitor",
+            profiler.calls,
+            "call",
+        )
+        lines.extend(
+            render_summary_metric(
+                "amd_gpu_monitor_tick_seconds",
+                "Wall and process CPU time of a sampling tick",
+                {"wall": profiler.tick_wall, "cpu": profiler.tick_cpu},
+                "clock",
+            )
+        )
+    lines.append(
+        "# HELP amd_gpu_monitor_cpu_seconds_total CPU time used by the monitor"
+    )
+    lines.append("# TYPE amd_gpu_monitor_cpu_seconds_total counter")
+    lines.append(f"amd_gpu_monitor_cpu_seconds_total {profiler.cpu_seconds}")
+    return lines
+
+
+class PrometheusExporter:
+    """
+    Serves /metrics from a background HTTP server. The collection loop
+    publishes a pre-rendered snapshot after every tick and scrapes only
+    return that cached snapshot, so a scrape never waits on amdsmi.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(
+        self, address: str, port: int, profiler: Optional[MonitorProfiler] = None
+    ) -> None:
+        self.lock = threading.Lock()
+        self.latest: Dict[int, GpuData] = {}
+        self.snapshot = b""
+        self.profiler = profiler
+
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                with exporter.lock:
+                    body = exporter.snapshot
+                self.send_response(200)
+                self.send_header("Content-Type", PrometheusExporter.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass  # Keep scrapes out of the monitor output
+
+        self.server = ThreadingHTTPServer((address, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def publish(
+        self, samples: Dict[int, GpuData], scheduler: "FixedRateScheduler"
+    ) -> None:
+        """Renders a new snapshot, devices missing from this tick keep their last sample."""
+        self.latest.update(samples)
+        body = render_prometheus_metrics(self.latest, scheduler, self.profiler).encode(
+            "utf-8"
+        )
+        with self.lock:
+            self.snapshot = body
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def parse_device_selection(spec: str, device_count: int) -> List[int]:
+    """
+    Parses a --devices specification into a sorted list of device indices.
+    Accepts "all" or a comma-separated list of indices (eg: "0,2,5").
+    Raises ValueError on malformed or out-of-range indices.
+    """
+    if spec.strip().lower() == "all":
+        return list(range(device_count))
+
+    indices = set()
+    for token in spec.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        index = int(token)
+        if index < 0 or index >= device_count:
+            raise ValueError(
+                f"device index {index} out of range (found {device_count} GPUs)"
+            )
+        indices.add(index)
+
+    if not indices:
+        raise ValueError("no devices selected")
+    return sorted(indices)
+
+
+def collect_devices_data(
+    backend: GpuBackend, devices: Dict[int, Any]
+) -> Dict[int, GpuData]:
+    """
+    Collects one sample from every selected device in the same tick.
+    Devices whose query fails are reported and left out of this tick so a
+    single misbehaving GPU does not cost the samples of the others.
+    """
+    backend.begin_tick()
+    samples: Dict[int, GpuData] = {}
+    for index, device in devices.items():
+        try:
+            samples[index] = collect_gpu_data(backend, device)
+        except AmdSmiException as e:
+            print(f"Error collecting GPU {index} data: {e}")
+    return samples
+
+
+class DaemonThreadPool:
+    """
+    Minimal thread pool whose workers are daemon threads. Unlike
+    concurrent.futures.ThreadPoolExecutor, whose workers are joined at
+    interpreter exit, a worker stuck in a hung amdsmi call can not keep the
+    monitor from exiting.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.tasks: Any = queue.SimpleQueue()
+        self.threads = [
+            threading.Thread(target=self.work, name=f"amdsmi-{n}", daemon=True)
+            for n in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, function: Any, *args: Any) -> Future:
+        future: Future = Future()
+        self.tasks.put((future, function, args))
+        return future
+
+    def work(self) -> None:
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            future, function, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self) -> None:
+        """Stops the idle workers, hung ones are abandoned."""
+        for _ in self.threads:
+            self.tasks.put(None)
+
+
+class ConcurrentCollector:
+    """
+    Collects a tick from an asyncio event loop, offloading the blocking
+    amdsmi calls to a thread pool: the power, activity and utilization calls
+    of every device are issued at once, so a tick costs about the slowest
+    call instead of the sum of them all.
+
+    Every call is given SamplingSettings.CALL_TIMEOUT seconds (or the
+    configured timeout) from the start of the tick. A device whose call
+    times out is left out of the tick while the others are sampled as usual,
+    and it is skipped on the following ticks until its hung calls return,
+    so a wedged GPU holds at most three workers. begin_tick() still runs
+    synchronously before any call is issued. With 0 workers the devices are
+    queried serially in the loop thread, without timeouts.
+    """
+
+    def __init__(
+        self,
+        backend: GpuBackend,
+        devices: Dict[int, Any],
+        workers: int,
+        timeout: float = SamplingSettings.CALL_TIMEOUT,
+        profiler: Optional[MonitorProfiler] = None,
+    ) -> None:
+        self.backend = backend
+        self.profiler = profiler
+        self.devices = devices
+        self.timeout = timeout
+        self.pool = DaemonThreadPool(workers) if workers > 0 else None
+        self.loop = asyncio.new_event_loop()
+        self.hung: Dict[int, List[Future]] = {}
+        self.timeouts = {index: 0 for index in devices}
+        self.skipped = {index: 0 for index in devices}
+
+    def collect(self) -> Dict[int, GpuData]:
+        """Collects one tick, blocking until it is complete."""
+        return self.loop.run_until_complete(self.collect_async())
+
+    def run(self, scheduler: FixedRateScheduler, on_tick: Any) -> None:
+        """Collects a tick at every deadline of the scheduler until it ends."""
+        self.loop.run_until_complete(self.run_async(scheduler, on_tick))
+
+    async def run_async(self, scheduler: FixedRateScheduler, on_tick: Any) -> None:
+        while await scheduler.wait_next_async():
+            wall, cpu = time.perf_counter(), time.process_time()
+            samples = await self.collect_async()
+            for data in samples.values():
+                data["sample_interval"] = scheduler.interval
+            collected = time.perf_counter()
+            on_tick(samples)
+            if self.profiler is not None:
+                self.profiler.record_tick(wall, cpu, collected)
+
+    async def collect_async(self) -> Dict[int, GpuData]:
+        if self.pool is None:
+            return collect_devices_data(self.backend, self.devices)
+
+        self.backend.begin_tick()
+        started = time.perf_counter()
+        queries = {}
+        for index, device in self.devices.items():
+            if index in self.hung:
+                if not all(future.done() for future in self.hung[index]):
+                    self.skipped[index] += 1
+                    continue
+                del self.hung[index]
+            queries[index] = self.query(device)
+
+        results = await asyncio.gather(
+            *[
+                self.gather_device(index, timestamp, futures, started)
+                for index, (timestamp, futures) in queries.items()
+            ]
+        )
+        return {index: data for index, data in results if data is not None}
+
+    def query(self, device: Any) -> Tuple[float, List[Future]]:
+        assert self.pool is not None
+        backend = self.backend
+        timestamp = backend.timestamp()
+        futures = [
+            self.pool.submit(backend.get_power_info, device),
+            self.pool.submit(backend.get_gpu_activity, device),
+            self.pool.submit(
+                backend.get_utilization_count, device, UTILIZATION_COUNTERS
+            ),
+        ]
+        return timestamp, futures
+
+    async def gather_device(
+        self, index: int, timestamp: float, futures: List[Future], started: float
+    ) -> Tuple[int, Optional[GpuData]]:
+        waiting = [asyncio.wrap_future(future, loop=self.loop) for future in futures]
+        _, pending = await asyncio.wait(waiting, timeout=self.timeout)
+        if pending:
+            for future in pending:
+                future.cancel()
+            self.timeouts[index] += 1
+            self.hung[index] = futures
+            print(f"Error collecting GPU {index} data: timed out after {self.timeout}s")
+            return index, None
+        try:
+            power_measure, gpu_activity, utilization = [
+                future.result() for future in waiting
+            ]
+        except AmdSmiException as e:
+            print(f"Error collecting GPU {index} data: {e}")
+            return index, None
+        latency = time.perf_counter() - started
+        return index, build_gpu_data(
+            power_measure, gpu_activity, utilization, timestamp, latency
+        )
+
+    def close(self) -> None:
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+        self.loop.close()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+class ActivityDetector:
+    """
+    Incremental detector of GPU activity intervals.
+
+    Samples are fed one at a time and an interval is emitted as soon as it
+    closes, keeping only the running maximum of the open interval, so the
+    cost is O(1) per sample and no history is needed. The same detector
+    drives the end-of-run report and the live/streaming modes.
+    """
+
+    def __init__(
+        self,
+        baseline_power: float,
+        max_intervals: Optional[int] = ActivityThresholds.MAX_TRACKED_INTERVALS,
+    ) -> None:
+        self.baseline_power = baseline_power
+        self.index = 0  # Index of the next sample
+        self.current_start: Optional[int] = None
+        self.current_max = 0.0
+        self.inactive_count = 0
+        self.active_samples = 0
+        self.closed_count = 0
+        self.intervals: Any = deque(maxlen=max_intervals)
+
+    def update(
+        self, core_use: float, mem_use: float, power: float
+    ) -> Optional[Tuple[int, int, float]]:
+        """
+        Feeds one sample. Returns the (start_index, end_index, max_utilization)
+        tuple of an interval closed by this sample, None otherwise.
+        """
+        i = self.index
+        self.index += 1
 
         # Check if GPU shows signs of activity
         is_active = (
             core_use > ActivityThresholds.CORE_USE
             or mem_use > ActivityThresholds.MEM_USE
-            or power > baseline_power + ActivityThresholds.POWER_INCREASE
+            or power > self.baseline_power + ActivityThresholds.POWER_INCREASE
         )
 
         if is_active:
-            inactive_count = 0
-            if current_interval_start is None:
-                current_interval_start = i
+            self.active_samples += 1
+            self.inactive_count = 0
+            if self.current_start is None:
+                self.current_start = i
+                self.current_max = max(core_use, mem_use)
+                return None
         else:
-            inactive_count += 1
+            self.inactive_count += 1
             if (
-                current_interval_start is not None
-                and inactive_count >= ActivityThresholds.MIN_INACTIVE_POINTS
+                self.current_start is not None
+                and self.inactive_count >= ActivityThresholds.MIN_INACTIVE_POINTS
             ):
-                # Calculate max utilization during this interval
-                max_util = max(
-                    max(
-                        point["gpu_activity"]["gfx_activity"]
-                        for point in data_points[current_interval_start:i]
-                    ),
-                    max(
-                        point["gpu_activity"]["umc_activity"]
-                        for point in data_points[current_interval_start:i]
-                    ),
+                closed = (
+                    self.current_start,
+                    i - ActivityThresholds.MIN_INACTIVE_POINTS,
+                    self.current_max,
                 )
-                active_intervals.append(
-                    (
-                        current_interval_start,
-                        i - ActivityThresholds.MIN_INACTIVE_POINTS,
-                        max_util,
-                    )
-                )
-                current_interval_start = None
-
-    # Handle case where GPU is still active at the end
-    if current_interval_start is not None:
-        # Calculate max utilization for the final interval
-        max_util = max(
-            max(
-                point["gpu_activity"]["gfx_activity"]
-                for point in data_points[current_interval_start:]
-            ),
-            max(
-                point["gpu_activity"]["umc_activity"]
-                for point in data_points[current_interval_start:]
-            ),
+                self.record(closed)
+                self.current_start = None
+                return closed
+
+        # Samples up to the closing one count towards the interval maximum
+        if self.current_start is not None:
+            self.current_max = max(self.current_max, core_use, mem_use)
+        return None
+
+    def update_sample(self, data: GpuData) -> Optional[Tuple[int, int, float]]:
+        return self.update(
+            data["gpu_activity"]["gfx_activity"],
+            data["gpu_activity"]["umc_activity"],
+            data["power_measure"]["current_socket_power"],
         )
-        active_intervals.append(
-            (current_interval_start, len(data_points) - 1, max_util)
+
+    def finish(self) -> Optional[Tuple[int, int, float]]:
+        """Closes the interval still open at the end of the samples, if any."""
+        if self.current_start is None:
+            return None
+        closed = (self.current_start, self.index - 1, self.current_max)
+        self.record(closed)
+        self.current_start = None
+        return closed
+
+    def record(self, interval: Tuple[int, int, float]) -> None:
+        self.intervals.append(interval)
+        self.closed_count += 1
+
+
+class AdaptiveSampler:
+    """
+    Drives the scheduler between two rates with the activity detectors:
+    the idle interval while every device is below the ActivityThresholds,
+    the active interval from the first sample of a device crossing them
+    until every device has been inactive for SamplingSettings.ADAPTIVE_HOLD
+    samples, so the tail of a burst is still sampled at the high rate. A
+    burst starting while idle is picked up at most one idle interval late.
+    """
+
+    def __init__(
+        self,
+        scheduler: FixedRateScheduler,
+        active_interval: float,
+        idle_interval: float,
+    ) -> None:
+        self.scheduler = scheduler
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.active_ticks = 0
+        self.idle_ticks = 0
+        self.switches = 0
+        self.active_time = 0.0  # Seconds sampled at the active interval
+
+    def update(self, detectors: Dict[int, ActivityDetector]) -> None:
+        """Accounts the tick just taken and picks the interval of the next one."""
+        scheduler = self.scheduler
+        if scheduler.interval == self.active_interval:
+            self.active_ticks += 1
+            self.active_time += scheduler.interval
+        else:
+            self.idle_ticks += 1
+
+        busy = any(
+            detector.inactive_count < SamplingSettings.ADAPTIVE_HOLD
+            for detector in detectors.values()
         )
+        interval = self.active_interval if busy else self.idle_interval
+        if interval != scheduler.interval:
+            self.switches += 1
+            scheduler.set_interval(interval)
+
+
+class RollingWindow:
+    """
+    Statistics of the samples of a SampleRing taken over the last `seconds`,
+    updated incrementally after every append: the window is a range of
+    absolute sample indices into the ring, with running sums and monotonic
+    max queues for the gauges, so a tick costs O(1) amortized however many
+    samples the window holds. Counters are accumulating, their figure is the
+    rate between the first and last sample of the window. The ring should
+    hold the whole window: samples overwritten before they leave it are
+    dropped from the window early, at the cost of a rebuild.
+    """
+
+    GAUGES = ["current_socket_power", "gfx_activity", "umc_activity"]
+    COUNTERS = list(UTILIZATION_FIELDS.values())
 
-    return active_intervals
+    def __init__(self, ring: SampleRing, seconds: float) -> None:
+        self.ring = ring
+        self.seconds = seconds
+        self.start = ring.total  # Absolute index of the oldest sample in the window
+        self.sums = {name: 0.0 for name in self.GAUGES}
+        self.maxima: Dict[str, Any] = {name: deque() for name in self.GAUGES}
+
+    def value(self, name: str, index: int) -> float:
+        return self.ring.columns[name][index % self.ring.capacity]
+
+    def push(self) -> None:
+        """Adds the sample just appended to the ring and evicts the expired ones."""
+        end = self.ring.total - 1
+        if self.start < self.ring.total - len(self.ring):
+            self.rebuild(self.ring.total - len(self.ring))
+        else:
+            for name in self.GAUGES:
+                self.add(name, end)
+
+        cutoff = self.value("timestamp", end) - self.seconds
+        while self.start < end and self.value("timestamp", self.start) < cutoff:
+            for name in self.GAUGES:
+                self.sums[name] -= self.value(name, self.start)
+                if self.maxima[name][0] == self.start:
+                    self.maxima[name].popleft()
+            self.start += 1
+
+    def add(self, name: str, index: int) -> None:
+        value = self.value(name, index)
+        self.sums[name] += value
+        maxima = self.maxima[name]
+        while maxima and self.value(name, maxima[-1]) <= value:
+            maxima.pop()
+        maxima.append(index)
+
+    def rebuild(self, start: int) -> None:
+        """Recomputes the window from `start` to the latest sample."""
+        self.start = start
+        for name in self.GAUGES:
+            self.sums[name] = 0.0
+            self.maxima[name].clear()
+            for index in range(start, self.ring.total):
+                self.add(name, index)
+
+    def __len__(self) -> int:
+        return self.ring.total - self.start
+
+    def mean(self, name: str) -> float:
+        return self.sums[name] / len(self) if len(self) else math.nan
+
+    def max(self, name: str) -> float:
+        maxima = self.maxima[name]
+        return self.value(name, maxima[0]) if maxima else math.nan
+
+    def rate(self, name: str) -> float:
+        """Per second increase of a counter over the window."""
+        end = self.ring.total - 1
+        span = self.value("timestamp", end) - self.value("timestamp", self.start)
+        if len(self) < 2 or span <= 0:
+            return math.nan
+        return (self.value(name, end) - self.value(name, self.start)) / span
+
+
+# Rows of the live view: (label, field, is_percentage, is_counter)
+LIVE_METRICS = [
+    ("Power Usage (W)", "current_socket_power", False, False),
+    ("GPU Activity (%)", "gfx_activity", True, False),
+    ("Memory Activity (%)", "umc_activity", True, False),
+    ("Coarse GFX Activity/s", "coarse_grain_gfx_activity", False, True),
+    ("Coarse Memory Activity/s", "coarse_grain_mem_activity", False, True),
+    ("Fine GFX Activity/s", "fine_grain_gfx_activity", False, True),
+    ("Fine Memory Activity/s", "fine_grain_mem_activity", False, True),
+]
+
+
+class LiveDashboard:
+    """
+    Live terminal view of the run: after every tick it updates a rolling
+    window per device and DisplaySettings.LIVE_WINDOWS entry and, at most
+    every DisplaySettings.LIVE_REFRESH seconds, redraws the tables in place
+    with a single write. Gauges show the window mean and, in parentheses,
+    the window max, counters their rate.
+    """
+
+    CLEAR = "\x1b[H\x1b[2J"  # Cursor home and clear screen
+
+    def __init__(
+        self,
+        series: Dict[int, SampleRing],
+        scheduler: FixedRateScheduler,
+        stream: Any = None,
+    ) -> None:
+        self.series = series
+        self.scheduler = scheduler
+        self.stream = stream if stream is not None else sys.stdout
+        self.windows = {
+            index: [
+                RollingWindow(ring, seconds) for seconds in DisplaySettings.LIVE_WINDOWS
+            ]
+            for index, ring in series.items()
+        }
+        self.last_draw = -math.inf
+
+    @staticmethod
+    def window_label(seconds: float) -> str:
+        return f"{seconds // 60:g}m" if seconds >= 60 else f"{seconds:g}s"
+
+    def update(self, samples: Dict[int, GpuData]) -> None:
+        for index in samples:
+            for window in self.windows[index]:
+                window.push()
+        now = time.monotonic()
+        if now - self.last_draw >= DisplaySettings.LIVE_REFRESH:
+            self.last_draw = now
+            self.draw()
+
+    def draw(self) -> None:
+        headers = [
+            "Metric",
+            "Current",
+            *[self.window_label(s) for s in DisplaySettings.LIVE_WINDOWS],
+        ]
+        buffer = io.StringIO()
+        with contextlib.redirect_stdout(buffer):
+            elapsed = time.monotonic() - self.scheduler.start
+            print(
+                f"Elapsed {elapsed:.0f}s, interval {self.scheduler.interval}s, "
+                f"{self.scheduler.fired} ticks, {self.scheduler.missed} missed"
+            )
+            for index, ring in sorted(self.series.items()):
+                if not len(ring):
+                    continue
+                rows = []
+                for label, name, is_percentage, is_counter in LIVE_METRICS:
+                    row = [label]
+                    if is_counter:
+                        row.append(format_number(latest_rate(ring, name)))
+                        row.extend(
+                            format_number(window.rate(name))
+                            for window in self.windows[index]
+                        )
+                    else:
+                        row.append(format_number(ring.latest(name), is_percentage))
+                        row.extend(
+                            f"{format_number(window.mean(name), is_percentage)} "
+                            f"({format_number(window.max(name), is_percentage)})"
+                            for window in self.windows[index]
+                        )
+                    rows.append(row)
+                print()
+                print_table(f"GPU {index}", headers, rows)
+        self.stream.write(self.CLEAR + buffer.getvalue())
+        self.stream.flush()
+
+
+def latest_rate(ring: SampleRing, name: str) -> float:
+    """Per second increase of a counter between the last two samples."""
+    if len(ring) < 2:
+        return math.nan
+    span = ring.latest("timestamp") - ring.latest("timestamp", 1)
+    if span <= 0:
+        return math.nan
+    return (ring.latest(name) - ring.latest(name, 1)) / span
 
 
 def display_asic_and_deltas(
-    device: Any,
+    asic_info: Dict[str, Any],
     initial_data: GpuData,
-    data_points: List[GpuData],
-    interval: int,
+    samples: SampleRing,
+    interval: Union[float, str],
     duration: int,
+    detector: Optional[ActivityDetector] = None,
+    summary: Optional[SampleSummary] = None,
 ) -> None:
     """
     Displays comprehensive GPU metrics in formatted tables, including:
@@ -322,9 +2156,12 @@ def display_asic_and_deltas(
     - Activity analysis
 
     All metrics show deltas from previous measurements and min-max ranges.
+    When a whole-run summary is given the ranges, the distribution table and
+    the energy figures cover every sample, not only the stored ones.
     """
+    stats = summary.stats if summary is not None else {}
+
     # Display ASIC INFO first
-    asic_info = amdsmi_get_gpu_asic_info(device)
     asic_data = [
         ["Market Name", asic_info["market_name"]],
         ["Vendor ID", asic_info["vendor_id"]],
@@ -334,62 +2171,26 @@ def display_asic_and_deltas(
         ["VBIOS Version", asic_info["vbios_version"]],
     ]
 
+    record_table("GPU Hardware Information", ["Property", "Value"], asic_data)
     print("\nGPU Hardware Information:")
     print("-" * 50)
-    for label, value in asic_data:
-        print(f"{label:20s}: {value}")
-
-    # Initialize tracking lists for min/max calculations
-    power_values: List[float] = []
-    activity_values: List[float] = []
-    coarse_gfx_values: List[float] = []
-    coarse_mem_values: List[float] = []
-    fine_gfx_values: List[float] = []
-    fine_mem_values: List[float] = []
-
-    # Process each data point and calculate metrics
-    previous_data = None
-    for data in data_points:
-        # Format power data
-        power_metrics, power_range = format_power_data(
-            data, previous_data, power_values
-        )
+    print("\n".join(f"{label:20s}: {value}" for label, value in asic_data))
 
-        # Format activity data
-        activity_metrics, activity_range = format_activity_data(
-            data, previous_data, activity_values
-        )
-
-        # Format utilization data for each counter type
-        coarse_gfx_metrics, coarse_gfx_range = format_utilization_data(
-            data,
-            previous_data,
-            "COARSE_GRAIN_GFX_ACTIVITY",
-            coarse_gfx_values,
-        )
-
-        coarse_mem_metrics, coarse_mem_range = format_utilization_data(
-            data,
-            previous_data,
-            "COARSE_GRAIN_MEM_ACTIVITY",
-            coarse_mem_values,
-        )
-
-        fine_gfx_metrics, fine_gfx_range = format_utilization_data(
-            data,
-            previous_data,
-            "FINE_GRAIN_GFX_ACTIVITY",
-            fine_gfx_values,
-        )
-
-        fine_mem_metrics, fine_mem_range = format_utilization_data(
-            data,
-            previous_data,
-            "FINE_GRAIN_MEM_ACTIVITY",
-            fine_mem_values,
-        )
-
-        previous_data = data
+    # Format each metric from its column in the sample store
+    power_metrics, power_range = format_power_data(samples, stats)
+    activity_metrics, activity_range = format_activity_data(samples, stats)
+    coarse_gfx_metrics, coarse_gfx_range = format_utilization_data(
+        samples, "COARSE_GRAIN_GFX_ACTIVITY", stats
+    )
+    coarse_mem_metrics, coarse_mem_range = format_utilization_data(
+        samples, "COARSE_GRAIN_MEM_ACTIVITY", stats
+    )
+    fine_gfx_metrics, fine_gfx_range = format_utilization_data(
+        samples, "FINE_GRAIN_GFX_ACTIVITY", stats
+    )
+    fine_mem_metrics, fine_mem_range = format_utilization_data(
+        samples, "FINE_GRAIN_MEM_ACTIVITY", stats
+    )
 
     # Display formatted metrics
     print(f"\nMetrics collected over {duration} seconds ({interval}s intervals):")
@@ -406,101 +2207,396 @@ def display_asic_and_deltas(
 
     headers = ["Metric", "Current", "Delta", "Min-Max Range", "Range Value"]
     col_widths = [25, 15, 15, 20, 15]
+    record_table("Metrics", headers, metrics_data)
 
-    # Print headers
-    header_row = "".join(f"{h:<{w}}" for h, w in zip(headers, col_widths))
-    print(header_row)
-    print("-" * sum(col_widths))
+    # Print headers and metrics through one fixed-width row template
+    template = "".join(f"{{:<{w}}}" for w in col_widths)
+    print(
+        "\n".join(
+            [
+                template.format(*headers),
+                "-" * sum(col_widths),
+                *[template.format(*map(str, row)) for row in metrics_data],
+            ]
+        )
+    )
 
-    # Print metrics
-    for row in metrics_data:
-        formatted_row = "".join(f"{str(cell):<{w}}" for cell, w in zip(row, col_widths))
-        print(formatted_row)
+    if summary is not None:
+        display_summary_statistics(summary)
 
     # Activity Analysis
     print("\nActivity Analysis:")
     print("-" * 50)
 
     # Calculate percentage of time GPU was active
-    active_samples = sum(1 for v in activity_values if float(v) > 0)
-    total_samples = len(activity_values)
-    active_percentage = (
-        (active_samples / total_samples * 100) if total_samples > 0 else 0
-    )
+    if summary is not None:
+        total_samples = summary.count
+        active_percentage = summary.active_share if total_samples > 0 else 0
+    else:
+        active_samples = samples.count_above("gfx_activity", 0)
+        total_samples = len(samples)
+        active_percentage = (
+            (active_samples / total_samples * 100) if total_samples > 0 else 0
+        )
 
     print(f"GPU Active: {format_number(active_percentage, True)} of the time")
     print(f"Total Samples: {total_samples}")
+
+    if detector is not None:
+        print(f"Active Intervals: {detector.closed_count}")
+        if detector.index:
+            busy = detector.active_samples / detector.index * 100
+            print(f"Samples Above Thresholds: {format_number(busy, True)}")
+        shown = DisplaySettings.MAX_INTERVALS_SHOWN
+        recent = list(detector.intervals)[-shown:]
+        if recent:
+            print_table(
+                "Most Recent Active Intervals",
+                ["Start Sample", "End Sample", "Samples", "Max Utilization"],
+                [
+                    [start, end, end - start + 1, format_number(max_util, True)]
+                    for start, end, max_util in recent
+                ],
+            )
     print()  # Blank line after analysis section
 
 
-def format_activity_data(
-    current_data: GpuData,
-    previous_data: Optional[GpuData],
-    activity_values: List[float],
-) -> Tuple[List[str], str]:
-    """Format GPU activity data with deltas and trends."""
-    current_activity = float(current_data["gpu_activity"]["gfx_activity"])
-    activity_values.append(current_activity)
+# Metrics of the summary statistics table: (label, field, is_percentage)
+SUMMARY_METRICS = [
+    ("Power Usage (W)", "current_socket_power", False),
+    ("GPU Activity (%)", "gfx_activity", True),
+    ("Memory Activity (%)", "umc_activity", True),
+    ("Coarse GFX Activity", "coarse_grain_gfx_activity", False),
+    ("Coarse Memory Activity", "coarse_grain_mem_activity", False),
+    ("Fine GFX Activity", "fine_grain_gfx_activity", False),
+    ("Fine Memory Activity", "fine_grain_mem_activity", False),
+]
 
-    if previous_data:
-        prev_activity = float(previous_data["gpu_activity"]["gfx_activity"])
-        delta = format_delta_value(current_activity, prev_activity, True)
-    else:
-        delta = "N/A"
 
-    min_max_range, range_value = calculate_min_max_range(activity_values)
-    return [format_number(current_activity, True), delta, min_max_range], str(
-        range_value
+def display_summary_statistics(summary: SampleSummary) -> None:
+    """
+    Displays the whole-run distribution of every metric (mean, standard
+    deviation and percentiles) and the energy used by the device.
+    """
+    percentiles = StatisticsSettings.REPORT_PERCENTILES
+    rows = []
+    for label, field, is_percentage in SUMMARY_METRICS:
+        stats = summary.stats[field]
+        if not stats.count:
+            continue
+        rows.append(
+            [
+                label,
+                format_number(stats.mean, is_percentage),
+                format_number(stats.stddev, is_percentage),
+                *[
+                    format_number(stats.percentile(q), is_percentage)
+                    for q in percentiles
+                ],
+                format_number(stats.max, is_percentage),
+            ]
+        )
+
+    print()
+    print_table(
+        "Summary Statistics",
+        ["Metric", "Mean", "Std Dev", *[f"P{q}" for q in percentiles], "Max"],
+        rows,
     )
 
+    if summary.elapsed > 0:
+        average_power = summary.energy / summary.elapsed
+        print(
+            f" Energy: {summary.energy:.1f} J ({summary.energy / 3600:.3f} Wh) over "
+            f"{summary.elapsed:.1f}s, average {average_power:.1f} W"
+        )
 
-def format_power_data(
-    current_data: GpuData,
-    previous_data: Optional[GpuData],
-    power_values: List[float],
-) -> Tuple[List[str], str]:
-    """Format power consumption data with deltas and trends."""
-    current_power = float(current_data["power_measure"]["current_socket_power"])
-    power_values.append(current_power)
 
-    if previous_data:
-        prev_power = float(previous_data["power_measure"]["current_socket_power"])
-        delta = format_delta_value(current_power, prev_power)
-    else:
-        delta = "N/A"
+def display_device_aggregate(
+    series: Dict[int, SampleRing],
+    summaries: Optional[Dict[int, SampleSummary]] = None,
+) -> None:
+    """
+    Displays a cross-device summary so load imbalance between GPUs (eg: the
+    shards of a single model) is visible at a glance. Power is summed across
+    devices while activity is averaged, and the spread row shows the gap
+    between the busiest and the idlest device. With whole-run summaries the
+    means, peaks and energy cover every sample of the run.
+    """
+    rows = []
+    energy: List[float] = []
+    mean_power: List[float] = []
+    mean_gfx: List[float] = []
+    mean_umc: List[float] = []
+    total_count = 0
+    for index, samples in sorted(series.items()):
+        summary = summaries.get(index) if summaries else None
+        if summary is not None and summary.count:
+            count = summary.count
+            mean_power.append(summary.stats["current_socket_power"].mean)
+            mean_gfx.append(summary.stats["gfx_activity"].mean)
+            mean_umc.append(summary.stats["umc_activity"].mean)
+            peak_power = summary.stats["current_socket_power"].max
+            peak_gfx = summary.stats["gfx_activity"].max
+            energy.append(summary.energy)
+        elif len(samples):
+            count = len(samples)
+            mean_power.append(samples.mean("current_socket_power"))
+            mean_gfx.append(samples.mean("gfx_activity"))
+            mean_umc.append(samples.mean("umc_activity"))
+            peak_power = samples.max("current_socket_power")
+            peak_gfx = samples.max("gfx_activity")
+        else:
+            continue
+        total_count += count
+        rows.append(
+            [
+                f"GPU {index}",
+                count,
+                format_number(mean_power[-1]),
+                format_number(peak_power),
+                format_number(mean_gfx[-1], True),
+                format_number(peak_gfx, True),
+                format_number(mean_umc[-1], True),
+            ]
+        )
 
-    min_max_range, range_value = calculate_min_max_range(power_values)
-    return [format_number(current_power), delta, min_max_range], str(range_value)
+    if not rows:
+        return
 
+    rows.append(
+        [
+            "Total/Mean",
+            total_count,
+            format_number(sum(mean_power)),
+            "",
+            format_number(sum(mean_gfx) / len(mean_gfx), True),
+            "",
+            format_number(sum(mean_umc) / len(mean_umc), True),
+        ]
+    )
+    rows.append(
+        [
+            "Spread (max-min)",
+            "",
+            format_number(max(mean_power) - min(mean_power)),
+            "",
+            format_number(max(mean_gfx) - min(mean_gfx), True),
+            "",
+            format_number(max(mean_umc) - min(mean_umc), True),
+        ]
+    )
 
-def format_utilization_data(
-    current_data: GpuData,
-    previous_data: Optional[GpuData],
-    counter_type: str,
-    utilization_values: List[float],
-) -> Tuple[List[str], str]:
-    """Format utilization counter data with deltas and trends."""
-    current_util = float(
-        [u for u in current_data["utilization"] if u["counter_type"] == counter_type][
-            0
-        ]["value"]
+    print()
+    print_table(
+        "Cross-Device Aggregate",
+        [
+            "Device",
+            "Samples",
+            "Mean Power (W)",
+            "Peak Power (W)",
+            "Mean GFX",
+            "Peak GFX",
+            "Mean UMC",
+        ],
+        rows,
     )
-    utilization_values.append(current_util)
+    if energy:
+        print(f" Total Energy: {sum(energy):.1f} J ({sum(energy) / 3600:.3f} Wh)")
+    print()
 
-    if previous_data:
-        prev_util = float(
+
+def display_sampling_stats(
+    scheduler: FixedRateScheduler,
+    series: Dict[int, SampleRing],
+    collector: Optional[ConcurrentCollector] = None,
+    adaptive: Optional[AdaptiveSampler] = None,
+    summaries: Optional[Dict[int, SampleSummary]] = None,
+) -> None:
+    """
+    Displays how closely the sampling kept to its schedule: missed deadlines,
+    the worst lateness of a tick, the amdsmi collection latency, the devices
+    left out of ticks by timed out calls and the rates of adaptive sampling.
+    The latency covers the whole run when the summaries are given and the
+    stored samples otherwise.
+    """
+    populated = [samples for samples in series.values() if len(samples)]
+    latencies = [
+        summary.stats["collection_latency"]
+        for summary in (summaries or {}).values()
+        if summary.stats["collection_latency"].count
+    ]
+
+    print("\nSampling Statistics:")
+    print("-" * 50)
+    print(f"Ticks Fired: {scheduler.fired}")
+    print(f"Missed Deadlines: {scheduler.missed}")
+    print(f"Max Tick Lateness: {scheduler.max_lateness * 1000:.2f} ms")
+    if latencies:
+        total = sum(stats.count for stats in latencies)
+        mean_latency = sum(stats.mean * stats.count for stats in latencies) / total
+        max_latency = max(stats.max for stats in latencies)
+        p95_latency = max(stats.percentile(95) for stats in latencies)
+    elif populated:
+        total = sum(len(samples) for samples in populated)
+        mean_latency = (
+            sum(s.mean("collection_latency") * len(s) for s in populated) / total
+        )
+        max_latency = max(s.max("collection_latency") for s in populated)
+        p95_latency = max(s.percentile("collection_latency", 95) for s in populated)
+    if latencies or populated:
+        print(f"Collection Latency (mean): {mean_latency * 1000:.2f} ms")
+        print(f"Collection Latency (p95): {p95_latency * 1000:.2f} ms")
+        print(f"Collection Latency (max): {max_latency * 1000:.2f} ms")
+    if collector is not None:
+        for index, timeouts in collector.timeouts.items():
+            if timeouts or collector.skipped[index]:
+                print(
+                    f"GPU {index} Timed Out Calls: {timeouts} ticks, "
+                    f"{collector.skipped[index]} ticks skipped while hung"
+                )
+    if adaptive is not None:
+        print(
+            f"Adaptive Sampling: {adaptive.active_ticks} ticks at "
+            f"{adaptive.active_interval}s, {adaptive.idle_ticks} ticks at "
+            f"{adaptive.idle_interval}s, {adaptive.switches} rate switches"
+        )
+        # Ticks a fixed rate run at the active interval would have taken
+        sampled = adaptive.active_time + adaptive.idle_ticks * adaptive.idle_interval
+        fixed_ticks = round(sampled / adaptive.active_interval)
+        taken = adaptive.active_ticks + adaptive.idle_ticks
+        if taken:
+            print(
+                f"Fixed Rate Equivalent: {fixed_ticks} ticks "
+                f"({fixed_ticks / taken:.1f}x the samples)"
+            )
+    print()
+
+
+def display_overhead_report(profiler: MonitorProfiler) -> None:
+    """
+    Displays what the monitor itself cost: CPU time against wall time, the
+    wall and CPU time of a tick, the latency distribution of every amdsmi
+    call and the time spent formatting and printing the report.
+    """
+
+    def ms(value: float) -> str:
+        return f"{value * 1000:.3f}" if not math.isnan(value) else "N/A"
+
+    rows = []
+    for name, stats in profiler.calls.items():
+        if not stats.count:
+            continue
+        rows.append(
             [
-                u
-                for u in previous_data["utilization"]
-                if u["counter_type"] == counter_type
-            ][0]["value"]
+                name,
+                stats.count,
+                profiler.call_errors[name],
+                ms(stats.mean),
+                *[
+                    ms(stats.percentile(q))
+                    for q in StatisticsSettings.REPORT_PERCENTILES
+                ],
+                ms(stats.max),
+            ]
         )
-        delta = format_delta_value(current_util, prev_util)
+    if rows:
+        print()
+        print_table(
+            "amdsmi Call Latency (ms)",
+            [
+                "Call",
+                "Calls",
+                "Errors",
+                "Mean",
+                *[f"P{q}" for q in StatisticsSettings.REPORT_PERCENTILES],
+                "Max",
+            ],
+            rows,
+        )
+
+    wall = profiler.wall_seconds
+    cpu = profiler.cpu_seconds
+    print("\nMonitor Overhead:")
+    print("-" * 50)
+    print(
+        f"CPU Time: {cpu:.3f} s over {wall:.1f} s "
+        f"({format_number(cpu / wall * 100 if wall else 0, True)} of one core)"
+    )
+    # ru_maxrss is in kilobytes on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Max Resident Memory: {max_rss:.1f} MB")
+    for label, stats in [
+        ("Tick Wall Time", profiler.tick_wall),
+        ("Tick CPU Time", profiler.tick_cpu),
+        ("Tick Collection Time", profiler.collect_wall),
+        ("Tick Output Time", profiler.output_wall),
+    ]:
+        if stats.count:
+            print(
+                f"{label}: mean {ms(stats.mean)} ms, "
+                f"p95 {ms(stats.percentile(95))} ms, max {ms(stats.max)} ms"
+            )
+    print(
+        f"Report Formatting: {ms(profiler.report_wall)} ms "
+        f"({ms(profiler.report_cpu)} ms CPU)"
+    )
+    print()
+
+
+def format_column_data(
+    samples: SampleRing,
+    name: str,
+    is_percentage: bool = False,
+    stats: Optional[RunningStats] = None,
+) -> Tuple[List[str], str]:
+    """
+    Formats the latest value of a metric with its delta from the previous
+    sample and the min-max range, over the whole run when its running
+    statistics are given and over the stored samples otherwise.
+    """
+    current = samples.latest(name)
+    if len(samples) > 1:
+        delta = format_delta_value(current, samples.latest(name, 1), is_percentage)
     else:
         delta = "N/A"
 
-    min_max_range, range_value = calculate_min_max_range(utilization_values)
-    return [format_number(current_util), delta, min_max_range], str(range_value)
+    if stats is not None and stats.count:
+        min_val, max_val = stats.min, stats.max
+    else:
+        min_val, max_val = samples.min(name), samples.max(name)
+    if math.isnan(min_val):
+        min_max_range, range_value = "N/A", "N/A"
+    else:
+        # Captures store power and activity as float32, round off the noise
+        min_val, max_val = round(min_val, 4), round(max_val, 4)
+        min_max_range = f"{min_val} - {max_val}"
+        range_value = str(round(max_val - min_val, 4))
+    return [format_number(current, is_percentage), delta, min_max_range], range_value
+
+
+def format_activity_data(
+    samples: SampleRing, stats: Dict[str, RunningStats]
+) -> Tuple[List[str], str]:
+    """Format GPU activity data with deltas and trends."""
+    return format_column_data(samples, "gfx_activity", True, stats.get("gfx_activity"))
+
+
+def format_power_data(
+    samples: SampleRing, stats: Dict[str, RunningStats]
+) -> Tuple[List[str], str]:
+    """Format power consumption data with deltas and trends."""
+    return format_column_data(
+        samples, "current_socket_power", False, stats.get("current_socket_power")
+    )
+
+
+def format_utilization_data(
+    samples: SampleRing, counter_type: str, stats: Dict[str, RunningStats]
+) -> Tuple[List[str], str]:
+    """Format utilization counter data with deltas and trends."""
+    field = UTILIZATION_FIELDS[counter_type]
+    return format_column_data(samples, field, False, stats.get(field))
 
 
 def format_delta_value(
@@ -517,60 +2613,996 @@ def format_delta_value(
     return f"{sign}{format_number(delta, is_percentage)}"
 
 
+class CaptureAnalysis:
+    """
+    Offline analysis of one saved capture. Records are streamed from the file
+    (chunk by chunk from the memory mapping for binary captures) into the
+    same per-device structures the live monitor uses: a bounded SampleRing,
+    a whole-run SampleSummary and an ActivityDetector, so memory does not
+    depend on the size of the capture.
+    """
+
+    def __init__(self, path: str, history: int) -> None:
+        self.path = path
+        self.history = history
+        self.interval: Optional[float] = None
+        self.asic_info: Dict[int, Dict[str, Any]] = {}
+        self.initial_data: Dict[int, GpuData] = {}
+        self.series: Dict[int, SampleRing] = {}
+        self.summaries: Dict[int, SampleSummary] = {}
+        self.detectors: Dict[int, ActivityDetector] = {}
+
+    def run(self) -> None:
+        if is_binary_capture(self.path):
+            with CaptureReader(self.path) as reader:
+                self.interval = reader.header.get("interval")
+                for index, info in reader.header.get("devices", {}).items():
+                    self.asic_info[int(index)] = info
+                self.consume(reader.records())
+        else:
+            self.consume(read_stream_records(self.path))
+        for detector in self.detectors.values():
+            detector.finish()
+
+    def consume(self, records: Iterator[Dict[str, Any]]) -> None:
+        for record in records:
+            index = int(record["device"])
+            sample = record_to_sample(record)
+            if index not in self.summaries:
+                self.initial_data[index] = sample
+                self.series[index] = SampleRing(self.history)
+                self.summaries[index] = SampleSummary()
+                self.detectors[index] = ActivityDetector(record["current_socket_power"])
+            self.series[index].append(sample)
+            self.summaries[index].update_record(record)
+            self.detectors[index].update(
+                record["gfx_activity"],
+                record["umc_activity"],
+                record["current_socket_power"],
+            )
+
+    def device_interval(self, index: int) -> float:
+        """The recorded interval, or the mean spacing of the device samples."""
+        if self.interval:
+            return self.interval
+        summary = self.summaries[index]
+        if summary.count > 1:
+            return round(summary.elapsed / (summary.count - 1), 3)
+        return 0.0
+
+    def display(self) -> None:
+        for index in sorted(self.summaries):
+            print_title(f"{self.path} - GPU {index}")
+            set_table_section(f"{self.path} - GPU {index}")
+            asic_info = self.asic_info.get(index)
+            if asic_info is None:
+                asic_info = placeholder_asic_info(f"captured device {index}")
+            display_asic_and_deltas(
+                asic_info,
+                self.initial_data[index],
+                self.series[index],
+                self.device_interval(index),
+                round(self.summaries[index].elapsed),
+                self.detectors[index],
+                self.summaries[index],
+            )
+        if len(self.summaries) > 1:
+            set_table_section(self.path)
+            display_device_aggregate(self.series, self.summaries)
+
+
+def format_change(
+    before: float, after: float, is_percentage: bool = False
+) -> List[str]:
+    """Formats the absolute and relative change between two values."""
+    if math.isnan(before) or math.isnan(after):
+        return ["N/A", "N/A"]
+    delta = format_delta_value(after, before, is_percentage)
+    if before == 0:
+        return [delta, "N/A"]
+    change = (after - before) / abs(before) * 100
+    sign = "+" if change > 0 else ""
+    return [delta, f"{sign}{change:.1f}%"]
+
+
+def display_capture_comparison(before: CaptureAnalysis, after: CaptureAnalysis) -> None:
+    """
+    Displays the per-metric deltas of two captures side by side, for every
+    device present in both of them.
+    """
+    common = sorted(set(before.summaries) & set(after.summaries))
+    if not common:
+        print("\nThe captures have no device in common, nothing to compare")
+        return
+
+    for index in common:
+        old, new = before.summaries[index], after.summaries[index]
+        rows = []
+        for label, field, is_percentage in SUMMARY_METRICS:
+            old_stats, new_stats = old.stats[field], new.stats[field]
+            if not old_stats.count or not new_stats.count:
+                continue
+            for statistic, old_value, new_value in [
+                ("mean", old_stats.mean, new_stats.mean),
+                ("p95", old_stats.percentile(95), new_stats.percentile(95)),
+                ("max", old_stats.max, new_stats.max),
+            ]:
+                rows.append(
+                    [
+                        label,
+                        statistic,
+                        format_number(old_value, is_percentage),
+                        format_number(new_value, is_percentage),
+                        *format_change(old_value, new_value, is_percentage),
+                    ]
+                )
+
+        old_active, new_active = old.active_share, new.active_share
+        old_intervals = before.detectors[index].closed_count
+        new_intervals = after.detectors[index].closed_count
+        for label, old_value, new_value, is_percentage in [
+            ("GPU Active", old_active, new_active, True),
+            ("Active Intervals", old_intervals, new_intervals, False),
+            ("Energy (J)", old.energy, new.energy, False),
+            ("Samples", old.count, new.count, False),
+        ]:
+            rows.append(
+                [
+                    label,
+                    "total",
+                    format_number(old_value, is_percentage),
+                    format_number(new_value, is_percentage),
+                    *format_change(old_value, new_value, is_percentage),
+                ]
+            )
+
+        print()
+        print_table(
+            f"Comparison GPU {index}: {before.path} -> {after.path}",
+            ["Metric", "Statistic", "Before", "After", "Delta", "Change"],
+            rows,
+        )
+    print()
+
+
+def analyze_main(argv: List[str]) -> int:
+    """Entry point of the analyze command, works on saved captures only."""
+    parser = argparse.ArgumentParser(
+        prog="monitor-amdsmi-gpu.py analyze",
+        description="Analyze saved GPU captures without querying amdsmi.",
+    )
+    parser.add_argument(
+        "captures",
+        nargs="+",
+        metavar="CAPTURE",
+        help="Capture files written with --capture (binary) or --stream",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare two captures (before, after) metric by metric",
+    )
+    parser.add_argument(
+        "--history",
+        type=int,
+        default=SamplingSettings.DEFAULT_HISTORY,
+        help="Samples per device kept for the current/delta columns "
+        f"(default: {SamplingSettings.DEFAULT_HISTORY})",
+    )
+    parser.add_argument(
+        "--report-data",
+        metavar="FILE",
+        help="Also write every table of the report to FILE, as JSON when it "
+        "ends with .json and as CSV otherwise",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare and len(args.captures) != 2:
+        print("--compare needs exactly two captures (before, after)")
+        return ExitCodes.INVALID_ARGS
+    if args.history < 1:
+        print("History must be at least 1")
+        return ExitCodes.INVALID_ARGS
+
+    analyses = []
+    with recording_tables(args.report_data):
+        for path in args.captures:
+            analysis = CaptureAnalysis(path, args.history)
+            try:
+                analysis.run()
+            except (OSError, ValueError, KeyError, struct.error) as e:
+                print(f"Error reading capture {path}: {e}")
+                return ExitCodes.RUNTIME_ERROR
+            if not analysis.summaries:
+                print(f"Capture {path} holds no samples")
+                return ExitCodes.INVALID_ARGS
+            with buffered_output(sys.stdout):
+                analysis.display()
+            analyses.append(analysis)
+
+        if args.compare:
+            set_table_section(None)
+            with buffered_output(sys.stdout):
+                display_capture_comparison(*analyses)
+    return ExitCodes.SUCCESS
+
+
+class RequestWindow:
+    """A request of the timing log and the energy and activity attributed to it."""
+
+    __slots__ = [
+        "request_id",
+        "start",
+        "end",
+        "tokens",
+        "window_energy",
+        "attributed_energy",
+        "gfx_time",
+        "umc_time",
+        "covered",
+    ]
+
+    def __init__(
+        self, request_id: str, start: float, end: float, tokens: Optional[float]
+    ) -> None:
+        self.request_id = request_id
+        self.start = start
+        self.end = end
+        self.tokens = tokens
+        self.window_energy = 0.0  # All GPU energy used during the window
+        self.attributed_energy = 0.0  # Share of it, split between overlaps
+        self.gfx_time = 0.0  # Integral of gfx activity over the window
+        self.umc_time = 0.0  # Integral of umc activity over the window
+        self.covered = 0.0  # Seconds of the window covered by samples
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def tokens_per_joule(self) -> float:
+        if self.tokens is None or self.attributed_energy <= 0:
+            return math.nan
+        return self.tokens / self.attributed_energy
+
+
+# Accepted column names of the request timing log, first match wins
+REQUEST_LOG_COLUMNS = {
+    "request_id": ["id", "request_id", "requestId"],
+    "start": ["start", "start_time", "start_ts", "started"],
+    "end": ["end", "end_time", "end_ts", "finished"],
+    "tokens": ["tokens", "output_tokens", "completion_tokens", "total_tokens"],
+}
+
+
+def parse_log_timestamp(value: Any) -> float:
+    """Parses epoch seconds or an ISO 8601 timestamp (naive ones are UTC)."""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed.timestamp()
+
+
+def read_request_log(path: str) -> List[RequestWindow]:
+    """Reads a CSV (with header) or NDJSON request timing log, sorted by start."""
+    with open(path, newline="", encoding="utf-8") as stream:
+        first = stream.read(1)
+        stream.seek(0)
+        if first == "{":
+            rows = [json.loads(line) for line in stream if line.strip()]
+        else:
+            rows = list(csv.DictReader(stream))
+
+    requests = []
+    for number, row in enumerate(rows, 1):
+        values = {}
+        for key, names in REQUEST_LOG_COLUMNS.items():
+            values[key] = next(
+                (row[name] for name in names if row.get(name) not in (None, "")),
+                None,
+            )
+        if values["start"] is None or values["end"] is None:
+            raise ValueError(f"request {number} has no start or end timestamp")
+        start = parse_log_timestamp(values["start"])
+        end = parse_log_timestamp(values["end"])
+        if end < start:
+            raise ValueError(f"request {number} ends before it starts")
+        tokens = float(values["tokens"]) if values["tokens"] is not None else None
+        requests.append(
+            RequestWindow(str(values["request_id"] or number), start, end, tokens)
+        )
+    requests.sort(key=lambda request: request.start)
+    return requests
+
+
+def capture_timeline(
+    paths: List[str], devices: Optional[List[int]]
+) -> Iterator[Optional[Tuple[float, float, float, float]]]:
+    """
+    Streams the (timestamp, total power, mean gfx, mean umc) of every tick of
+    the captures, over the selected devices (all of them when None). None is
+    yielded where the ticks on either side must not be joined: between two
+    captures, and where two ticks lie more than MAX_GAP_INTERVALS sampling
+    intervals apart (eg: the monitor was restarted). The interval is the one
+    recorded with the tick, else the one of the capture header, else the
+    shortest step seen so far.
+    """
+    for number, path in enumerate(paths):
+        header_interval = math.nan
+        if is_binary_capture(path):
+            reader = CaptureReader(path)
+            records = reader.records()
+            header_interval = float(reader.header.get("interval") or math.nan)
+        else:
+            reader = None
+            records = read_stream_records(path)
+        if number:
+            yield None
+        last_timestamp = math.nan
+        shortest_step = math.inf
+        try:
+            for tick in group_ticks(records):
+                selected = [
+                    record
+                    for index, record in tick.items()
+                    if devices is None or index in devices
+                ]
+                if not selected:
+                    continue
+                count = len(selected)
+                timestamp = sum(record["timestamp"] for record in selected) / count
+                step = timestamp - last_timestamp
+                if step == step:
+                    interval = max(record["sample_interval"] for record in selected)
+                    if interval != interval:
+                        interval = header_interval
+                    if interval != interval:
+                        interval = shortest_step
+                    if step > SamplingSettings.MAX_GAP_INTERVALS * interval:
+                        yield None
+                    else:
+                        shortest_step = min(shortest_step, step)
+                last_timestamp = timestamp
+                yield (
+                    timestamp,
+                    sum(record["current_socket_power"] for record in selected),
+                    sum(record["gfx_activity"] for record in selected) / count,
+                    sum(record["umc_activity"] for record in selected) / count,
+                )
+        finally:
+            records.close()  # type: ignore[attr-defined]
+            if reader is not None:
+                reader.close()
+
+
+class EnergyAttributor:
+    """
+    Integrates power over the sample timeline with the trapezoidal rule, power
+    being linear between two samples, and attributes every slice of energy to
+    the requests running at that time in a single sweep. A request gets the
+    whole energy of its window (window energy) and an equal share of each
+    slice it shares with concurrent requests (attributed energy), so the
+    attributed energy of all requests plus the idle energy adds up to the
+    total. A None in the timeline breaks the integration: the time up to
+    the next sample is counted as an unmeasured gap and gets no energy.
+    """
+
+    def __init__(self, requests: List[RequestWindow]) -> None:
+        self.requests = requests
+        self.total_energy = 0.0
+        self.idle_energy = 0.0
+        self.first_timestamp = math.nan
+        self.last_timestamp = math.nan
+        self.gaps = 0
+        self.unmeasured_time = 0.0  # Seconds between samples that were not joined
+
+    def run(
+        self, timeline: Iterator[Optional[Tuple[float, float, float, float]]]
+    ) -> None:
+        requests = self.requests
+        next_request = 0
+        active: List[RequestWindow] = []
+        previous = None
+        last = None
+        for point in timeline:
+            if point is None:
+                previous = None
+                continue
+            if last is None:
+                self.first_timestamp = point[0]
+            elif previous is None:
+                if point[0] > last[0]:
+                    self.gaps += 1
+                    self.unmeasured_time += point[0] - last[0]
+            elif point[0] > previous[0]:
+                t0, t1 = previous[0], point[0]
+                while (
+                    next_request < len(requests) and requests[next_request].start < t1
+                ):
+                    active.append(requests[next_request])
+                    next_request += 1
+                active = [request for request in active if request.end > t0]
+                self.segment(previous, point, active)
+            previous = last = point
+        if last is not None:
+            self.last_timestamp = last[0]
+
+    def segment(
+        self,
+        first: Tuple[float, float, float, float],
+        second: Tuple[float, float, float, float],
+        active: List[RequestWindow],
+    ) -> None:
+        t0, p0, g0, u0 = first
+        t1, p1, g1, u1 = second
+        energy = (p0 + p1) / 2 * (t1 - t0)
+        self.total_energy += energy
+        if not active:
+            self.idle_energy += energy
+            return
+
+        def power_at(t: float) -> float:
+            return p0 + (p1 - p0) * (t - t0) / (t1 - t0)
+
+        gfx = (g0 + g1) / 2
+        umc = (u0 + u1) / 2
+        # Split the segment where requests start or end inside it
+        bounds = {t0, t1}
+        for request in active:
+            if t0 < request.start < t1:
+                bounds.add(request.start)
+            if t0 < request.end < t1:
+                bounds.add(request.end)
+        points = sorted(bounds)
+        for a, b in zip(points, points[1:]):
+            piece = (power_at(a) + power_at(b)) / 2 * (b - a)
+            covering = [r for r in active if r.start <= a and r.end >= b]
+            if not covering:
+                self.idle_energy += piece
+                continue
+            share = piece / len(covering)
+            for request in covering:
+                request.window_energy += piece
+                request.attributed_energy += share
+                request.gfx_time += gfx * (b - a)
+                request.umc_time += umc * (b - a)
+                request.covered += b - a
+
+
+def display_request_energy(attributor: EnergyAttributor, top: int) -> None:
+    """Displays the per-request energy table and the run-wide summary."""
+    requests = attributor.requests
+    measured = [request for request in requests if request.covered > 0]
+
+    rows = []
+    for request in sorted(measured, key=lambda r: r.attributed_energy, reverse=True)[
+        :top
+    ]:
+        covered = request.covered or 1
+        rows.append(
+            [
+                request.request_id,
+                f"{request.duration:.3f}",
+                format_number(request.tokens) if request.tokens is not None else "N/A",
+                f"{request.window_energy:.1f}",
+                f"{request.attributed_energy:.1f}",
+                (
+                    f"{request.tokens_per_joule:.3f}"
+                    if not math.isnan(request.tokens_per_joule)
+                    else "N/A"
+                ),
+                format_number(request.gfx_time / covered, True),
+                format_number(request.umc_time / covered, True),
+            ]
+        )
+
+    print()
+    print_table(
+        f"Request Energy (top {len(rows)} of {len(measured)} by attributed energy)",
+        [
+            "Request",
+            "Duration (s)",
+            "Tokens",
+            "Window (J)",
+            "Attributed (J)",
+            "Tokens/J",
+            "Mean GFX",
+            "Mean UMC",
+        ],
+        rows,
+    )
+
+    energy_stats = RunningStats()
+    tokens_per_joule = RunningStats()
+    total_tokens = 0.0
+    attributed = 0.0
+    for request in measured:
+        energy_stats.update(request.attributed_energy)
+        attributed += request.attributed_energy
+        if request.tokens is not None:
+            total_tokens += request.tokens
+            tokens_per_joule.update(request.tokens_per_joule)
+
+    print("\nEnergy Summary:")
+    print("-" * 50)
+    print(
+        f"Requests: {len(requests)} ({len(requests) - len(measured)} outside captures)"
+    )
+    print(f"Total Energy: {attributor.total_energy:.1f} J")
+    if attributor.gaps:
+        print(
+            f"Unmeasured Gaps: {attributor.gaps} "
+            f"({attributor.unmeasured_time:.1f} s without samples, not counted)"
+        )
+    print(f"Attributed to Requests: {attributed:.1f} J")
+    if attributor.total_energy > 0:
+        idle_share = attributor.idle_energy / attributor.total_energy * 100
+        print(
+            f"Idle (no request running): {attributor.idle_energy:.1f} J "
+            f"({format_number(idle_share, True)})"
+        )
+    if energy_stats.count:
+        print(
+            f"Energy per Request: mean {energy_stats.mean:.1f} J, "
+            f"p50 {energy_stats.percentile(50):.1f} J, "
+            f"p95 {energy_stats.percentile(95):.1f} J"
+        )
+    if tokens_per_joule.count and attributed > 0:
+        print(f"Tokens per Joule (overall): {total_tokens / attributed:.3f}")
+        print(
+            f"Tokens per Joule (per request): mean {tokens_per_joule.mean:.3f}, "
+            f"p50 {tokens_per_joule.percentile(50):.3f}"
+        )
+    print()
+
+
+def write_request_energy(path: str, requests: List[RequestWindow]) -> None:
+    """Writes the per-request results as CSV."""
+    with open(path, "w", newline="", encoding="utf-8") as stream:
+        writer = csv.writer(stream)
+        writer.writerow(
+            [
+                "request_id",
+                "start",
+                "end",
+                "tokens",
+                "window_energy_j",
+                "attributed_energy_j",
+                "tokens_per_joule",
+                "mean_gfx_activity",
+                "mean_umc_activity",
+                "covered_seconds",
+            ]
+        )
+        for request in requests:
+            covered = request.covered or math.nan
+            writer.writerow(
+                [
+                    request.request_id,
+                    request.start,
+                    request.end,
+                    "" if request.tokens is None else request.tokens,
+                    request.window_energy,
+                    request.attributed_energy,
+                    request.tokens_per_joule,
+                    request.gfx_time / covered,
+                    request.umc_time / covered,
+                    request.covered,
+                ]
+            )
+
+
+def run_energy_report(
+    captures: List[str],
+    requests_path: str,
+    devices: Optional[List[int]] = None,
+    top: int = 20,
+    output: Optional[str] = None,
+) -> int:
+    """Attributes the energy of captures to the requests of a timing log."""
+    try:
+        requests = read_request_log(requests_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error reading request log {requests_path}: {e}")
+        return ExitCodes.INVALID_ARGS
+
+    attributor = EnergyAttributor(requests)
+    try:
+        attributor.run(capture_timeline(captures, devices))
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"Error reading captures: {e}")
+        return ExitCodes.RUNTIME_ERROR
+
+    display_request_energy(attributor, top)
+    if output is not None:
+        write_request_energy(output, requests)
+    return ExitCodes.SUCCESS
+
+
+def energy_main(argv: List[str]) -> int:
+    """Entry point of the energy command, works on saved captures only."""
+    parser = argparse.ArgumentParser(
+        prog="monitor-amdsmi-gpu.py energy",
+        description="Attribute GPU energy in saved captures to request windows.",
+    )
+    parser.add_argument(
+        "captures",
+        nargs="+",
+        metavar="CAPTURE",
+        help="Capture files, in chronological order",
+    )
+    parser.add_argument(
+        "--requests",
+        required=True,
+        metavar="LOG",
+        help="Request timing log (CSV or NDJSON with start/end and optional "
+        "id/tokens)",
+    )
+    parser.add_argument(
+        "--devices",
+        default="all",
+        help='Captured devices to account: "all" or comma-separated indices',
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="Requests shown in the table, by attributed energy (default: 20)",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="Write the results of every request to this CSV file",
+    )
+    args = parser.parse_args(argv)
+
+    devices = None
+    if args.devices.strip().lower() != "all":
+        try:
+            devices = [int(token) for token in args.devices.split(",") if token.strip()]
+        except ValueError:
+            print(f"Invalid --devices value: {args.devices}")
+            return ExitCodes.INVALID_ARGS
+
+    return run_energy_report(
+        args.captures, args.requests, devices, args.top, args.output
+    )
+
+
 def main() -> int:
     """Main function to monitor GPU metrics."""
+    if sys.argv[1:2] == ["analyze"]:
+        return analyze_main(sys.argv[2:])
+    if sys.argv[1:2] == ["energy"]:
+        return energy_main(sys.argv[2:])
+
     parser = argparse.ArgumentParser(
         description="Monitor AMD GPU metrics at specified intervals."
     )
     parser.add_argument(
         "interval",
-        type=int,
-        help="Time between measurements in seconds (eg: 5)",
+        type=float,
+        help="Time between measurements in seconds (eg: 5, 0.25)",
     )
     parser.add_argument(
         "duration",
         type=int,
-        help="Duration in seconds to monitor GPU activity (eg: 60)",
+        help="Duration in seconds to monitor GPU activity (eg: 60), 0 runs until SIGINT",
+    )
+    parser.add_argument(
+        "--devices",
+        default="0",
+        help='GPUs to sample: "all" or comma-separated indices (default: 0)',
+    )
+    parser.add_argument(
+        "--stream",
+        choices=SampleStreamWriter.FORMATS,
+        help="Write every sample as it is collected in the given format",
+    )
+    parser.add_argument(
+        "--output",
+        default="-",
+        help="Destination file of the sample stream (default: stdout)",
+    )
+    parser.add_argument(
+        "--history",
+        type=int,
+        default=SamplingSettings.DEFAULT_HISTORY,
+        help="Samples per device kept for the current/delta columns of the "
+        f"report (default: {SamplingSettings.DEFAULT_HISTORY})",
+    )
+    parser.add_argument(
+        "--exporter",
+        type=int,
+        metavar="PORT",
+        help="Serve Prometheus metrics on this port while collecting",
+    )
+    parser.add_argument(
+        "--exporter-address",
+        default="0.0.0.0",
+        help="Address the Prometheus exporter binds to (default: 0.0.0.0)",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="FILE",
+        help="Append every sample to this binary capture file",
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="Replay a capture recorded with --capture or --stream instead of "
+        "querying amdsmi",
+    )
+    source.add_argument(
+        "--synthetic",
+        type=int,
+        metavar="GPUS",
+        help="Generate synthetic load for GPUS devices instead of querying amdsmi",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the synthetic load generator (default: 0)",
+    )
+    parser.add_argument(
+        "--requests",
+        metavar="LOG",
+        help="With --capture, attribute the energy of the run to the requests "
+        "of this timing log once collection ends",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Threads issuing the amdsmi calls of a tick concurrently, 0 queries "
+        "the devices serially (default: 3 per device, at most "
+        f"{SamplingSettings.MAX_WORKERS})",
+    )
+    parser.add_argument(
+        "--call-timeout",
+        type=float,
+        default=SamplingSettings.CALL_TIMEOUT,
+        metavar="SECONDS",
+        help="Time an amdsmi call may take before its device is left out of "
+        f"the tick (default: {SamplingSettings.CALL_TIMEOUT})",
+    )
+    parser.add_argument(
+        "--adaptive",
+        type=float,
+        metavar="IDLE_INTERVAL",
+        help="Sample every IDLE_INTERVAL seconds while the GPUs are idle and at "
+        "INTERVAL once one crosses the activity thresholds",
+    )
+    parser.add_argument(
+        "--live",
+        action="store_true",
+        help="Redraw a live view of rolling 10s/1m/5m windows every tick",
+    )
+    parser.add_argument(
+        "--report-data",
+        metavar="FILE",
+        help="Also write every table of the final report to FILE, as JSON when "
+        "it ends with .json and as CSV otherwise",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Measure the overhead of the monitor itself, print it at exit and "
+        "export it",
     )
     args = parser.parse_args()
 
+    if args.interval < SamplingSettings.MIN_INTERVAL:
+        print(f"Interval must be at least {SamplingSettings.MIN_INTERVAL}s")
+        return ExitCodes.INVALID_ARGS
+    if args.duration < 0 or args.history < 1:
+        print("Duration must not be negative and history must be at least 1")
+        return ExitCodes.INVALID_ARGS
+    if args.requests is not None and args.capture is None:
+        print("--requests needs --capture to record the power timeline")
+        return ExitCodes.INVALID_ARGS
+    if args.live and args.stream is not None and args.output == "-":
+        print("--live can not share stdout with --stream, use --output")
+        return ExitCodes.INVALID_ARGS
+    if args.adaptive is not None and args.adaptive < args.interval:
+        print("The idle interval of --adaptive must not be below INTERVAL")
+        return ExitCodes.INVALID_ARGS
+    if (args.workers is not None and args.workers < 0) or args.call_timeout <= 0:
+        print("Workers must not be negative and the call timeout must be positive")
+        return ExitCodes.INVALID_ARGS
+
+    # The whole-run figures come from the SampleSummary, so the sample store
+    # only keeps a bounded history whatever the duration
+    capacity = args.history
+    if args.live:
+        # The rolling windows of the live view are computed over the ring,
+        # which is bounded by the longest window at the finest interval
+        window = max(DisplaySettings.LIVE_WINDOWS)
+        capacity = max(capacity, int(window / args.interval) + 2)
+
+    backend: GpuBackend
+    if args.replay is not None:
+        backend = ReplayBackend(args.replay)
+    elif args.synthetic is not None:
+        backend = SyntheticBackend(args.synthetic, args.seed)
+    else:
+        backend = AmdSmiBackend()
+    profiler = None
+    if args.profile:
+        profiler = MonitorProfiler()
+        backend = ProfilingBackend(backend, profiler)
+
     try:
-        amdsmi_init()
-        devices = amdsmi_get_processor_handles()
+        backend.init()
+        handles = backend.get_processor_handles()
 
-        if not devices:
+        if not handles:
             print("No AMD GPUs found.")
-            return 1
-
-        device = devices[0]  # Monitor the first GPU
-        data_points: List[GpuData] = []
-
-        # Collect initial data
-        initial_data = collect_gpu_data(device)
-        data_points.append(initial_data)
-
-        # Collect data at specified intervals
-        start_time = time.time()
-        while time.time() - start_time < args.duration:
-            time.sleep(args.interval)
+            return ExitCodes.NO_GPU
+
+        try:
+            selected = parse_device_selection(args.devices, len(handles))
+        except ValueError as e:
+            print(f"Invalid --devices value: {e}")
+            return ExitCodes.INVALID_ARGS
+
+        devices = {index: handles[index] for index in selected}
+        series = {index: SampleRing(capacity) for index in devices}
+        workers = args.workers
+        if workers is None:
+            workers = min(3 * len(devices), SamplingSettings.MAX_WORKERS)
+
+        with contextlib.ExitStack() as stack:
+            collector = ConcurrentCollector(
+                backend, devices, workers, args.call_timeout, profiler
+            )
+            stack.callback(collector.close)
+
+            writer = None
+            if args.stream is not None:
+                if args.output == "-":
+                    stream = sys.stdout
+                else:
+                    stream = stack.enter_context(
+                        open(args.output, "w", newline="", encoding="utf-8")
+                    )
+                writer = SampleStreamWriter(stream, args.stream)
+
+            capture = None
+            if args.capture is not None:
+                capture = CaptureWriter(
+                    args.capture,
+                    {
+                        index: backend.get_gpu_asic_info(device)
+                        for index, device in devices.items()
+                    },
+                    {"backend": backend.name, "interval": args.interval},
+                )
+                stack.callback(capture.close)
+
+            # Collect initial data, its power reading is the activity baseline
+            scheduler = FixedRateScheduler(args.interval, args.duration)
+            initial_data = collector.collect()
+            detectors = {
+                index: ActivityDetector(data["power_measure"]["current_socket_power"])
+                for index, data in initial_data.items()
+            }
+            summaries = {index: SampleSummary() for index in devices}
+            adaptive = None
+            if args.adaptive is not None:
+                adaptive = AdaptiveSampler(scheduler, args.interval, args.adaptive)
+            dashboard = LiveDashboard(series, scheduler) if args.live else None
+            for index, data in initial_data.items():
+                series[index].append(data)
+                summaries[index].update(data)
+                detectors[index].update_sample(data)
+            if dashboard is not None:
+                dashboard.update(initial_data)
+            if writer is not None:
+                writer.write_tick(initial_data)
+            if capture is not None:
+                capture.write_tick(initial_data)
+
+            exporter = None
+            if args.exporter is not None:
+                exporter = PrometheusExporter(
+                    args.exporter_address, args.exporter, profiler
+                )
+                stack.callback(exporter.stop)
+                exporter.publish(initial_data, scheduler)
+                exporter.start()
+
+            def process_tick(samples: Dict[int, GpuData]) -> None:
+                for index, data in samples.items():
+                    series[index].append(data)
+                    summaries[index].update(data)
+                    if index not in detectors:
+                        continue
+                    closed = detectors[index].update_sample(data)
+                    if closed is not None and writer is not None:
+                        start, end, max_util = closed
+                        print(
+                            f"GPU {index}: active interval samples {start}-{end} "
+                            f"(max {format_number(max_util, True)})",
+                            file=sys.stderr,
+                        )
+                if writer is not None:
+                    writer.write_tick(samples)
+                if capture is not None:
+                    capture.write_tick(samples)
+                if exporter is not None:
+                    exporter.publish(samples, scheduler)
+                if adaptive is not None:
+                    adaptive.update(detectors)
+                if dashboard is not None:
+                    dashboard.update(samples)
+
+            # Collect data at specified intervals until the duration expires
+            # or the user interrupts the run, the summary is printed either way
             try:
-                data = collect_gpu_data(device)
-                data_points.append(data)
-            except AmdSmiException as e:
-                print(f"Error collecting GPU data: {e}")
-                continue
-
-        # Display results
-        display_asic_and_deltas(
-            device, initial_data, data_points, args.interval, args.duration
+                collector.run(scheduler, process_tick)
+            except KeyboardInterrupt:
+                print("\nInterrupted, printing summary", file=sys.stderr)
+            except CaptureExhausted:
+                print("\nReplay finished, printing summary", file=sys.stderr)
+
+        # Keep the summary out of a sample stream written to stdout
+        report_stream = sys.stderr if args.stream and args.output == "-" else sys.stdout
+        elapsed = round(time.monotonic() - scheduler.start)
+        measure_report = (
+            profiler.report() if profiler is not None else contextlib.nullcontext()
         )
+        with recording_tables(args.report_data):
+            with measure_report, buffered_output(report_stream):
+                for index, device in devices.items():
+                    if index not in initial_data:
+                        print(f"\nGPU {index}: no initial sample, skipping report")
+                        continue
+                    if len(devices) > 1:
+                        print_title(f"GPU {index}")
+                    set_table_section(f"GPU {index}")
+                    detectors[index].finish()
+                    display_asic_and_deltas(
+                        backend.get_gpu_asic_info(device),
+                        initial_data[index],
+                        series[index],
+                        (
+                            args.interval
+                            if adaptive is None
+                            else f"{args.interval}-{args.adaptive}"
+                        ),
+                        elapsed,
+                        detectors[index],
+                        summaries[index],
+                    )
+                set_table_section(None)
+                if len(devices) > 1:
+                    display_device_aggregate(series, summaries)
+                display_sampling_stats(
+                    scheduler, series, collector, adaptive, summaries
+                )
+            if profiler is not None:
+                with buffered_output(report_stream):
+                    display_overhead_report(profiler)
+            if args.requests is not None:
+                with buffered_output(report_stream):
+                    return run_energy_report(
+                        [args.capture], args.requests, sorted(initial_data)
+                    )
         return 0
 
+    except CaptureExhausted:
+        print(f"Capture {args.replay} holds no samples")
+        return ExitCodes.INVALID_ARGS
     except AmdSmiException as e:
         print(f"Error: {e}")
         return 1
     finally:
-        amdsmi_shut_down()
+        backend.shut_down()
 
 
 if __name__ == "__main__":
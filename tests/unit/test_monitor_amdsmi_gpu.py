@@ -0,0 +1,818 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests of scripts/monitor-amdsmi-gpu.py, driven by its synthetic and
+replay backends so that neither amdsmi nor a GPU is needed
+"""
+
+import importlib.util
+import io
+import json
+import math
+import os
+import random
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "..",
+    "scripts",
+    "monitor-amdsmi-gpu.py",
+)
+
+# The script name is not a valid module name, so it is loaded from its path
+spec = importlib.util.spec_from_file_location("monitor_amdsmi_gpu", SCRIPT)
+monitor = importlib.util.module_from_spec(spec)
+sys.modules["monitor_amdsmi_gpu"] = monitor
+spec.loader.exec_module(monitor)
+
+
+def synthetic_ticks(device_count, ticks, seed=0, interval=1.0):
+    """
+    Returns `ticks` ticks of {device: GpuData} produced by the synthetic
+    backend, with timestamps `interval` seconds apart
+    """
+    backend = monitor.SyntheticBackend(device_count, seed=seed)
+    backend.init()
+    result = []
+    for tick in range(ticks):
+        backend.begin_tick()
+        samples = {}
+        for device in backend.get_processor_handles():
+            data = monitor.collect_gpu_data(backend, device)
+            data["timestamp"] = 1000.0 + tick * interval
+            data["sample_interval"] = interval if tick else math.nan
+            samples[device] = data
+        result.append(samples)
+    return result
+
+
+class TestSampleRing(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = [tick[0] for tick in synthetic_ticks(1, 10)]
+
+    def check_wraparound(self):
+        ring = monitor.SampleRing(4)
+        for data in self.samples:
+            ring.append(data)
+
+        kept = self.samples[-4:]
+        self.assertEqual(len(ring), 4)
+        self.assertEqual(ring.total, 10)
+        self.assertEqual(
+            list(ring.column("timestamp")), [data["timestamp"] for data in kept]
+        )
+        power = [data["power_measure"]["current_socket_power"] for data in kept]
+        self.assertEqual(list(ring.column("current_socket_power")), power)
+        self.assertEqual(ring.latest("current_socket_power"), power[-1])
+        self.assertEqual(ring.latest("current_socket_power", 3), power[0])
+        self.assertEqual(ring.min("current_socket_power"), min(power))
+        self.assertEqual(ring.max("current_socket_power"), max(power))
+        self.assertAlmostEqual(ring.mean("current_socket_power"), sum(power) / 4)
+
+    def test_wraparound(self):
+        self.check_wraparound()
+
+    def test_wraparound_without_numpy(self):
+        with patch.object(monitor, "numpy", None):
+            self.check_wraparound()
+
+    def test_partially_filled(self):
+        ring = monitor.SampleRing(4)
+        self.assertTrue(math.isnan(ring.max("gfx_activity")))
+        for data in self.samples[:2]:
+            ring.append(data)
+        self.assertEqual(len(ring), 2)
+        self.assertEqual(
+            list(ring.column("timestamp")),
+            [data["timestamp"] for data in self.samples[:2]],
+        )
+        # the first sample has no interval, NaN placeholders are skipped
+        self.assertEqual(ring.min("sample_interval"), 1.0)
+
+
+class TestRollingWindow(unittest.TestCase):
+
+    def check_window(self, capacity):
+        samples = [tick[0] for tick in synthetic_ticks(1, 40, seed=5)]
+        # a peak that has to leave the window 5s later
+        samples[10]["power_measure"]["current_socket_power"] = 900.0
+        ring = monitor.SampleRing(capacity)
+        window = monitor.RollingWindow(ring, 5.0)
+        field = monitor.UTILIZATION_FIELDS[monitor.UTILIZATION_COUNTERS[0]]
+        for end, data in enumerate(samples):
+            ring.append(data)
+            window.push()
+            # reference: the samples of the last 5s still held by the ring
+            first, stop = max(end - 5, end - capacity + 1, 0), end + 1
+            kept = [monitor.flatten_sample(0, sample) for sample in samples[first:stop]]
+            self.assertEqual(len(window), len(kept), end)
+            for name in monitor.RollingWindow.GAUGES:
+                values = [record[name] for record in kept]
+                self.assertEqual(window.max(name), max(values), (end, name))
+                self.assertAlmostEqual(
+                    window.mean(name), statistics.mean(values), msg=(end, name)
+                )
+            if len(kept) > 1:
+                rate = (kept[-1][field] - kept[0][field]) / (len(kept) - 1)
+                self.assertAlmostEqual(window.rate(field), rate, msg=end)
+            else:
+                self.assertTrue(math.isnan(window.rate(field)))
+
+            if 10 <= end <= 15 and capacity > 5:
+                self.assertEqual(window.max("current_socket_power"), 900.0)
+            elif end == 16:
+                self.assertLess(window.max("current_socket_power"), 900.0)
+
+    def test_maxima_expire_with_their_samples(self):
+        self.check_window(64)
+
+    def test_window_longer_than_the_ring(self):
+        # overwritten samples leave the window early
+        self.check_window(3)
+
+
+class TestActivityDetector(unittest.TestCase):
+
+    def test_intervals(self):
+        detector = monitor.ActivityDetector(baseline_power=100.0)
+        samples = [
+            (0, 0, 100),
+            (1, 0, 101),
+            (50, 10, 150),  # active from here
+            (80, 20, 200),
+            (0, 0, 100),  # closes 2..3
+            (0, 0, 100),
+            (0, 0, 120),  # power alone makes it active
+            (0, 30, 100),
+        ]
+        closed = [detector.update(*sample) for sample in samples]
+        self.assertEqual(closed, [None, None, None, None, (2, 3, 80), None, None, None])
+        # the interval still open at the end is closed by finish()
+        self.assertEqual(detector.finish(), (6, 7, 30))
+        self.assertIsNone(detector.finish())
+        self.assertEqual(list(detector.intervals), [(2, 3, 80), (6, 7, 30)])
+        self.assertEqual(detector.active_samples, 4)
+
+    def test_matches_reference_intervals(self):
+        ticks = synthetic_ticks(1, 300, seed=3)
+        baseline = ticks[0][0]["power_measure"]["current_socket_power"]
+
+        # Reference: maximal runs of active samples, as a single inactive
+        # sample ends an interval
+        expected = []
+        start = None
+        for index, tick in enumerate(ticks + [None]):
+            if tick is not None:
+                core = tick[0]["gpu_activity"]["gfx_activity"]
+                mem = tick[0]["gpu_activity"]["umc_activity"]
+                power = tick[0]["power_measure"]["current_socket_power"]
+                active = (
+                    core > monitor.ActivityThresholds.CORE_USE
+                    or mem > monitor.ActivityThresholds.MEM_USE
+                    or power > baseline + monitor.ActivityThresholds.POWER_INCREASE
+                )
+            if tick is not None and active:
+                if start is None:
+                    start, peak = index, max(core, mem)
+                peak = max(peak, core, mem)
+            elif start is not None:
+                expected.append((start, index - 1, peak))
+                start = None
+
+        with patch.object(monitor.ActivityThresholds, "MIN_INACTIVE_POINTS", 1):
+            # fed one sample at a time, keeping a bounded interval history
+            detector = monitor.ActivityDetector(baseline, max_intervals=2)
+            streamed = [detector.update_sample(tick[0]) for tick in ticks]
+            streamed.append(detector.finish())
+
+        self.assertGreater(len(expected), 2)
+        self.assertEqual([i for i in streamed if i is not None], expected)
+        self.assertEqual(list(detector.intervals), expected[-2:])
+        self.assertEqual(detector.closed_count, len(expected))
+
+
+class TestStatistics(unittest.TestCase):
+
+    @staticmethod
+    def exact(values, q):
+        """The value the sketch estimates: the one at rank q/100 * (n - 1)"""
+        ordered = sorted(values)
+        return ordered[math.floor(q / 100 * (len(ordered) - 1))]
+
+    def test_sketch_percentiles_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(5, 1.5) for _ in range(20000)]
+        values += [0.0] * 100 + [-rng.uniform(1, 50) for _ in range(500)]
+        sketch = monitor.QuantileSketch()
+        for value in values:
+            sketch.add(value)
+
+        accuracy = monitor.StatisticsSettings.SKETCH_RELATIVE_ACCURACY
+        for q in [0, 1, 2.5, 5, 25, 50, 75, 95, 99, 99.9, 100]:
+            exact = self.exact(values, q)
+            estimate = sketch.quantile(q)
+            self.assertLessEqual(
+                abs(estimate - exact), accuracy * abs(exact) + 1e-12, f"P{q}"
+            )
+        self.assertTrue(math.isnan(monitor.QuantileSketch().quantile(50)))
+
+    def test_running_stats(self):
+        rng = random.Random(11)
+        values = [rng.uniform(100, 750) for _ in range(5000)]
+        stats = monitor.RunningStats()
+        for value in values[:2500] + [math.nan] + values[2500:]:
+            stats.update(value)
+
+        # NaN placeholders are skipped
+        self.assertEqual(stats.count, len(values))
+        self.assertEqual(stats.min, min(values))
+        self.assertEqual(stats.max, max(values))
+        self.assertAlmostEqual(stats.mean, statistics.fmean(values))
+        self.assertAlmostEqual(stats.stddev, statistics.stdev(values))
+        for q in monitor.StatisticsSettings.REPORT_PERCENTILES:
+            exact = self.exact(values, q)
+            self.assertLessEqual(abs(stats.percentile(q) - exact), 0.01 * exact)
+        self.assertTrue(math.isnan(monitor.RunningStats().percentile(50)))
+
+    def test_running_stats_percentiles_are_clamped(self):
+        # the sketch bucket of a single value may lie above or below it
+        stats = monitor.RunningStats()
+        stats.update(130.6)
+        for q in [0, 50, 99, 100]:
+            self.assertEqual(stats.percentile(q), 130.6)
+
+    def test_summary_energy_and_active_share(self):
+        summary = monitor.SampleSummary()
+        for tick in synthetic_ticks(1, 100, seed=5, interval=0.5):
+            summary.update(tick[0])
+
+        ring = monitor.SampleRing(100)
+        for tick in synthetic_ticks(1, 100, seed=5, interval=0.5):
+            ring.append(tick[0])
+        power = list(ring.column("current_socket_power"))
+        gfx = list(ring.column("gfx_activity"))
+        self.assertEqual(summary.count, 100)
+        self.assertAlmostEqual(summary.elapsed, 49.5)
+        self.assertAlmostEqual(
+            summary.energy,
+            sum((a + b) / 2 * 0.5 for a, b in zip(power, power[1:])),
+        )
+        active = sum(1 for value in gfx[:-1] if value > 0)
+        self.assertAlmostEqual(summary.active_share, active * 0.5 / 49.5 * 100)
+        self.assertLessEqual(summary.active_share, 100)
+
+
+class TestFixedRateScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        clock = patch.object(monitor.time, "monotonic", lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_missed_deadlines_are_skipped(self):
+        scheduler = monitor.FixedRateScheduler(1.0, 10)
+        self.assertEqual(scheduler.next_delay(), 1.0)
+        # the first tick overran the deadline at 102, which is dropped
+        self.now = 103.75
+        self.assertEqual(scheduler.next_delay(), -0.75)
+        self.assertEqual(scheduler.missed, 1)
+        self.assertEqual(scheduler.max_lateness, 0.75)
+        self.now = 103.875
+        self.assertEqual(scheduler.next_delay(), 0.125)
+        self.assertEqual(scheduler.missed, 1)
+        # the last deadline is 10s after the start
+        self.now = 109.5
+        self.assertEqual(scheduler.next_delay(), -0.5)
+        self.assertEqual(scheduler.missed, 5)
+        self.assertEqual(scheduler.next_delay(), 0.5)
+        self.assertIsNone(scheduler.next_delay())
+
+    def test_set_interval(self):
+        scheduler = monitor.FixedRateScheduler(1.0, 0)
+        scheduler.next_delay()
+        self.now = 101.0
+        scheduler.next_delay()
+        # deadlines restart from the last one, at 102
+        scheduler.set_interval(0.25)
+        self.now = 101.125
+        self.assertEqual(scheduler.next_delay(), 1.125)
+        self.assertEqual(scheduler.next_delay(), 1.375)
+        # setting the same interval keeps the deadlines
+        scheduler.set_interval(0.25)
+        self.assertEqual(scheduler.next_delay(), 1.625)
+        self.assertEqual(scheduler.missed, 0)
+        # a duration of 0 never ends
+        self.now = 100000.0
+        self.assertIsNotNone(scheduler.next_delay())
+
+
+class TestPrometheusExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = monitor.PrometheusExporter("127.0.0.1", 0)
+        self.exporter.start()
+        self.addCleanup(self.exporter.stop)
+        self.url = "http://127.0.0.1:%d" % self.exporter.server.server_port
+
+    def scrape(self, path="/metrics"):
+        with urllib.request.urlopen(self.url + path, timeout=5) as response:
+            self.assertEqual(
+                response.headers["Content-Type"],
+                monitor.PrometheusExporter.CONTENT_TYPE,
+            )
+            return response.read().decode("utf-8")
+
+    def test_scrapes_return_the_published_snapshot(self):
+        self.assertEqual(self.scrape(), "")
+        ticks = synthetic_ticks(2, 2)
+        scheduler = monitor.FixedRateScheduler(1.0, 0)
+        scheduler.missed = 3
+        render = patch.object(
+            monitor,
+            "render_prometheus_metrics",
+            wraps=monitor.render_prometheus_metrics,
+        )
+        with render as rendered:
+            self.exporter.publish(ticks[0], scheduler)
+            # device 0 misses the second tick and keeps its last sample
+            self.exporter.publish({1: ticks[1][1]}, scheduler)
+            text = self.scrape()
+            self.assertEqual(self.scrape("/metrics?x=1"), text)
+        # scrapes are served from the snapshot, never rendered on demand
+        self.assertEqual(rendered.call_count, 2)
+
+        lines = text.splitlines()
+        self.assertIn("# TYPE amd_gpu_socket_power_watts gauge", lines)
+        self.assertIn("# TYPE amd_gpu_coarse_grain_gfx_activity_total counter", lines)
+        for device, tick in ((0, ticks[0]), (1, ticks[1])):
+            power = tick[device]["power_measure"]["current_socket_power"]
+            self.assertIn(
+                f'amd_gpu_socket_power_watts{{device="{device}"}} {power}', lines
+            )
+            self.assertIn(
+                f'amd_gpu_last_sample_timestamp_seconds{{device="{device}"}} '
+                f'{tick[device]["timestamp"]}',
+                lines,
+            )
+        self.assertEqual(lines[-1], "amd_gpu_monitor_missed_deadlines_total 3")
+
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            self.scrape("/other")
+        self.assertEqual(error.exception.code, 404)
+
+
+class TestBackends(unittest.TestCase):
+
+    def test_incomplete_backend_cannot_be_created(self):
+        class NoAsicInfo(monitor.GpuBackend):
+            def get_processor_handles(self):
+                return [0]
+
+            def get_power_info(self, device):
+                return {"current_socket_power": 100.0}
+
+            def get_gpu_activity(self, device):
+                return {"gfx_activity": 0.0, "umc_activity": 0.0}
+
+            def get_utilization_count(self, device, counters):
+                return []
+
+        with self.assertRaises(TypeError):
+            NoAsicInfo()
+        # the record backends only lack the device list, which they each add
+        with self.assertRaises(TypeError):
+            monitor.RecordBackend()
+        monitor.SyntheticBackend(1)
+        monitor.ReplayBackend("unused")
+
+    def test_hung_device_is_skipped_until_it_answers(self):
+        answer = threading.Event()
+
+        class HangingBackend(monitor.SyntheticBackend):
+            def get_power_info(self, device):
+                if device == 1:
+                    answer.wait()
+                return super().get_power_info(device)
+
+        backend = HangingBackend(3)
+        devices = {index: index for index in backend.get_processor_handles()}
+        collector = monitor.ConcurrentCollector(backend, devices, 6, timeout=0.05)
+        self.addCleanup(collector.close)
+        self.addCleanup(answer.set)
+
+        output = io.StringIO()
+        with patch("sys.stdout", output):
+            # the hung call times out, the other devices are sampled as usual
+            self.assertEqual(sorted(collector.collect()), [0, 2])
+            self.assertIn("GPU 1 data: timed out", output.getvalue())
+            # while the call is still hung the device is not queried again
+            self.assertEqual(sorted(collector.collect()), [0, 2])
+            self.assertEqual(sorted(collector.collect()), [0, 2])
+            self.assertEqual(collector.timeouts, {0: 0, 1: 1, 2: 0})
+            self.assertEqual(collector.skipped, {0: 0, 1: 2, 2: 0})
+
+            answer.set()
+            for future in collector.hung[1]:
+                future.exception(timeout=5)
+            samples = collector.collect()
+        self.assertEqual(sorted(samples), [0, 1, 2])
+        self.assertEqual(
+            samples[1]["power_measure"]["current_socket_power"],
+            backend.current[1]["current_socket_power"],
+        )
+        self.assertNotIn(1, collector.hung)
+        self.assertEqual(collector.timeouts[1], 1)
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.ticks = synthetic_ticks(2, 20, seed=1, interval=0.25)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "run.cap")
+        asic_info = {
+            index: monitor.placeholder_asic_info(f"Test GPU {index}")
+            for index in (0, 1)
+        }
+        writer = monitor.CaptureWriter(self.path, asic_info, {"interval": 0.25})
+        for tick in self.ticks:
+            writer.write_tick(tick)
+        writer.close()
+
+    def assert_record(self, record, device, data):
+        expected = monitor.flatten_sample(device, data)
+        self.assertEqual(set(record), set(expected))
+        for field, value in expected.items():
+            if isinstance(value, float) and math.isnan(value):
+                self.assertTrue(math.isnan(record[field]), field)
+            else:
+                # power, activity, latency and interval are stored as float32
+                self.assertAlmostEqual(record[field], value, places=4, msg=field)
+
+    def test_write_read_round_trip(self):
+        self.assertTrue(monitor.is_binary_capture(self.path))
+        with monitor.CaptureReader(self.path) as reader:
+            self.assertEqual(len(reader), 40)
+            self.assertEqual(reader.header["interval"], 0.25)
+            self.assertEqual(reader.asic_info(1)["market_name"], "Test GPU 1")
+            self.assertIsNone(reader.asic_info(2))
+            records = list(reader.records())
+            for position, record in enumerate(records):
+                tick, device = divmod(position, 2)
+                self.assert_record(record, device, self.ticks[tick][device])
+            self.assertEqual(list(reader.records(10, 12)), records[10:12])
+
+    def test_partial_record_is_ignored(self):
+        with open(self.path, "ab") as capture:
+            capture.write(b"\0" * (monitor.CAPTURE_RECORD.size - 1))
+        with monitor.CaptureReader(self.path) as reader:
+            self.assertEqual(len(reader), 40)
+            self.assertEqual(len(list(reader.records())), 40)
+
+    def test_not_a_capture(self):
+        with open(self.path, "r+b") as capture:
+            capture.write(b"NOTACAP!")
+        self.assertFalse(monitor.is_binary_capture(self.path))
+        with self.assertRaises(ValueError):
+            monitor.CaptureReader(self.path)
+        with open(self.path, "wb") as capture:
+            capture.write(b"AMD")
+        with self.assertRaises(struct.error):
+            monitor.CaptureReader(self.path)
+
+    def test_replay(self):
+        backend = monitor.ReplayBackend(self.path)
+        backend.init()
+        try:
+            devices = backend.get_processor_handles()
+            self.assertEqual(devices, [0, 1])
+            self.assertEqual(backend.get_gpu_asic_info(0)["market_name"], "Test GPU 0")
+            for tick in self.ticks:
+                backend.begin_tick()
+                for device in devices:
+                    data = monitor.collect_gpu_data(backend, device)
+                    self.assertEqual(data["timestamp"], tick[device]["timestamp"])
+                    record = monitor.flatten_sample(device, data)
+                    # replay does not keep the recorded latency or interval
+                    record["collection_latency"] = tick[device]["collection_latency"]
+                    record["sample_interval"] = tick[device]["sample_interval"]
+                    self.assert_record(record, device, tick[device])
+            with self.assertRaises(monitor.CaptureExhausted):
+                backend.begin_tick()
+        finally:
+            backend.shut_down()
+
+    def test_analysis(self):
+        analysis = monitor.CaptureAnalysis(self.path, 8)
+        analysis.run()
+        self.assertEqual(analysis.interval, 0.25)
+        self.assertEqual(analysis.asic_info[1]["market_name"], "Test GPU 1")
+        for device in (0, 1):
+            samples = [tick[device] for tick in self.ticks]
+            power = [data["power_measure"]["current_socket_power"] for data in samples]
+            summary = analysis.summaries[device]
+            self.assertEqual(summary.count, 20)
+            self.assertEqual(summary.elapsed, 19 * 0.25)
+            stats = summary.stats["current_socket_power"]
+            self.assertAlmostEqual(stats.mean, statistics.mean(power), places=3)
+            self.assertAlmostEqual(stats.max, max(power), places=3)
+            # the history is bounded, the summary covers the whole capture
+            self.assertEqual(len(analysis.series[device]), 8)
+            self.assertEqual(analysis.series[device].total, 20)
+            self.assertEqual(
+                analysis.initial_data[device]["timestamp"], samples[0]["timestamp"]
+            )
+
+            detector = monitor.ActivityDetector(power[0])
+            for data in samples:
+                detector.update_sample(data)
+            detector.finish()
+            self.assertEqual(
+                list(analysis.detectors[device].intervals), list(detector.intervals)
+            )
+
+        # a stream capture of the same samples gives the same analysis
+        path = os.path.join(os.path.dirname(self.path), "run.ndjson")
+        with open(path, "w", encoding="utf-8") as stream:
+            writer = monitor.SampleStreamWriter(stream, "ndjson")
+            for tick in self.ticks:
+                writer.write_tick(tick)
+        streamed = monitor.CaptureAnalysis(path, 8)
+        streamed.run()
+        self.assertIsNone(streamed.interval)
+        self.assertEqual(streamed.device_interval(0), 0.25)
+        for device in (0, 1):
+            self.assertEqual(streamed.summaries[device].count, 20)
+            self.assertAlmostEqual(
+                streamed.summaries[device].energy,
+                analysis.summaries[device].energy,
+                places=2,
+            )
+
+    def test_compare(self):
+        # the second capture has device 0 only, drawing half as much power
+        after = os.path.join(os.path.dirname(self.path), "after.cap")
+        writer = monitor.CaptureWriter(after, {}, {"interval": 0.25})
+        for tick in self.ticks:
+            data = dict(tick[0])
+            power = data["power_measure"]["current_socket_power"]
+            data["power_measure"] = {"current_socket_power": power / 2}
+            writer.write_tick({0: data})
+        writer.close()
+
+        report = os.path.join(os.path.dirname(self.path), "report.json")
+        argv = ["analyze", "--compare", self.path, after, "--report-data", report]
+        output = io.StringIO()
+        with patch.object(sys, "argv", [SCRIPT, *argv]), patch.object(
+            sys, "stdout", output
+        ):
+            self.assertEqual(monitor.main(), 0)
+        with open(report, encoding="utf-8") as stream:
+            tables = json.load(stream)["tables"]
+
+        comparisons = [t for t in tables if t["title"].startswith("Comparison")]
+        self.assertEqual(len(comparisons), 1)
+        self.assertEqual(
+            comparisons[0]["title"], f"Comparison GPU 0: {self.path} -> {after}"
+        )
+        rows = {(row[0], row[1]): row[2:] for row in comparisons[0]["rows"]}
+        self.assertEqual(rows[("Power Usage (W)", "mean")][3], "-50.0%")
+        self.assertEqual(rows[("Power Usage (W)", "max")][3], "-50.0%")
+        self.assertEqual(rows[("Energy (J)", "total")][3], "-50.0%")
+        self.assertEqual(rows[("Samples", "total")], ["20", "20", "0", "0.0%"])
+        # the activity is unchanged
+        self.assertEqual(rows[("GPU Activity (%)", "mean")][3], "0.0%")
+
+        with patch.object(
+            sys, "argv", [SCRIPT, "analyze", "--compare", self.path]
+        ), patch.object(sys, "stdout", io.StringIO()):
+            self.assertEqual(monitor.main(), monitor.ExitCodes.INVALID_ARGS)
+
+    def test_report_of_an_unreported_counter(self):
+        # a device that never reports one of its utilization counters
+        counter = monitor.UTILIZATION_COUNTERS[0]
+        ticks = synthetic_ticks(1, 5, seed=4)
+        for tick in ticks:
+            tick[0]["utilization"][counter] = math.nan
+        path = os.path.join(os.path.dirname(self.path), "null.cap")
+        writer = monitor.CaptureWriter(path, {}, {"interval": 1.0})
+        for tick in ticks:
+            writer.write_tick(tick)
+        writer.close()
+
+        interval = str(monitor.SamplingSettings.MIN_INTERVAL)
+        for argv in (["analyze", path], [interval, "0", "--replay", path]):
+            output = io.StringIO()
+            with patch.object(sys, "argv", [SCRIPT, *argv]), patch.object(
+                sys, "stdout", output
+            ), patch.object(sys, "stderr", io.StringIO()):
+                self.assertEqual(monitor.main(), 0, argv)
+            lines = output.getvalue().splitlines()
+            row = [line for line in lines if line.startswith("Coarse GFX Activity")]
+            self.assertEqual(row[0].split()[3:], ["N/A"] * 4, argv)
+
+    def test_replay_keeps_a_bounded_history(self):
+        capacities = []
+        ring = monitor.SampleRing
+
+        def sample_ring(capacity):
+            capacities.append(capacity)
+            return ring(capacity)
+
+        interval = str(monitor.SamplingSettings.MIN_INTERVAL)
+        argv = [SCRIPT, interval, "86400", "--replay", self.path, "--devices", "all"]
+        output = io.StringIO()
+        with patch.object(sys, "argv", argv + ["--history", "8"]), patch.object(
+            monitor, "SampleRing", sample_ring
+        ), patch.object(sys, "stdout", output), patch.object(
+            sys, "stderr", io.StringIO()
+        ):
+            self.assertEqual(monitor.main(), 0)
+
+        # the store does not grow with the duration, the summary still
+        # covers every sample
+        self.assertEqual(capacities, [8, 8])
+        self.assertEqual(output.getvalue().count("Total Samples: 20"), 2)
+
+
+class TestEnergyAttribution(unittest.TestCase):
+
+    @staticmethod
+    def request(request_id, start, end, tokens=None):
+        return monitor.RequestWindow(request_id, start, end, tokens)
+
+    def test_overlapping_requests_share_energy(self):
+        # 100W for 10s, a and b overlap from 3s to 5s
+        timeline = [(float(t), 100.0, 50.0, 20.0) for t in range(11)]
+        a = self.request("a", 1.0, 5.0, tokens=600)
+        b = self.request("b", 3.0, 7.0)
+        attributor = monitor.EnergyAttributor([a, b])
+        attributor.run(iter(timeline))
+
+        self.assertAlmostEqual(attributor.total_energy, 1000.0)
+        self.assertAlmostEqual(a.window_energy, 400.0)
+        self.assertAlmostEqual(b.window_energy, 400.0)
+        self.assertAlmostEqual(a.attributed_energy, 300.0)
+        self.assertAlmostEqual(b.attributed_energy, 300.0)
+        self.assertAlmostEqual(attributor.idle_energy, 400.0)
+        self.assertAlmostEqual(
+            a.attributed_energy + b.attributed_energy + attributor.idle_energy,
+            attributor.total_energy,
+        )
+        self.assertAlmostEqual(a.covered, 4.0)
+        self.assertAlmostEqual(a.gfx_time, 200.0)
+        self.assertAlmostEqual(a.tokens_per_joule, 2.0)
+        self.assertTrue(math.isnan(b.tokens_per_joule))
+        self.assertEqual(
+            (attributor.first_timestamp, attributor.last_timestamp), (0.0, 10.0)
+        )
+
+    def test_requests_inside_a_segment(self):
+        # power rises linearly from 0W to 100W between two samples 10s apart
+        timeline = [(0.0, 0.0, 0.0, 0.0), (10.0, 100.0, 0.0, 0.0)]
+        a = self.request("a", 2.0, 4.0)
+        b = self.request("b", 3.0, 4.0)
+        c = self.request("c", 12.0, 13.0)  # after the last sample
+        attributor = monitor.EnergyAttributor([a, b, c])
+        attributor.run(iter(timeline))
+
+        # integral of 10t from 2 to 4 and from 3 to 4
+        self.assertAlmostEqual(a.window_energy, 60.0)
+        self.assertAlmostEqual(b.window_energy, 35.0)
+        self.assertAlmostEqual(a.attributed_energy, 25.0 + 35.0 / 2)
+        self.assertAlmostEqual(b.attributed_energy, 35.0 / 2)
+        self.assertEqual(c.covered, 0.0)
+        self.assertAlmostEqual(attributor.total_energy, 500.0)
+        self.assertAlmostEqual(attributor.idle_energy, 500.0 - 60.0)
+
+    def test_requests_from_log_and_capture(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        log = os.path.join(directory.name, "requests.csv")
+        with open(log, "w", encoding="utf-8") as stream:
+            stream.write("id,start,end,output_tokens\n")
+            stream.write("late,1970-01-01T00:16:45,1970-01-01T00:16:47Z,\n")
+            stream.write("early,1001.5,1003,10\n")
+        requests = monitor.read_request_log(log)
+        self.assertEqual([r.request_id for r in requests], ["early", "late"])
+        self.assertEqual((requests[1].start, requests[1].end), (1005.0, 1007.0))
+        self.assertIsNone(requests[1].tokens)
+
+        ticks = synthetic_ticks(2, 10, seed=2)
+        capture = os.path.join(directory.name, "run.cap")
+        writer = monitor.CaptureWriter(capture, {}, {})
+        for tick in ticks:
+            writer.write_tick(tick)
+        writer.close()
+
+        attributor = monitor.EnergyAttributor(requests)
+        attributor.run(monitor.capture_timeline([capture], None))
+        power = [
+            sum(data["power_measure"]["current_socket_power"] for data in t.values())
+            for t in ticks
+        ]
+        total = sum((p0 + p1) / 2 for p0, p1 in zip(power, power[1:]))
+        self.assertAlmostEqual(attributor.total_energy, total, places=2)
+        self.assertAlmostEqual(
+            sum(r.attributed_energy for r in requests) + attributor.idle_energy,
+            attributor.total_energy,
+        )
+        # both requests lie within the capture
+        self.assertEqual([r.covered for r in requests], [1.5, 2.0])
+
+    def test_gaps_are_not_integrated(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        captures = []
+        # two captures of 100W for 10s an hour apart, the monitor of the
+        # second one was restarted after 5s and left a 21s hole
+        for start, hole in ((0.0, 0.0), (3600.0, 20.0)):
+            ticks = synthetic_ticks(1, 11)
+            for number, tick in enumerate(ticks):
+                data = tick[0]
+                data["timestamp"] = start + number + (hole if number > 5 else 0.0)
+                data["power_measure"]["current_socket_power"] = 100.0
+            captures.append(os.path.join(directory.name, f"run{len(captures)}.cap"))
+            writer = monitor.CaptureWriter(captures[-1], {}, {"interval": 1.0})
+            for tick in ticks:
+                writer.write_tick(tick)
+            writer.close()
+
+        a = self.request("a", 5.0, 3605.0)
+        attributor = monitor.EnergyAttributor([a])
+        attributor.run(monitor.capture_timeline(captures, None))
+
+        # 10s measured in the first capture, 5s and 4s in the second
+        self.assertAlmostEqual(attributor.total_energy, 1900.0)
+        self.assertEqual(attributor.gaps, 2)
+        self.assertAlmostEqual(attributor.unmeasured_time, 3590.0 + 21.0)
+        self.assertAlmostEqual(a.covered, 5.0 + 5.0)
+        self.assertAlmostEqual(a.attributed_energy, 1000.0)
+        self.assertAlmostEqual(attributor.idle_energy, 900.0)
+        self.assertEqual(
+            (attributor.first_timestamp, attributor.last_timestamp), (0.0, 3630.0)
+        )
+
+
+class TestSampleStream(unittest.TestCase):
+
+    def test_ndjson_is_strict_json(self):
+        ticks = synthetic_ticks(2, 3)
+        # a device that did not report one of its counters
+        ticks[1][1]["utilization"][monitor.UTILIZATION_COUNTERS[0]] = math.nan
+        stream = io.StringIO()
+        writer = monitor.SampleStreamWriter(stream, "ndjson")
+        for tick in ticks:
+            writer.write_tick(tick)
+
+        def reject(constant):
+            raise ValueError(f"{constant} is not JSON")
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        records = [json.loads(line, parse_constant=reject) for line in lines]
+        self.assertIsNone(records[0]["sample_interval"])
+        self.assertEqual(records[2]["sample_interval"], 1.0)
+        field = monitor.UTILIZATION_FIELDS[monitor.UTILIZATION_COUNTERS[0]]
+        self.assertIsNone(records[3][field])
+
+        # reading the stream back turns null into the NaN placeholder again
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "run.ndjson")
+        with open(path, "w", encoding="utf-8") as output:
+            output.write(stream.getvalue())
+        records = list(monitor.read_stream_records(path))
+        self.assertTrue(math.isnan(records[0]["sample_interval"]))
+        self.assertTrue(math.isnan(records[3][field]))
+        self.assertEqual(
+            records[3]["current_socket_power"],
+            ticks[1][1]["power_measure"]["current_socket_power"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()